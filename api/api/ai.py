@@ -1,13 +1,121 @@
-from flask import Blueprint, jsonify, request, current_app
+from flask import Blueprint, Response, jsonify, request, current_app, stream_with_context
+from concurrent.futures import ThreadPoolExecutor
+from .batching import estimate_tokens, pack, parse_json_object
+from .gateway import GatewayError
+from .queries import books_by_ids, execute
+from .recommendations import describe_book, normalize_profile, parse_score, profile_key, scoring_messages
+from .summaries import prompt_hash
+import json
 
 api_ai = Blueprint('api_ai', __name__)
 
+MODEL = 'llama3-8b-8192'
+MAX_TOKENS = 1024
+# batch endpoints limits, the context window is shared by the prompt and the answers of every packed book
+MAX_BATCH_SIZE = 100
+MAX_BATCH_PROMPTS = 4
+CONTEXT_WINDOW = 8192
+SUMMARY_TOKENS = 256
+RECOMMENDATION_TOKENS = 96
+# books scored per /recommendation/rank call when the profile has never been ranked before
+RANK_SCORING_LIMIT = 200
+
+def summary_messages(title: str, author: str) -> list:
+    return [
+        { 
+            'role': 'user', 
+            'content': 'Write a brief summary for book \'{}\' from {}'.format(title, author)
+        }
+    ]
+
+def recommendation_messages(features: dict, title: str, author: str, genre: str) -> list:
+    return [
+        { 
+            'role': 'system', 
+            'content': 'Hello helpful assistant! You will give me future recommendations based on my personal features \'{}\''.format(
+                features
+            )
+        },
+        { 
+            'role': 'user', 
+            'content': 'Tell me how much the book {} from {} of genre {} aligns with me in percentage and briefly explain why in prose. Do not provide additional recommendations and do not ask additional questions.'.format(
+                title,
+                author,
+                genre
+            )
+        }
+    ]
+
+def parse_features(source) -> dict:
+    features = {}
+
+    for name in [ 'description', 'mood', 'goal' ]:
+        value = source.get(name)
+
+        if isinstance(value, str) and len(value.strip()) > 0:
+            features[name] = value.strip()
+
+    age = source.get('age')
+
+    if isinstance(age, str) and age.strip().isdigit():
+        age = int(age.strip())
+
+    if isinstance(age, int) and not isinstance(age, bool) and 0 < age < 150:
+        features['age'] = age
+
+    return features
+
+def event(name: str, data: dict) -> str:
+    return 'event: {}\ndata: {}\n\n'.format(name, json.dumps(data))
+
+def stream(model: str, messages: list, max_tokens: int, on_complete = None, cached: str | None = None) -> Response:
+    # relays the completion as server-sent events, one 'token' event per chunk and a final 'done' event
+    def generate():
+        if cached is not None:
+            yield event('token', { 'content': cached })
+            yield event('done', {})
+            return
+
+        upstream = None
+        pieces = []
+        completed = False
+
+        try:
+            upstream = current_app.config['ai'].stream(model, messages, max_tokens)
+
+            for chunk in upstream:
+                content = chunk.choices[0].delta.content
+
+                if content:
+                    pieces.append(content)
+                    yield event('token', { 'content': content })
+
+            completed = True
+        except Exception:
+            yield event('error', { 'error': 'Unable to complete the generation' })
+            return
+        finally:
+            # the client went away or the upstream failed, stop consuming tokens we would discard
+            if not completed and upstream is not None:
+                upstream.close()
+
+        if on_complete is not None:
+            on_complete(''.join(pieces))
+
+        yield event('done', {})
+
+    return Response(
+        stream_with_context(generate()), 
+        mimetype = 'text/event-stream', 
+        headers = { 'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no' }
+    )
+
 @api_ai.route('/summary/<int:id>', methods = [ 'GET' ])
 def summary(id: int):
-    cursor = current_app.config['db'].connection.cursor()
+    cursor = current_app.config['db'].reader.cursor()
 
     try:
-        cursor.execute('SELECT * FROM books WHERE id={};'.format(id))
+        execute(cursor, 'book_by_id', (id,))
     except:
         cursor.close() 
         return jsonify({ 'error': 'Unable to search the book inside the database' }), 500
@@ -18,48 +126,102 @@ def summary(id: int):
         cursor.close()
         return jsonify({ 'error': 'Unable to find the book within the database' }), 400
     
+    _, title, author, _, _, _, _ = entry
+
+    model = MODEL
+    messages = summary_messages(title, author)
+    max_tokens = MAX_TOKENS
+
+    cache = current_app.config['summaries']
+    key = prompt_hash(model, messages, max_tokens)
+
+    try:
+        content = cache.get(cursor, id, key)
+    except:
+        # an unavailable persistent tier only costs a completion
+        content = None
+
     cursor.close()
+    # neither the completion nor the stream holds a pooled connection, the answer is stored with a new one
+    current_app.config['db'].release()
 
-    _, title, author, _, _, _, _ = entry
+    if request.args.get('stream', 0, type = int) == 1:
+        def store(content: str):
+            try:
+                with current_app.config['db'].cursor() as cursor:
+                    cache.put(cursor, id, key, model, content)
+            except:
+                pass
 
-    completion = current_app.config['ai'].chat.completions.create(
-        model = 'llama3-8b-8192',
-        messages = [
-            { 
-                'role': 'user', 
-                'content': 'Write a brief summary for book \'{}\' from {}'.format(title, author)
-            }
-        ],
-        max_tokens = 1024
-    )
+            current_app.config['db'].release()
+
+        return stream(model, messages, max_tokens, on_complete = store, cached = content)
+
+    if content is not None:
+        return jsonify({ 'summary': content })
+
+    content = current_app.config['ai'].complete(model, messages, max_tokens)
+
+    try:
+        with current_app.config['db'].cursor() as cursor:
+            cache.put(cursor, id, key, model, content)
+    except:
+        pass
 
     return jsonify({
-        'summary': completion.choices[0].message.content
+        'summary': content
     })
 
-@api_ai.route('/recommendation/<int:id>', methods = [ 'GET' ])
-def recommendation(id: int):
-    description = request.args.get('description')
-    mood = request.args.get('mood')
-    goal = request.args.get('goal')
-    age = request.args.get('age')
+def format_recommendation(score: int, rationale: str) -> dict:
+    return {
+        'recommendation': '{}% - {}'.format(score, rationale),
+        'score': score,
+        'rationale': rationale
+    }
 
-    features = {}
+def score_books(features: dict, books: list[tuple]) -> tuple[dict, dict]:
+    # scores are cached per (profile, book), only the missing ones are asked to the model; they are read and
+    # stored on the primary, a ranking must see the ones just written, and no connection is held meanwhile
+    profile = normalize_profile(features)
+    key = profile_key(profile)
+    store = current_app.config['recommendations']
+    db = current_app.config['db']
 
-    if description is not None and len(description.strip()) > 0:
-        features['description'] = description.strip()
+    try:
+        with db.cursor() as cursor:
+            scores = store.get_many(cursor, key, [ book[0] for book in books ])
+    except:
+        scores = {}
 
-    if mood is not None and len(mood.strip()) > 0:
-        features['mood'] = mood.strip()
+    db.release()
 
-    if goal is not None and len(goal.strip()) > 0:
-        features['goal'] = goal.strip()
+    missing = { book[0]: book for book in books if book[0] not in scores }
+    generated, errors = complete_batch(
+        lambda group: scoring_messages(profile, [ missing[id] for id in group ]),
+        list(missing),
+        RECOMMENDATION_TOKENS,
+        lambda id: describe_book(missing[id]),
+        accept = parse_score
+    )
+    scores.update(generated)
 
+    try:
+        with db.cursor() as cursor:
+            store.put_many(cursor, key, generated)
+    except:
+        pass
+
+    db.release()
 
-    cursor = current_app.config['db'].connection.cursor()
+    return scores, errors
+
+@api_ai.route('/recommendation/<int:id>', methods = [ 'GET' ])
+def recommendation(id: int):
+    features = parse_features(request.args)
+    cursor = current_app.config['db'].reader.cursor()
 
     try:
-        cursor.execute('SELECT * FROM books WHERE id={};'.format(id))
+        execute(cursor, 'book_by_id', (id,))
     except:
         cursor.close() 
         return jsonify({ 'error': 'Unable to search the book inside the database' }), 500
@@ -69,32 +231,220 @@ def recommendation(id: int):
     if entry is None or len(entry) < 1:
         cursor.close()
         return jsonify({ 'error': 'Unable to find the book within the database' }), 400
-    
-    cursor.close()
 
     _, title, author, _, _, _, genre = entry
+    cursor.close()
+
+    # streaming relays the prose answer as it is generated, it cannot be scored nor cached
+    if request.args.get('stream', 0, type = int) == 1:
+        current_app.config['db'].release()
+        return stream(MODEL, recommendation_messages(features, title, author, genre), MAX_TOKENS)
+
+    scores, errors = score_books(features, [ (id, title, author, genre) ])
+
+    if id not in scores:
+        return jsonify({ 'error': errors.get(id, 'Unable to compute the recommendation') }), 503
+
+    return jsonify(format_recommendation(*scores[id]))
+
+@api_ai.route('/recommendation/rank', methods = [ 'GET' ])
+def recommendation_rank():
+    features = parse_features(request.args)
+    count = request.args.get('count', 10, type = int)
+
+    if count < 1 or count > MAX_BATCH_SIZE:
+        return jsonify({ 'error': 'The count field must be in range 1...{}'.format(MAX_BATCH_SIZE) }), 400
 
-    completion = current_app.config['ai'].chat.completions.create(
-        model = 'llama3-8b-8192',
-        messages = [
-            { 
-                'role': 'system', 
-                'content': 'Hello helpful assistant! You will give me future recommendations based on my personal features \'{}\''.format(
-                    features
-                )
-            },
-            { 
-                'role': 'user', 
-                'content': 'Tell me how much the book {} from {} of genre {} aligns with me in percentage and briefly explain why in prose. Do not provide additional recommendations and do not ask additional questions.'.format(
-                    title,
-                    author,
-                    genre
-                )
-            }
+    key = profile_key(normalize_profile(features))
+    store = current_app.config['recommendations']
+    db = current_app.config['db']
+
+    try:
+        with db.cursor() as cursor:
+            books = store.unscored(cursor, key, RANK_SCORING_LIMIT)
+    except:
+        return jsonify({ 'error': 'Unable to search the books inside the database' }), 500
+
+    _, errors = score_books(features, books)
+
+    try:
+        with db.cursor() as cursor:
+            entries = store.top(cursor, key, count)
+    except:
+        return jsonify({ 'error': 'Unable to rank the books inside the database' }), 500
+
+    return jsonify(format_ranking(entries, books, errors)), 200
+
+def format_ranking(entries: list[tuple], books: list[tuple], errors: dict) -> dict:
+    return {
+        'books': [
+            dict(
+                zip([ 'id', 'title', 'author', 'publication_year', 'price', 'currency', 'genre' ], entry[:7]),
+                **format_recommendation(entry[7], entry[8])
+            )
+            for entry in entries
         ],
-        max_tokens = 1024
+        # a partial ranking is returned when part of the catalog is still unscored for this profile
+        'complete': len(books) < RANK_SCORING_LIMIT and len(errors) == 0,
+        'errors': { str(id): error for id, error in errors.items() }
+    }
+
+def parse_ids(value) -> list[int] | None:
+    if not isinstance(value, list) or len(value) < 1 or len(value) > MAX_BATCH_SIZE:
+        return None
+
+    if not all(isinstance(id, int) and not isinstance(id, bool) for id in value):
+        return None
+
+    # duplicates are answered once, in the order of first appearance
+    return list(dict.fromkeys(value))
+
+def accept_text(value) -> str | None:
+    return value.strip() if isinstance(value, str) and len(value.strip()) > 0 else None
+
+def batch_groups(messages, ids: list[int], answer_tokens: int, describe) -> list[list[int]]:
+    # packs the books into as few prompts as the context window allows, each answering with a JSON object keyed by book id
+    overhead = sum(estimate_tokens(message['content']) for message in messages([]))
+
+    return pack(
+        ids,
+        cost = lambda id: estimate_tokens(describe(id)) + answer_tokens,
+        budget = CONTEXT_WINDOW,
+        overhead = overhead
     )
 
+def read_batch(group: list[int], answer: str | None, accept = accept_text) -> tuple[dict, dict]:
+    # a missing answer means the gateway gave up on the prompt
+    if answer is None:
+        return {}, { id: 'The assistant is temporarily unavailable' for id in group }
+
+    try:
+        answer = parse_json_object(answer)
+    except ValueError:
+        return {}, { id: 'Unable to understand the answer of the assistant' for id in group }
+
+    results = {}
+    errors = {}
+
+    for id in group:
+        content = accept(answer.get(str(id)))
+
+        if content is not None:
+            results[id] = content
+        else:
+            errors[id] = 'The assistant did not answer for this book'
+
+    return results, errors
+
+def complete_batch(messages, ids: list[int], answer_tokens: int, describe, accept = accept_text) -> tuple[dict, dict]:
+    if len(ids) < 1:
+        return {}, {}
+
+    gateway = current_app.config['ai']
+    groups = batch_groups(messages, ids, answer_tokens, describe)
+
+    def run(group: list[int]) -> tuple[dict, dict]:
+        try:
+            answer = gateway.complete(MODEL, messages(group), answer_tokens * len(group))
+        except GatewayError:
+            answer = None
+
+        return read_batch(group, answer, accept)
+
+    results = {}
+    errors = {}
+
+    with ThreadPoolExecutor(max_workers = min(MAX_BATCH_PROMPTS, len(groups))) as executor:
+        for partial_results, partial_errors in executor.map(run, groups):
+            results.update(partial_results)
+            errors.update(partial_errors)
+
+    return results, errors
+
+def summary_batch_prompts(books: dict) -> tuple:
+    describe = lambda id: '{}: \'{}\' from {}'.format(id, books[id][1], books[id][2])
+    messages = lambda group: [
+        {
+            'role': 'user',
+            'content': 'Write a brief summary for each of the following books. Answer only with a JSON object mapping each book number to its summary.\n{}'.format(
+                '\n'.join(describe(id) for id in group)
+            )
+        }
+    ]
+
+    return messages, describe
+
+@api_ai.route('/summary/batch', methods = [ 'POST' ])
+def summary_batch():
+    payload = request.get_json(silent = True) or {}
+    ids = parse_ids(payload.get('ids'))
+
+    if ids is None:
+        return jsonify({ 'error': 'The ids field must be a list of 1...{} book ids'.format(MAX_BATCH_SIZE) }), 400
+
+    cursor = current_app.config['db'].reader.cursor()
+
+    try:
+        books = books_by_ids(cursor, ids)
+    except:
+        cursor.close()
+        return jsonify({ 'error': 'Unable to search the books inside the database' }), 500
+
+    errors = { id: 'Unable to find the book within the database' for id in ids if id not in books }
+    # batch answers are cached under the same key as a single summary, so both endpoints share them
+    keys = { id: prompt_hash(MODEL, summary_messages(books[id][1], books[id][2]), MAX_TOKENS) for id in books }
+    cache = current_app.config['summaries']
+
+    try:
+        results = cache.get_many(cursor, list(keys.items()))
+    except:
+        results = {}
+
+    cursor.close()
+    current_app.config['db'].release()
+
+    missing = [ id for id in ids if id in books and id not in results ]
+
+    if len(missing) > 0:
+        messages, describe = summary_batch_prompts(books)
+        generated, failed = complete_batch(messages, missing, SUMMARY_TOKENS, describe)
+        results.update(generated)
+        errors.update(failed)
+
+        try:
+            with current_app.config['db'].cursor() as cursor:
+                cache.put_many(cursor, [ (id, keys[id], MODEL, content) for id, content in generated.items() ])
+        except:
+            pass
+
+    return jsonify({
+        'results': { str(id): { 'summary': results[id] } for id in ids if id in results },
+        'errors': { str(id): errors[id] for id in ids if id in errors }
+    }), 200
+
+@api_ai.route('/recommendation/batch', methods = [ 'POST' ])
+def recommendation_batch():
+    payload = request.get_json(silent = True) or {}
+    ids = parse_ids(payload.get('ids'))
+    features = parse_features(payload.get('features') if isinstance(payload.get('features'), dict) else {})
+
+    if ids is None:
+        return jsonify({ 'error': 'The ids field must be a list of 1...{} book ids'.format(MAX_BATCH_SIZE) }), 400
+
+    cursor = current_app.config['db'].reader.cursor()
+
+    try:
+        books = books_by_ids(cursor, ids)
+    except:
+        cursor.close()
+        return jsonify({ 'error': 'Unable to search the books inside the database' }), 500
+
+    cursor.close()
+    errors = { id: 'Unable to find the book within the database' for id in ids if id not in books }
+    scores, failed = score_books(features, [ (id, books[id][1], books[id][2], books[id][6]) for id in ids if id in books ])
+    errors.update(failed)
+
     return jsonify({
-        'recommendation': completion.choices[0].message.content
-    })
\ No newline at end of file
+        'results': { str(id): format_recommendation(*scores[id]) for id in ids if id in scores },
+        'errors': { str(id): errors[id] for id in ids if id in errors }
+    }), 200
@@ -0,0 +1,423 @@
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.datastructures import MultiDict
+from .ai import (
+    MAX_BATCH_PROMPTS, MAX_BATCH_SIZE, MAX_TOKENS, MODEL, RANK_SCORING_LIMIT, RECOMMENDATION_TOKENS, SUMMARY_TOKENS,
+    accept_text, batch_groups, event, format_ranking, format_recommendation, parse_features, parse_ids, read_batch,
+    recommendation_messages, summary_batch_prompts, summary_messages
+)
+from .asyncgateway import AsyncAIGateway
+from .database import PoolTimeout
+from .fakeai import FakeAsyncGroq
+from .gateway import CircuitBreaker, GatewayError, GatewayTimeout, GatewayUnavailable
+from .lazy import Lazy
+from .queries import books_by_ids, execute
+from .recommendations import describe_book, normalize_profile, parse_score, profile_key, scoring_messages
+from .responses import encode
+from .routes import create_app
+from .summaries import prompt_hash
+from . import telemetry
+import asyncio
+import json
+import os
+import re
+import time
+import urllib.parse
+import MySQLdb
+
+# ASGI entry point, e.g. uvicorn api.asgi:application --workers $(nproc): the AI routes are served by
+# coroutines on the event loop, every other route by the Flask application on a worker thread
+
+def async_client():
+    if os.getenv('AI_BACKEND', 'groq') == 'fake':
+        return FakeAsyncGroq(
+            first_token_latency = float(os.getenv('FAKE_AI_FIRST_TOKEN_LATENCY', 0.3)),
+            chunk_interval = float(os.getenv('FAKE_AI_CHUNK_INTERVAL', 0.02))
+        )
+
+    from groq import AsyncGroq
+
+    return AsyncGroq(api_key = os.getenv('GROQ_API_KEY'), base_url = os.getenv('GROQ_BASE_URL'), max_retries = 0)
+
+api = create_app()
+api.config['ai_async'] = AsyncAIGateway(
+    Lazy(async_client),
+    max_concurrency = api.config['AI_ASYNC_MAX_CONCURRENCY'],
+    queue_timeout = api.config['AI_QUEUE_TIMEOUT'],
+    deadline = api.config['AI_DEADLINE'],
+    max_retries = api.config['AI_MAX_RETRIES'],
+    breaker = CircuitBreaker(threshold = api.config['AI_BREAKER_THRESHOLD'], reset_timeout = api.config['AI_BREAKER_RESET'])
+)
+
+class Request:
+    def __init__(self, scope: dict, body: bytes):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = MultiDict(urllib.parse.parse_qsl(scope.get('query_string', b'').decode('latin-1'), keep_blank_values = True))
+        self.body = body
+
+    def get_json(self):
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            return None
+
+async def query(function, read: bool = False):
+    # the MySQL driver blocks, so statements run on the default executor, each call in an application
+    # context of its own which borrows a pooled connection, from a replica when read, and gives it back when done
+    def run():
+        with api.app_context():
+            with api.config['db'].cursor(read = read) as cursor:
+                return function(cursor)
+
+    return await asyncio.to_thread(run)
+
+def fetch_book(cursor, id: int):
+    execute(cursor, 'book_by_id', (id,))
+
+    return cursor.fetchone()
+
+async def stream(messages: list, max_tokens: int, on_complete = None, cached: str | None = None):
+    # the same events as the threaded stream() of ai.py
+    if cached is not None:
+        yield event('token', { 'content': cached })
+        yield event('done', {})
+        return
+
+    upstream = None
+    pieces = []
+    completed = False
+
+    try:
+        upstream = api.config['ai_async'].stream(MODEL, messages, max_tokens)
+
+        async for chunk in upstream:
+            content = chunk.choices[0].delta.content
+
+            if content:
+                pieces.append(content)
+                yield event('token', { 'content': content })
+
+        completed = True
+    except Exception:
+        yield event('error', { 'error': 'Unable to complete the generation' })
+        return
+    finally:
+        if not completed and upstream is not None:
+            await upstream.aclose()
+
+    if on_complete is not None:
+        await on_complete(''.join(pieces))
+
+    yield event('done', {})
+
+async def complete_batch(messages, ids: list[int], answer_tokens: int, describe, accept = accept_text) -> tuple[dict, dict]:
+    if len(ids) < 1:
+        return {}, {}
+
+    gateway = api.config['ai_async']
+    slots = asyncio.Semaphore(MAX_BATCH_PROMPTS)
+
+    async def run(group: list[int]) -> tuple[dict, dict]:
+        async with slots:
+            try:
+                answer = await gateway.complete(MODEL, messages(group), answer_tokens * len(group))
+            except GatewayError:
+                answer = None
+
+        return read_batch(group, answer, accept)
+
+    results = {}
+    errors = {}
+
+    for partial_results, partial_errors in await asyncio.gather(*[ run(group) for group in batch_groups(messages, ids, answer_tokens, describe) ]):
+        results.update(partial_results)
+        errors.update(partial_errors)
+
+    return results, errors
+
+async def score_books(features: dict, books: list[tuple]) -> tuple[dict, dict]:
+    profile = normalize_profile(features)
+    key = profile_key(profile)
+    store = api.config['recommendations']
+
+    try:
+        scores = await query(lambda cursor: store.get_many(cursor, key, [ book[0] for book in books ]))
+    except:
+        scores = {}
+
+    missing = { book[0]: book for book in books if book[0] not in scores }
+    generated, errors = await complete_batch(
+        lambda group: scoring_messages(profile, [ missing[id] for id in group ]),
+        list(missing),
+        RECOMMENDATION_TOKENS,
+        lambda id: describe_book(missing[id]),
+        accept = parse_score
+    )
+    scores.update(generated)
+
+    try:
+        await query(lambda cursor: store.put_many(cursor, key, generated))
+    except:
+        pass
+
+    return scores, errors
+
+async def summary(request: Request, id: int):
+    try:
+        entry = await query(lambda cursor: fetch_book(cursor, id), read = True)
+    except MySQLdb.Error:
+        return 500, { 'error': 'Unable to search the book inside the database' }
+
+    if entry is None or len(entry) < 1:
+        return 400, { 'error': 'Unable to find the book within the database' }
+
+    _, title, author, _, _, _, _ = entry
+
+    messages = summary_messages(title, author)
+    cache = api.config['summaries']
+    key = prompt_hash(MODEL, messages, MAX_TOKENS)
+
+    try:
+        content = await query(lambda cursor: cache.get(cursor, id, key), read = True)
+    except:
+        content = None
+
+    async def store(content: str):
+        try:
+            await query(lambda cursor: cache.put(cursor, id, key, MODEL, content))
+        except:
+            pass
+
+    if request.args.get('stream', 0, type = int) == 1:
+        return stream(messages, MAX_TOKENS, on_complete = store, cached = content)
+
+    if content is None:
+        content = await api.config['ai_async'].complete(MODEL, messages, MAX_TOKENS)
+        await store(content)
+
+    return 200, { 'summary': content }
+
+async def recommendation(request: Request, id: int):
+    features = parse_features(request.args)
+
+    try:
+        entry = await query(lambda cursor: fetch_book(cursor, id), read = True)
+    except MySQLdb.Error:
+        return 500, { 'error': 'Unable to search the book inside the database' }
+
+    if entry is None or len(entry) < 1:
+        return 400, { 'error': 'Unable to find the book within the database' }
+
+    _, title, author, _, _, _, genre = entry
+
+    if request.args.get('stream', 0, type = int) == 1:
+        return stream(recommendation_messages(features, title, author, genre), MAX_TOKENS)
+
+    scores, errors = await score_books(features, [ (id, title, author, genre) ])
+
+    if id not in scores:
+        return 503, { 'error': errors.get(id, 'Unable to compute the recommendation') }
+
+    return 200, format_recommendation(*scores[id])
+
+async def recommendation_rank(request: Request):
+    features = parse_features(request.args)
+    count = request.args.get('count', 10, type = int)
+
+    if count < 1 or count > MAX_BATCH_SIZE:
+        return 400, { 'error': 'The count field must be in range 1...{}'.format(MAX_BATCH_SIZE) }
+
+    key = profile_key(normalize_profile(features))
+    store = api.config['recommendations']
+
+    try:
+        books = await query(lambda cursor: store.unscored(cursor, key, RANK_SCORING_LIMIT))
+    except MySQLdb.Error:
+        return 500, { 'error': 'Unable to search the books inside the database' }
+
+    _, errors = await score_books(features, books)
+
+    try:
+        entries = await query(lambda cursor: store.top(cursor, key, count))
+    except MySQLdb.Error:
+        return 500, { 'error': 'Unable to rank the books inside the database' }
+
+    return 200, format_ranking(entries, books, errors)
+
+async def summary_batch(request: Request):
+    payload = request.get_json()
+    ids = parse_ids(payload.get('ids') if isinstance(payload, dict) else None)
+
+    if ids is None:
+        return 400, { 'error': 'The ids field must be a list of 1...{} book ids'.format(MAX_BATCH_SIZE) }
+
+    try:
+        books = await query(lambda cursor: books_by_ids(cursor, ids), read = True)
+    except MySQLdb.Error:
+        return 500, { 'error': 'Unable to search the books inside the database' }
+
+    errors = { id: 'Unable to find the book within the database' for id in ids if id not in books }
+    keys = { id: prompt_hash(MODEL, summary_messages(books[id][1], books[id][2]), MAX_TOKENS) for id in books }
+    cache = api.config['summaries']
+
+    try:
+        results = await query(lambda cursor: cache.get_many(cursor, list(keys.items())), read = True)
+    except:
+        results = {}
+
+    missing = [ id for id in ids if id in books and id not in results ]
+
+    if len(missing) > 0:
+        messages, describe = summary_batch_prompts(books)
+        generated, failed = await complete_batch(messages, missing, SUMMARY_TOKENS, describe)
+        results.update(generated)
+        errors.update(failed)
+
+        try:
+            await query(lambda cursor: cache.put_many(cursor, [ (id, keys[id], MODEL, content) for id, content in generated.items() ]))
+        except:
+            pass
+
+    return 200, {
+        'results': { str(id): { 'summary': results[id] } for id in ids if id in results },
+        'errors': { str(id): errors[id] for id in ids if id in errors }
+    }
+
+async def recommendation_batch(request: Request):
+    payload = request.get_json()
+    payload = payload if isinstance(payload, dict) else {}
+    ids = parse_ids(payload.get('ids'))
+    features = parse_features(payload.get('features') if isinstance(payload.get('features'), dict) else {})
+
+    if ids is None:
+        return 400, { 'error': 'The ids field must be a list of 1...{} book ids'.format(MAX_BATCH_SIZE) }
+
+    try:
+        books = await query(lambda cursor: books_by_ids(cursor, ids), read = True)
+    except MySQLdb.Error:
+        return 500, { 'error': 'Unable to search the books inside the database' }
+
+    errors = { id: 'Unable to find the book within the database' for id in ids if id not in books }
+    scores, failed = await score_books(features, [ (id, books[id][1], books[id][2], books[id][6]) for id in ids if id in books ])
+    errors.update(failed)
+
+    return 200, {
+        'results': { str(id): format_recommendation(*scores[id]) for id in ids if id in scores },
+        'errors': { str(id): errors[id] for id in ids if id in errors }
+    }
+
+# (method, path, endpoint, handler), endpoints carry the names of the Flask ones so that metrics stay comparable
+ROUTES = [
+    ('GET', re.compile(r'/ai/summary/(?P<id>\d+)'), 'api_ai.summary', summary),
+    ('GET', re.compile(r'/ai/recommendation/(?P<id>\d+)'), 'api_ai.recommendation', recommendation),
+    ('GET', re.compile(r'/ai/recommendation/rank'), 'api_ai.recommendation_rank', recommendation_rank),
+    ('POST', re.compile(r'/ai/summary/batch'), 'api_ai.summary_batch', summary_batch),
+    ('POST', re.compile(r'/ai/recommendation/batch'), 'api_ai.recommendation_batch', recommendation_batch)
+]
+
+# same answers as the error handlers of routes.py
+ERRORS = [
+    (PoolTimeout, 503, 'The database is too busy, please try again later'),
+    (GatewayUnavailable, 503, 'The assistant is temporarily unavailable, please try again later'),
+    (GatewayTimeout, 504, 'The assistant took too long to answer, please try again later')
+]
+
+HEADERS = [ (b'access-control-allow-origin', b'*') ]
+
+def match(method: str, path: str):
+    for route_method, pattern, endpoint, handler in ROUTES:
+        found = pattern.fullmatch(path)
+
+        if found is not None and route_method == method:
+            return endpoint, handler, { name: int(value) for name, value in found.groupdict().items() }
+
+    return None
+
+async def read_body(receive) -> bytes:
+    chunks = []
+
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+async def send_json(send, status: int, payload):
+    body = encode(payload)
+
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': HEADERS + [ (b'content-type', b'application/json'), (b'content-length', str(len(body)).encode('ascii')) ]
+    })
+    await send({ 'type': 'http.response.body', 'body': body })
+
+async def send_events(send, receive, events):
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': HEADERS + [ (b'content-type', b'text/event-stream; charset=utf-8'), (b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no') ]
+    })
+
+    async def disconnected():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    # the client going away stops the generation at its next token, as the threaded server does on write
+    watcher = asyncio.ensure_future(disconnected())
+
+    try:
+        async for data in events:
+            if watcher.done():
+                break
+
+            await send({ 'type': 'http.response.body', 'body': data.encode('utf-8'), 'more_body': True })
+
+        await send({ 'type': 'http.response.body', 'body': b'' })
+    finally:
+        watcher.cancel()
+        await events.aclose()
+
+class Application:
+    def __init__(self, app):
+        self.wsgi = WsgiToAsgi(app)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+
+            if message['type'] == 'lifespan.startup':
+                await send({ 'type': 'lifespan.startup.complete' })
+            elif message['type'] == 'lifespan.shutdown':
+                await send({ 'type': 'lifespan.shutdown.complete' })
+                return
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        route = match(scope['method'], scope['path']) if scope['type'] == 'http' else None
+
+        if route is None:
+            return await self.wsgi(scope, receive, send)
+
+        endpoint, handler, params = route
+        start = time.perf_counter()
+
+        try:
+            result = await handler(Request(scope, await read_body(receive)), **params)
+        except Exception as error:
+            status, message = next(((status, message) for kind, status, message in ERRORS if isinstance(error, kind)), (500, 'Internal server error'))
+            result = (status, { 'error': message })
+
+        if isinstance(result, tuple):
+            status, payload = result
+            await send_json(send, status, payload)
+        else:
+            status = 200
+            await send_events(send, receive, result)
+
+        telemetry.REGISTRY.observe('http_request_duration_seconds', time.perf_counter() - start, endpoint = endpoint, method = scope['method'], status = status)
+
+application = Application(api)
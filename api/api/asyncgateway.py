@@ -0,0 +1,167 @@
+from .gateway import AIGateway, GatewayTimeout, GatewayUnavailable, retry_after, retryable
+from .summaries import prompt_hash
+from . import telemetry
+import asyncio
+import random
+import time
+
+# coroutine counterparts of the gateway and of the single flight, only imported by the ASGI entry point
+
+class AsyncSingleFlight:
+    # the same coalescing for coroutines of one event loop, followers await the leader's future;
+    # it does not coordinate with other processes
+    def __init__(self):
+        self._calls = {}
+        self._executed = 0
+        self._coalesced = 0
+
+    async def do(self, key: str, function):
+        call = self._calls.get(key)
+
+        if call is not None:
+            self._coalesced += 1
+        else:
+            # the call runs as its own task, so that the leader being cancelled does not cancel it for the
+            # followers; it still completes when every waiter is gone
+            call = self._calls[key] = asyncio.ensure_future(function())
+            call.add_done_callback(lambda _: self._forget(key, call))
+            self._executed += 1
+
+        return await asyncio.shield(call)
+
+    def _forget(self, key: str, call: asyncio.Future):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+        # retrieved here so that an unobserved failure is not reported when nobody was waiting
+        if not call.cancelled():
+            call.exception()
+
+    def stats(self) -> dict:
+        return {
+            'in_flight': len(self._calls),
+            'executed': self._executed,
+            'coalesced': self._coalesced,
+            'coalesced_across_processes': 0
+        }
+
+class AsyncAIGateway(AIGateway):
+    # the same admission, retry and breaker policy for an asyncio client (groq.AsyncGroq), a pending
+    # completion costs a suspended coroutine instead of a blocked thread
+    def __init__(self, client, max_concurrency: int = 256, **kwargs):
+        kwargs.setdefault('flights', AsyncSingleFlight())
+        super().__init__(client, max_concurrency = max_concurrency, **kwargs)
+
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _admit(self):
+        if not self.breaker.allow():
+            self._count('rejected')
+            raise GatewayUnavailable('The AI provider is unhealthy')
+
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.breaker.cancel()
+            self._count('busy')
+            raise GatewayUnavailable('Too many concurrent AI requests')
+
+        with self._lock:
+            self._in_flight += 1
+
+    async def _create(self, deadline: float, **kwargs):
+        attempt = 0
+
+        while True:
+            remaining = deadline - time.monotonic()
+
+            if remaining <= 0:
+                self._count('timeouts')
+                raise GatewayTimeout('The AI provider did not answer in time')
+
+            try:
+                self._count('calls')
+                return await self.client.chat.completions.create(timeout = remaining, **kwargs)
+            except Exception as error:
+                if not retryable(error):
+                    raise
+
+                if attempt >= self.max_retries:
+                    raise GatewayUnavailable('The AI provider keeps failing') from error
+
+                delay = retry_after(error)
+                delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt)) if delay is None else delay
+
+                if time.monotonic() + delay >= deadline:
+                    self._count('timeouts')
+                    raise GatewayTimeout('The AI provider did not answer in time') from error
+
+                self._count('retries')
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def _guarded(self, coroutine):
+        try:
+            result = await coroutine
+        except (GatewayUnavailable, GatewayTimeout):
+            self._count('failures')
+            self.breaker.failure()
+            raise
+        except Exception:
+            self.breaker.success()
+            raise
+
+        self.breaker.success()
+
+        return result
+
+    async def complete(self, model: str, messages: list, max_tokens: int) -> str:
+        async def create() -> str:
+            await self._admit()
+            start = time.perf_counter()
+
+            try:
+                completion = await self._guarded(self._create(
+                    time.monotonic() + self.deadline,
+                    model = model,
+                    messages = messages,
+                    max_tokens = max_tokens
+                ))
+            finally:
+                self._leave()
+
+            telemetry.record_completion(model, time.perf_counter() - start, getattr(completion, 'usage', None))
+
+            return completion.choices[0].message.content
+
+        return await self.flights.do(prompt_hash(model, messages, max_tokens), create)
+
+    async def stream(self, model: str, messages: list, max_tokens: int):
+        await self._admit()
+        start = time.perf_counter()
+        usage = None
+
+        try:
+            deadline = time.monotonic() + self.deadline
+            upstream = await self._guarded(self._create(
+                deadline,
+                model = model,
+                messages = messages,
+                max_tokens = max_tokens,
+                stream = True
+            ))
+
+            try:
+                async for chunk in upstream:
+                    usage = getattr(getattr(chunk, 'x_groq', None), 'usage', None) or getattr(chunk, 'usage', None) or usage
+
+                    yield chunk
+
+                    if time.monotonic() > deadline:
+                        self._count('timeouts')
+                        raise GatewayTimeout('The AI provider did not finish in time')
+            finally:
+                await upstream.close()
+        finally:
+            self._leave()
+            telemetry.record_completion(model, time.perf_counter() - start, usage)
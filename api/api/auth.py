@@ -1,17 +1,21 @@
-from flask import Blueprint, jsonify, request, current_app
-from hashlib import sha256
+from flask import Blueprint, jsonify, request, current_app, g
 import uuid
+from .queries import execute
+from .sessions import authenticated
 
 api_auth = Blueprint("api_auth", __name__)
 
 @api_auth.route('/signin', methods = [ 'POST' ])
 def signin():
+    wait = current_app.config['attempts'].allow(request.args.get('email', '').strip(), request.remote_addr)
+
+    if wait is not None:
+        return jsonify({ 'error': 'Too many sign in attempts, please try again later' }), 429, { 'Retry-After': str(max(1, round(wait))) }
+
     cursor = current_app.config["db"].connection.cursor()
 
     try:
-        cursor.execute("SELECT email, password FROM users WHERE email=\"{}\";".format(
-            request.args.get('email').strip()
-        ))
+        execute(cursor, 'user_by_email', (request.args.get('email').strip(),))
     except:
         cursor.close()
         return jsonify({ 'error': 'Unable to the sign in the user' }), 500
@@ -19,21 +23,31 @@ def signin():
     entry = cursor.fetchone()
 
     if entry is None or len(entry) < 1:
+        cursor.close()
         return jsonify({ 'error': 'User does not exist' }), 400
 
     email = entry[0]
     password = entry[1]
     token = str(uuid.uuid4())
 
-    if password != sha256(request.args.get('password').strip().encode('utf-8')).hexdigest():
+    hasher = current_app.config['passwords']
+    valid, outdated = hasher.verify(request.args.get('password').strip(), password)
+
+    if not valid:
+        cursor.close()
         return jsonify({ 'error': 'Invalid password crendential' }), 400
 
-    try:        
-        cursor.execute('INSERT INTO sessions (email, token) VALUES(\"{}\", \"{}\");'.format(
-            email,
-            token
-        ))
+    current_app.config['attempts'].reset(email)
+
+    try:
+        if outdated:
+            # legacy sha256 hashes and hashes with older cost settings are replaced on the first successful login
+            execute(cursor, 'update_user_password', (hasher.hash(request.args.get('password').strip()), email))
+            hasher.rehashed()
+
+        current_app.config['sessions'].create(cursor, email, token)
         current_app.config['db'].connection.commit()
+        current_app.config['sessions'].remember(email, token)
     except:
         cursor.close()
         return jsonify({ 'error': 'Unable to the sign in the user' }), 500
@@ -44,12 +58,15 @@ def signin():
 
 @api_auth.route('/signup', methods = [ 'POST' ])
 def signup():
+    wait = current_app.config['attempts'].allow(request.args.get('email', '').strip(), request.remote_addr)
+
+    if wait is not None:
+        return jsonify({ 'error': 'Too many sign up attempts, please try again later' }), 429, { 'Retry-After': str(max(1, round(wait))) }
+
     cursor = current_app.config["db"].connection.cursor()
 
     try:
-        cursor.execute("SELECT email, password FROM users WHERE email=\"{}\";".format(
-            request.args.get('email').strip()
-        ))
+        execute(cursor, 'user_by_email', (request.args.get('email').strip(),))
     except:
         cursor.close()
         return jsonify({ 'error': 'Unable to the sign up the user' }), 500
@@ -57,22 +74,18 @@ def signup():
     entry = cursor.fetchone()
 
     if entry is not None and len(entry) > 0:
+        cursor.close()
         return jsonify({ 'error': 'User already exists' }), 400
     
     email = request.args.get('email').strip()
-    password = sha256(request.args.get('password').strip().encode('utf-8')).hexdigest()
+    password = current_app.config['passwords'].hash(request.args.get('password').strip())
     token = str(uuid.uuid4())
 
     try:
-        cursor.execute('INSERT INTO users (email, password) VALUES(\"{}\", \"{}\");'.format(
-            email,
-            password,
-        ))
-        cursor.execute('INSERT INTO sessions (email, token) VALUES(\"{}\", \"{}\");'.format(
-            email,
-            token,
-        ))
+        execute(cursor, 'insert_user', (email, password))
+        current_app.config['sessions'].create(cursor, email, token)
         current_app.config['db'].connection.commit()
+        current_app.config['sessions'].remember(email, token)
     except:
         cursor.close()
         return jsonify({ 'error': 'Unable to the sign up the user' }), 500
@@ -82,34 +95,18 @@ def signup():
     return jsonify({ 'message': 'User has successfully signed up and in', 'token': token }), 200
 
 @api_auth.route('/signout', methods = [ 'POST' ])
+@authenticated
 def signout():
-    if not request.args.get('email') or not request.args.get('token'):
-        return jsonify({ 'error': 'You lack authorization to make this call' }), 401
-    
+    email, token = g.session
     cursor = current_app.config["db"].connection.cursor()
 
     try:
-        cursor.execute("SELECT email, token FROM sessions WHERE email=\"{}\" AND token=\"{}\";".format(
-            request.args.get('email').strip(),
-            request.args.get('token').strip(),
-        ))
-    except:
-        cursor.close()
-        return jsonify({ 'error': 'Unable to sign out' }), 500
-
-    entry = cursor.fetchone()
-
-    if entry is None or len(entry) < 1:
-        return jsonify({ 'error': 'Invalid request due to session expiration or invalid credentials' }), 400
-    
-    try:
-        cursor.execute("DELETE FROM sessions WHERE email=\"{}\" AND token=\"{}\";".format(
-            entry[0],
-            entry[1]
-        ))
+        current_app.config['sessions'].revoke(cursor, email, token)
         current_app.config['db'].connection.commit()
     except:
         cursor.close()
         return jsonify({ 'error': 'Unable to sign out' }), 500
 
+    cursor.close()
+
     return jsonify({ 'message': 'User has successfully signed out' }), 200
\ No newline at end of file
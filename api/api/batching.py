@@ -0,0 +1,42 @@
+import json
+import re
+
+def estimate_tokens(text: str) -> int:
+    # close enough for llama style tokenizers on english text, and always on the safe side for packing
+    return len(text) // 3 + 1
+
+def pack(items: list, cost, budget: int, overhead: int = 0, limit: int | None = None) -> list[list]:
+    # greedily fills each prompt with as many items as the token budget allows, an item never gets split
+    groups = []
+    group = []
+    used = overhead
+
+    for item in items:
+        tokens = cost(item)
+
+        if len(group) > 0 and (used + tokens > budget or (limit is not None and len(group) >= limit)):
+            groups.append(group)
+            group = []
+            used = overhead
+
+        group.append(item)
+        used += tokens
+
+    if len(group) > 0:
+        groups.append(group)
+
+    return groups
+
+def parse_json_object(text: str) -> dict:
+    # models like to wrap their JSON in prose or code fences, keep the outermost object only
+    match = re.search(r'\{.*\}', text, re.DOTALL)
+
+    if match is None:
+        raise ValueError('No JSON object in the completion')
+
+    result = json.loads(match.group(0))
+
+    if not isinstance(result, dict):
+        raise ValueError('The completion is not a JSON object')
+
+    return result
@@ -1,8 +1,85 @@
-from flask import Blueprint, jsonify, request, current_app
+from flask import Blueprint, jsonify, request, current_app, g
+from .bulk import MAX_BULK_SIZE, apply
+from .cache import MISSING
+from .pagination import decode_token, encode_token
+from .queries import books_by_ids, execute
+from .responses import json_response, rows_response
+from .search import SEARCH_MODES, SORTABLE_COLUMNS, build_books_query
+from .sessions import authenticated
 from .utilities import validate_book
+from . import bookstats
+import MySQLdb
 
 api_books = Blueprint('api_books', __name__)
 
+MAX_SEARCH_COUNT = 100
+# rows served at most by one page of /show or /getreviews, a larger count is clamped and the rest paged
+MAX_PAGE_SIZE = 1000
+
+def page_size(default: int | None) -> tuple[bool, int | None]:
+    # a malformed or negative count is refused instead of read as the default, which may be no limit at all
+    value = request.args.get('count')
+
+    if value is None:
+        return True, default
+
+    try:
+        value = int(value)
+    except ValueError:
+        value = -1
+
+    if value < 0:
+        return False, (jsonify({ 'error': 'Invalid count field, it must be a non-negative integer' }), 400)
+
+    return True, min(value, MAX_PAGE_SIZE)
+
+def book_index(cursor):
+    # the first worker to need the index builds it from the catalog, later ones map the published files;
+    # embeddings is imported here and not at the top, so that workers never searching do not load numpy
+    from .embeddings import document
+
+    index = current_app.config['embeddings']
+
+    if not index.ready():
+        execute(cursor, 'book_documents')
+        index.build([ (id, document(title, author, genre, description)) for id, title, author, genre, description in cursor.fetchall() ])
+
+    return index
+
+def sync_index(cursor, id: int, removed: bool = False):
+    # a failure here only makes the semantic search slightly stale, it must never fail the write
+    from .embeddings import document
+
+    try:
+        if removed:
+            current_app.config['embeddings'].update(removals = [ id ])
+            return
+
+        execute(cursor, 'book_document', (id,))
+        entry = cursor.fetchone()
+
+        if entry is not None:
+            current_app.config['embeddings'].update(upserts = [ (id, document(*entry[1:])) ])
+    except:
+        pass
+
+def sync_index_many(cursor, upserts: list[int], removals: list[int]):
+    # same as sync_index for a whole batch, with a single lookup and a single index update
+    from .embeddings import document
+
+    try:
+        documents = []
+
+        if len(upserts) > 0:
+            execute(cursor, 'book_documents_by_ids', tuple(upserts), sql = 'SELECT id, title, author, genre, description FROM books WHERE id IN ({});'.format(
+                ', '.join([ '%s' ] * len(upserts))
+            ))
+            documents = [ (entry[0], document(*entry[1:])) for entry in cursor.fetchall() ]
+
+        current_app.config['embeddings'].update(upserts = documents, removals = removals)
+    except:
+        pass
+
 @api_books.route('/show', methods = [ 'GET', 'POST' ])
 def show():
     # selection filters based on column matching
@@ -12,60 +89,160 @@ def show():
     price = request.args.get('price')
     currency = request.args.get('currency')
     genre = request.args.get('genre')
+    # matching strategy for the textual filters
+    mode = request.args.get('mode', 'substring')
     # limit count and ordering options
-    limit = request.args.get('count')
+    valid, limit = page_size(None)
+
+    if not valid:
+        return limit
+
     sortby = request.args.get('sortby')
     reverse = request.args.get('reverse', 0, type = int)
+    # only books whose average review is at least this many stars
+    min_rating = request.args.get('min_rating', type = float)
+    # continuation token returned by the previous page
+    page_token = request.args.get('page_token')
 
-    cursor = current_app.config['db'].connection.cursor()
-    command = [ 'SELECT id, title, author, publication_year, price, currency, genre FROM books' ]
+    # parsed by the rules of the stored values, a malformed filter must not silently widen the selection
+    valid, result = validate_book(None, None, publication_year, price, None, None, allow_empty_field = True)
 
-    filters = []
+    if not valid:
+        return result
 
-    if title is not None:
-        filters.append('LOWER(title) LIKE \"%{}%\"'.format(title.lower()))
+    _, _, publication_year, price, _, _ = result
+
+    if sortby is not None and sortby not in SORTABLE_COLUMNS:
+        return jsonify({ 'error': 'Invalid sortby field, it must be one of {}'.format(', '.join(SORTABLE_COLUMNS)) }), 400
+
+    if mode not in SEARCH_MODES:
+        return jsonify({ 'error': 'Invalid mode field, it must be one of {}'.format(', '.join(SEARCH_MODES)) }), 400
+
+    if min_rating is not None and (min_rating < 0 or min_rating > 5):
+        return jsonify({ 'error': 'The min_rating field must be in range 0...5' }), 400
+
+    ordering = 'books:{}:{}'.format(sortby or 'id', 1 if reverse == 1 else 0)
+    after = None
+
+    if page_token is not None:
+        try:
+            after = decode_token(page_token, ordering)
+        except ValueError as error:
+            return jsonify({ 'error': 'Invalid page_token field, {}'.format(str(error).lower()) }), 400
+
+    command, params = build_books_query(
+        title = title,
+        author = author,
+        publication_year = publication_year,
+        price = price,
+        currency = currency,
+        genre = genre,
+        sortby = sortby,
+        reverse = reverse == 1,
+        limit = limit,
+        mode = mode,
+        after = after,
+        min_rating = min_rating
+    )
 
-    if author is not None:
-        filters.append('LOWER(author) LIKE \"%{}%\"'.format(author.lower()))
+    results = current_app.config['results']
+    cursor = current_app.config['db'].reader.cursor()
 
-    if publication_year is not None:
-        filters.append('publication_year={}'.format(publication_year))
+    try:
+        versions, modified = results.versions(cursor, [ 'books' ])
+    except:
+        cursor.close()
+        return jsonify({ 'error': 'Unable to fetch the books from the database' }), 500
 
-    if price is not None:
-        filters.append('CAST(price AS UNSIGNED)={}'.format(int(price)))
+    # the statement and its parameters are the normalized form of every filter, sort and page option
+    etag = results.etag('show', command, params, versions)
 
-    if currency is not None:
-        filters.append('LOWER(currency)=\"{}\"'.format(currency.lower()))
-    
-    if genre is not None:
-        filters.append('LOWER(genre) LIKE \"%{}%\"'.format(genre.lower()))
+    if results.not_modified(etag, modified):
+        cursor.close()
+        return results.tag(current_app.response_class(status = 304), etag, modified)
+
+    entries = results.get((command, params, versions))
 
-    if len(filters) > 0:
-        command.append('WHERE {}'.format(' AND '.join(filters)))
+    if entries is MISSING:
+        try:
+            execute(cursor, 'show_books', params, sql = command)
+            entries = cursor.fetchall()
+        except:
+            cursor.close()
+            return jsonify({ 'error': 'Unable to fetch the books from the database' }), 500
 
-    if sortby is not None:
-        command.append('ORDER BY {} {}'.format(
-            'LOWER(TRIM({}))'.format(sortby) if sortby in [ 'title', 'author', 'genre', 'currency' ] else sortby, 
-            'ASC' if reverse != 1 else 'DESC'
-        ))
+        results.put((command, params, versions), entries)
     
-    if limit is not None:
-        command.append('LIMIT {}'.format(limit))
+    cursor.close()
+
+    response = rows_response([ 'id', 'title', 'author', 'publication_year', 'price', 'currency', 'genre', 'rating', 'review_count' ], entries)
 
-    command = ' '.join(command)
+    # a full page means there may be more rows after the last one
+    if limit is not None and len(entries) == limit and limit > 0:
+        response.headers['X-Next-Page-Token'] = encode_token(ordering, [ entries[-1][-1], entries[-1][0] ])
+
+    return results.tag(response, etag, modified)
+
+@api_books.route('/search', methods = [ 'GET' ])
+def search():
+    from .embeddings import embed
+
+    query = request.args.get('q')
+    count = request.args.get('count', 10, type = int)
+
+    if query is None or len(query.strip()) < 1:
+        return jsonify({ 'error': 'The q field must be non-empty' }), 400
+
+    if count < 1 or count > MAX_SEARCH_COUNT:
+        return jsonify({ 'error': 'The count field must be in range 1...{}'.format(MAX_SEARCH_COUNT) }), 400
+
+    cursor = current_app.config['db'].reader.cursor()
 
     try:
-        cursor.execute(command)
-        entries = cursor.fetchall()
+        matches = book_index(cursor).search(embed([ query.strip() ]), count)[0]
+        books = books_by_ids(cursor, [ id for id, _ in matches ])
     except:
         cursor.close()
-        return jsonify({ 'error': 'Unable to fetch the books from the database' }), 500
-    
+        return jsonify({ 'error': 'Unable to search the books inside the database' }), 500
+
     cursor.close()
-    
+
+    return jsonify([
+        dict(zip([ 'id', 'title', 'author', 'publication_year', 'price', 'currency', 'genre' ], books[id]), similarity = score)
+        for id, score in matches if id in books
+    ])
+
+@api_books.route('/similar/<int:id>', methods = [ 'GET' ])
+def similar(id: int):
+    count = request.args.get('count', 10, type = int)
+
+    if count < 1 or count > MAX_SEARCH_COUNT:
+        return jsonify({ 'error': 'The count field must be in range 1...{}'.format(MAX_SEARCH_COUNT) }), 400
+
+    cursor = current_app.config['db'].reader.cursor()
+
+    try:
+        vector = book_index(cursor).vector(id)
+    except:
+        cursor.close()
+        return jsonify({ 'error': 'Unable to search the books inside the database' }), 500
+
+    if vector is None:
+        cursor.close()
+        return jsonify({ 'error': 'Unable to find the book within the database' }), 400
+
+    try:
+        matches = current_app.config['embeddings'].search(vector[None, :], count, exclude = [ id ])[0]
+        books = books_by_ids(cursor, [ match for match, _ in matches ])
+    except:
+        cursor.close()
+        return jsonify({ 'error': 'Unable to search the books inside the database' }), 500
+
+    cursor.close()
+
     return jsonify([
-        dict(zip([ 'id', 'title', 'author', 'publication_year', 'price', 'currency', 'genre' ], entry))
-        for entry in entries
+        dict(zip([ 'id', 'title', 'author', 'publication_year', 'price', 'currency', 'genre' ], books[match]), similarity = score)
+        for match, score in matches if match in books
     ])
 
 @api_books.route('/edit/<int:id>', methods = [ 'POST' ])
@@ -84,10 +261,11 @@ def edit(id: int):
         return result
     
     title, author, publication_year, price, currency, genre = result    
+    description = request.args.get('description')
     cursor = current_app.config['db'].connection.cursor()
 
     try:
-        cursor.execute('SELECT * FROM books WHERE id={};'.format(id))
+        execute(cursor, 'book_by_id', (id,))
     except:
         cursor.close() 
         return jsonify({ 'error': 'Unable to search the book inside the database' }), 500
@@ -99,34 +277,59 @@ def edit(id: int):
         return jsonify({ 'error': 'Unable to find the book within the database' }), 400
 
     updates = []
+    params = []
 
     if title is not None and len(title) > 0:
-        updates.append('title=\"{}\"'.format(title))
+        updates.append('title=%s')
+        params.append(title)
 
     if author is not None and len(author) > 0:
-        updates.append('author=\"{}\"'.format(author))
+        updates.append('author=%s')
+        params.append(author)
 
     if publication_year is not None:
-        updates.append('publication_year={}'.format(publication_year))
+        updates.append('publication_year=%s')
+        params.append(publication_year)
 
     if price is not None:
-        updates.append('price={}'.format(price))
+        updates.append('price=%s')
+        params.append(price)
 
     if currency is not None and len(currency) > 0:
-        updates.append('currency=\"{}\"'.format(currency))
+        updates.append('currency=%s')
+        params.append(currency)
 
     if genre is not None and len(genre) > 0:
-        updates.append('genre=\"{}\"'.format(genre))
+        updates.append('genre=%s')
+        params.append(genre)
+
+    if description is not None and len(description.strip()) > 0:
+        updates.append('description=%s')
+        params.append(description.strip())
 
     try:
-        cursor.execute('UPDATE books SET {} WHERE id={};'.format(
-            ', '.join(updates),
-            id
-        ))
-        current_app.config['db'].connection.commit()
+        execute(cursor, 'update_book', (*params, id), sql = 'UPDATE books SET {} WHERE id=%s;'.format(', '.join(updates)))
+        # summaries are derived from title and author only, recommendation scores also from genre
+        if (title is not None and len(title) > 0) or (author is not None and len(author) > 0):
+            current_app.config['summaries'].invalidate(cursor, id)
+
+        if (title is not None and len(title) > 0) or (author is not None and len(author) > 0) or (genre is not None and len(genre) > 0):
+            current_app.config['recommendations'].invalidate(cursor, id)
+        current_app.config['results'].bump(cursor, 'books')
+        current_app.config['db'].commit()
+    except MySQLdb.IntegrityError:
+        # the unique (title, author) key, also hit by spellings its collation considers equal
+        current_app.config['db'].connection.rollback()
+        cursor.close()
+        return jsonify({ 'error': 'Unable to edit the book since another one already has the title "{}" and the author "{}"'.format(
+            title or entry[1],
+            author or entry[2]
+        ) }), 400
     except:
         cursor.close()
         return jsonify({ 'error': 'Unable to edit the book from the database' }), 500
+
+    sync_index(cursor, id)
     
     cursor.close()
 
@@ -137,7 +340,7 @@ def delete(id: int):
     cursor = current_app.config['db'].connection.cursor()
 
     try:
-        cursor.execute('SELECT * FROM books WHERE id={};'.format(id))
+        execute(cursor, 'book_by_id', (id,))
     except:
         cursor.close() 
         return jsonify({ 'error': 'Unable to search the book inside the database' }), 500
@@ -149,11 +352,17 @@ def delete(id: int):
         return jsonify({ 'error': 'Unable to find the book within the database' }), 400
 
     try:
-        cursor.execute('DELETE FROM books WHERE id={};'.format(id))
-        current_app.config['db'].connection.commit()
+        execute(cursor, 'delete_book', (id,))
+        bookstats.remove(cursor, [ id ])
+        current_app.config['summaries'].invalidate(cursor, id)
+        current_app.config['recommendations'].invalidate(cursor, id)
+        current_app.config['results'].bump(cursor, 'books')
+        current_app.config['db'].commit()
     except:
         cursor.close()
         return jsonify({ 'error': 'Unable to delete the book from the database' }), 500
+
+    sync_index(cursor, id, removed = True)
     
     cursor.close()
 
@@ -174,10 +383,11 @@ def add():
         return result
     
     title, author, publication_year, price, currency, genre = result
+    description = request.args.get('description', '').strip()
     cursor = current_app.config['db'].connection.cursor()
 
     try:
-        cursor.execute('SELECT * FROM books WHERE LOWER(title)=\"{}\" AND LOWER(author)=\"{}\" LIMIT 1;'.format(title.lower(), author.lower()))
+        execute(cursor, 'book_by_title_author', (title.lower(), author.lower()))
     except:
         cursor.close()
         return jsonify({ 'error': 'Unable to add the new book to the database' }), 500
@@ -189,49 +399,56 @@ def add():
         return jsonify({ 'error': 'Unable to add the new book since it already exists' }), 400
 
     try:
-        cursor.execute('INSERT INTO books (title, author, publication_year, price, currency, genre) VALUES(\"{}\", \"{}\", \"{}\", \"{}\", \"{}\", \"{}\");'.format(
-            title,
-            author,
-            publication_year,
-            price,
-            currency,
-            genre
-        ))
-        current_app.config['db'].connection.commit()
+        execute(cursor, 'insert_book', (title, author, publication_year, price, currency, genre, description or None))
+        id = cursor.lastrowid
+        bookstats.create(cursor, [ id ])
+        current_app.config['results'].bump(cursor, 'books')
+        current_app.config['db'].commit()
     except:
         cursor.close()
         return jsonify({ 'error': 'Unable to add the new book to the database' }), 500
+
+    sync_index(cursor, id)
     
     cursor.close()
 
     return jsonify({ 'message': 'Your book has been successfully added to the collection' }), 200
 
-@api_books.route('/review/<int:id>', methods = [ 'POST' ])
-def review(id: int):
-    if not request.args.get('email') or not request.args.get('token'):
-        return jsonify({ 'error': 'You lack authorization to make this call' }), 401
-    
-    cursor = current_app.config["db"].connection.cursor()
+@api_books.route('/bulk', methods = [ 'POST' ])
+def bulk():
+    items = request.get_json(silent = True)
 
-    email = request.args.get('email').strip()
-    token = request.args.get('token').strip()
+    if not isinstance(items, list) or len(items) < 1 or len(items) > MAX_BULK_SIZE:
+        return jsonify({ 'error': 'Invalid body, it must be a JSON array of 1 to {} operations'.format(MAX_BULK_SIZE) }), 400
+
+    cursor = current_app.config['db'].connection.cursor()
 
     try:
-        cursor.execute("SELECT email, token FROM sessions WHERE email=\"{}\" AND token=\"{}\";".format(
-            email,
-            token,
-        ))
+        results, upserts, removals = apply(cursor, items, current_app.config['summaries'], current_app.config['recommendations'])
+
+        if len(upserts) > 0 or len(removals) > 0:
+            current_app.config['results'].bump(cursor, 'books')
+
+        current_app.config['db'].commit()
     except:
+        current_app.config['db'].connection.rollback()
         cursor.close()
-        return jsonify({ 'error': 'Unable to sign out' }), 500
+        return jsonify({ 'error': 'Unable to apply the operations to the database, none of them was applied' }), 500
 
-    entry = cursor.fetchone()
+    sync_index_many(cursor, upserts, removals)
+
+    cursor.close()
+
+    return jsonify(results), 200
+
+@api_books.route('/review/<int:id>', methods = [ 'POST' ])
+@authenticated
+def review(id: int):
+    email, token = g.session
+    cursor = current_app.config["db"].connection.cursor()
 
-    if entry is None or len(entry) < 1:
-        return jsonify({ 'error': 'Invalid request due to session expiration or invalid user' }), 400
-    
     try:
-        cursor.execute('SELECT * FROM books WHERE id={};'.format(id))
+        execute(cursor, 'book_by_id', (id,))
     except:
         cursor.close() 
         return jsonify({ 'error': 'Unable to search the book inside the database' }), 500
@@ -254,13 +471,11 @@ def review(id: int):
         return jsonify({ 'error': 'The textual comment must be non-empty' }), 400
 
     try:
-        cursor.execute('INSERT INTO reviews (email, bookid, n_stars, content) VALUES(\"{}\", {}, {}, \"{}\");'.format(
-            email,
-            id,
-            n_stars,
-            content
-        ))
-        current_app.config['db'].connection.commit()
+        execute(cursor, 'insert_review', (email, id, n_stars, content))
+        bookstats.record_review(cursor, id, n_stars)
+        # the ratings listed by /books/show change as well
+        current_app.config['results'].bump(cursor, 'books', 'reviews:{}'.format(id))
+        current_app.config['db'].commit()
     except:
         cursor.close()
         return jsonify({ 'error': 'Unable to add a review of the book into the database' }), 500
@@ -271,10 +486,10 @@ def review(id: int):
 
 @api_books.route('/getreviews/<int:id>', methods = [ 'GET' ])
 def getreviews(id: int):
-    cursor = current_app.config["db"].connection.cursor()
+    cursor = current_app.config["db"].reader.cursor()
     
     try:
-        cursor.execute('SELECT * FROM books WHERE id={};'.format(id))
+        execute(cursor, 'book_by_id', (id,))
     except:
         cursor.close() 
         return jsonify({ 'error': 'Unable to search the book inside the database' }), 500
@@ -285,51 +500,89 @@ def getreviews(id: int):
         cursor.close()
         return jsonify({ 'error': 'Unable to find the book within the database' }), 400
     
+    valid, limit = page_size(100)
+
+    if not valid:
+        cursor.close()
+        return limit
+
+    page_token = request.args.get('page_token')
+    ordering = 'reviews:{}'.format(id)
+    results = current_app.config['results']
+
+    try:
+        after = tuple(decode_token(page_token, ordering)) if page_token is not None else None
+    except ValueError as error:
+        cursor.close()
+        return jsonify({ 'error': 'Invalid page_token field, {}'.format(str(error).lower()) }), 400
+
     try:
-        cursor.execute('SELECT email, n_stars, content, creation_timestamp FROM reviews WHERE bookid={} ORDER BY creation_timestamp DESC LIMIT {};'.format(
-            id,
-            request.args.get('count') if request.args.get('count') else 100
-        ))
+        # a deleted or edited book changes the answer as much as a new review does
+        versions, modified = results.versions(cursor, [ 'books', ordering ])
     except:
-        cursor.close() 
+        cursor.close()
         return jsonify({ 'error': 'Unable to search for the reviewers of the book' }), 500
-    
-    entries = cursor.fetchall()
+
+    etag = results.etag('getreviews', id, limit, after, versions)
+
+    if results.not_modified(etag, modified):
+        cursor.close()
+        return results.tag(current_app.response_class(status = 304), etag, modified)
+
+    entries = results.get(('getreviews', id, limit, after, versions))
+
+    if entries is MISSING:
+        try:
+            if after is not None:
+                timestamp, email = after
+                execute(cursor, 'reviews_by_book_after', (id, timestamp, timestamp, email, limit))
+            else:
+                execute(cursor, 'reviews_by_book', (id, limit))
+        except:
+            cursor.close() 
+            return jsonify({ 'error': 'Unable to search for the reviewers of the book' }), 500
+
+        entries = cursor.fetchall()
+        results.put(('getreviews', id, limit, after, versions), entries)
     
     cursor.close()
 
     if not entries:
-        return jsonify({ 'message': 'This book has not been reviewed yet', 'reviews': [] }), 200
+        return results.tag(rows_response([ 'email', 'n_stars', 'content', 'creation_timestamp' ], entries, envelope = {
+            'message': 'This book has not been reviewed yet',
+            'next_page_token': None
+        }, key = 'reviews'), etag, modified)
 
-    return jsonify({ 'message': 'The reviewers of the selected book have been computed', 'reviews': [
-        dict(zip([ 'email', 'n_stars', 'content', 'creation_timestamp'], entry)) 
-        for entry in entries
-    ] }), 200
+    return results.tag(rows_response([ 'email', 'n_stars', 'content', 'creation_timestamp' ], entries, envelope = {
+        'message': 'The reviewers of the selected book have been computed',
+        'next_page_token': encode_token(ordering, [ entries[-1][3], entries[-1][0] ]) if len(entries) == limit else None
+    }, key = 'reviews'), etag, modified)
 
-@api_books.route('/getreviewedbooks/<string:email>', methods = [ 'POST' ])
-def getreviewedbooks(email: str):
-    if not email or not request.args.get('token'):
-        return jsonify({ 'error': 'You lack authorization to make this call' }), 401
-    
-    token = request.args.get('token').strip()
-    cursor = current_app.config["db"].connection.cursor()
+@api_books.route('/stats/<int:id>', methods = [ 'GET' ])
+def stats(id: int):
+    cursor = current_app.config['db'].reader.cursor()
 
     try:
-        cursor.execute("SELECT email, token FROM sessions WHERE email=\"{}\" AND token=\"{}\";".format(
-            email,
-            token,
-        ))
+        entry = bookstats.lookup(cursor, id)
     except:
         cursor.close()
-        return jsonify({ 'error': 'Unable to search the reviewed books of requested user' }), 500
+        return jsonify({ 'error': 'Unable to fetch the statistics of the book' }), 500
 
-    entry = cursor.fetchone()
+    cursor.close()
+
+    if entry is None:
+        return jsonify({ 'error': 'Unable to find the book within the database' }), 400
+
+    return jsonify(entry), 200
+
+@api_books.route('/getreviewedbooks/<string:email>', methods = [ 'POST' ])
+@authenticated
+def getreviewedbooks(email: str):
+    email, token = g.session
+    cursor = current_app.config["db"].connection.cursor()
 
-    if entry is None or len(entry) < 1:
-        return jsonify({ 'error': 'Invalid request due to session expiration or invalid credentials' }), 400
-    
     try:
-        cursor.execute('SELECT bookid FROM reviews where email=\"{}\";'.format(email))
+        execute(cursor, 'reviewed_books_by_user', (email,))
     except:
         cursor.close() 
         return jsonify({ 'error': 'Unable to search for the reviews of the user' }), 500
@@ -339,8 +592,8 @@ def getreviewedbooks(email: str):
     cursor.close()
 
     if not entries:
-        return jsonify({ 'message': 'This user has not reviewed any books yet', 'reviewed_books': [], 'token': token }), 200
+        return json_response({ 'message': 'This user has not reviewed any books yet', 'reviewed_books': [], 'token': token })
 
-    return jsonify({ 'message': 'The reviewers of the selected book have been computed', 'reviewed_books': [
+    return json_response({ 'message': 'The reviewers of the selected book have been computed', 'reviewed_books': [
         entry[0] for entry in entries
-    ], 'token': token }), 200
\ No newline at end of file
+    ], 'token': token })
\ No newline at end of file
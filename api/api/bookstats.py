@@ -0,0 +1,75 @@
+from .queries import execute, executemany
+import time
+
+# reviews accept 0 to 5 stars, one histogram column per value
+STARS = range(0, 6)
+
+def record_review(cursor, bookid: int, n_stars: int):
+    # runs inside the review's transaction, the row of a book created before book_stats existed is created here
+    execute(cursor, 'book_stats_review', (bookid, n_stars, *[ 1 if stars == n_stars else 0 for stars in STARS ]))
+
+def create(cursor, ids: list[int]):
+    if len(ids) > 0:
+        executemany(cursor, 'book_stats_create', [ (id,) for id in ids ])
+
+def create_by_keys(cursor, keys: list[tuple[str, str]]):
+    # books written by an upsert only known by their (title, author) key, existing rows are left untouched
+    if len(keys) > 0:
+        execute(cursor, 'book_stats_create_by_keys', tuple(value for key in keys for value in key), sql = (
+            'INSERT IGNORE INTO book_stats (bookid) SELECT id FROM books WHERE (title_lc, author_lc) IN ({});'.format(
+                ', '.join([ '(%s, %s)' ] * len(keys))
+            )
+        ))
+
+def remove(cursor, ids: list[int]):
+    if len(ids) > 0:
+        execute(cursor, 'book_stats_delete', tuple(ids), sql = 'DELETE FROM book_stats WHERE bookid IN ({});'.format(', '.join([ '%s' ] * len(ids))))
+
+def lookup(cursor, bookid: int) -> dict | None:
+    execute(cursor, 'book_stats_by_book', (bookid,))
+    entry = cursor.fetchone()
+
+    if entry is None:
+        return None
+
+    review_count, stars_total, rating, last_review, *histogram = entry
+
+    return {
+        'review_count': review_count,
+        'stars_total': stars_total,
+        'rating': rating if review_count > 0 else None,
+        'histogram': { str(stars): count for stars, count in zip(STARS, histogram) },
+        'last_review': last_review
+    }
+
+def rebuild(connection, batch: int = 10000, pause: float = 0.0) -> dict:
+    # recomputed from reviews one range of book ids per transaction, so that reviews are never blocked for long
+    cursor = connection.cursor()
+    statistics = { 'ids': 0, 'batches': 0, 'orphans': 0 }
+    start = time.perf_counter()
+
+    try:
+        execute(cursor, 'books_id_range')
+        low, high = cursor.fetchone()
+
+        for first in range(low or 0, (high or -1) + 1, batch):
+            execute(cursor, 'book_stats_rebuild', (first, first + batch))
+            connection.commit()
+
+            statistics['ids'] += min(batch, high - first + 1)
+            statistics['batches'] += 1
+
+            if pause > 0:
+                time.sleep(pause)
+
+        execute(cursor, 'book_stats_orphans')
+        statistics['orphans'] = cursor.rowcount
+        # cached /books/show results carry the ratings
+        execute(cursor, 'version_bump', ('books',))
+        connection.commit()
+    finally:
+        cursor.close()
+
+    statistics['seconds'] = time.perf_counter() - start
+
+    return statistics
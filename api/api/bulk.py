@@ -0,0 +1,253 @@
+from .queries import execute, executemany
+from .validation import ERRORS, check
+from . import bookstats
+import unicodedata
+import MySQLdb
+
+MAX_BULK_SIZE = 1000
+OPERATIONS = [ 'add', 'edit', 'delete' ]
+COLUMNS = [ 'title', 'author', 'publication_year', 'price', 'currency', 'genre', 'description' ]
+# every failed operation carries one of these codes next to its message
+FAILURES = {
+    **ERRORS,
+    'invalid_op': 'Invalid op field, it must be one of {}'.format(', '.join(OPERATIONS)),
+    'invalid_id': 'Invalid id field, it must be an integer',
+    'nothing_to_edit': 'Nothing to edit, you need to fill at least one field',
+    'duplicate_operation': 'Only one operation per book is allowed in a batch',
+    'book_not_found': 'Unable to find the book within the database',
+    'edit_conflict': 'Unable to edit the book since another one already has this title and author',
+    'book_exists': 'Unable to add the new book since it already exists'
+}
+
+def _text(value) -> str | None:
+    # JSON bodies may carry numbers where the query string only ever carried text
+    return None if value is None else str(value)
+
+def _failure(index: int, op, code: str) -> dict:
+    return { 'index': index, 'op': op, 'status': 400, 'code': code, 'error': FAILURES[code] }
+
+def _placeholders(count: int, group: str = '%s') -> str:
+    return ', '.join([ group ] * count)
+
+def _collate(text: str) -> str:
+    # close to how the column collation compares: case, accents and trailing spaces do not count
+    return ''.join(character for character in unicodedata.normalize('NFKD', text) if not unicodedata.combining(character)).casefold().rstrip(' ')
+
+def _key(title: str, author: str) -> tuple[str, str]:
+    return _collate(title), _collate(author)
+
+def _update(cursor, edited: dict):
+    # a single UPDATE with one CASE per column, books that do not set a column keep its value
+    assignments = []
+    params = []
+
+    for column in COLUMNS:
+        cases = [ (id, fields[column]) for id, (_, fields) in edited.items() if column in fields ]
+
+        if len(cases) > 0:
+            assignments.append('{0}=CASE id {1} ELSE {0} END'.format(column, ' '.join([ 'WHEN %s THEN %s' ] * len(cases))))
+            params.extend(value for case in cases for value in case)
+
+    ids = list(edited)
+    execute(cursor, 'update_books', (*params, *ids), sql = 'UPDATE books SET {} WHERE id IN ({});'.format(', '.join(assignments), _placeholders(len(ids))))
+
+def plan(items: list) -> tuple[list, list, list, list]:
+    # validates every operation on its own, without touching the database
+    results = [ None ] * len(items)
+    adds = []
+    edits = []
+    deletes = []
+
+    for index, item in enumerate(items):
+        op = item.get('op') if isinstance(item, dict) else None
+
+        if op not in OPERATIONS:
+            results[index] = _failure(index, op, 'invalid_op')
+            continue
+
+        id = item.get('id')
+
+        if op != 'add' and (not isinstance(id, int) or isinstance(id, bool)):
+            results[index] = _failure(index, op, 'invalid_id')
+            continue
+
+        if op == 'delete':
+            deletes.append((index, id))
+            continue
+
+        code, book = check(
+            title = _text(item.get('title')),
+            author = _text(item.get('author')),
+            publication_year = _text(item.get('publication_year')),
+            price = _text(item.get('price')),
+            currency = _text(item.get('currency', 'USD' if op == 'add' else None)),
+            genre = _text(item.get('genre', '' if op == 'add' else None)),
+            allow_empty_field = op == 'edit'
+        )
+
+        if code is not None:
+            results[index] = _failure(index, op, code)
+            continue
+
+        description = _text(item.get('description'))
+        description = description.strip() if description is not None and len(description.strip()) > 0 else None
+
+        if op == 'add':
+            adds.append((index, (*book, description)))
+            continue
+
+        fields = { column: value for column, value in zip(COLUMNS, (*book, description)) if value is not None and value != '' }
+
+        if len(fields) < 1:
+            results[index] = _failure(index, op, 'nothing_to_edit')
+            continue
+
+        edits.append((index, id, fields))
+
+    return results, adds, edits, deletes
+
+def apply(cursor, items: list, summaries, recommendations) -> tuple[list, list, list]:
+    # one set-based lookup for the referenced ids, one for the (title, author) keys, then multi-row writes;
+    # the caller commits, and deletes are applied before edits and edits before adds
+    results, adds, edits, deletes = plan(items)
+    referenced = sorted({ id for _, id in deletes } | { id for _, id, _ in edits })
+    current = {}
+
+    if len(referenced) > 0:
+        execute(cursor, 'books_keys_by_ids', tuple(referenced), sql = 'SELECT id, title_lc, author_lc FROM books WHERE id IN ({});'.format(_placeholders(len(referenced))))
+        current = { id: (title, author) for id, title, author in cursor.fetchall() }
+
+    seen = set()
+
+    def resolve(index: int, op: str, id: int) -> bool:
+        if id in seen:
+            results[index] = _failure(index, op, 'duplicate_operation')
+            return False
+
+        seen.add(id)
+
+        if id not in current:
+            results[index] = _failure(index, op, 'book_not_found')
+            return False
+
+        return True
+
+    deletes = [ (index, id) for index, id in deletes if resolve(index, 'delete', id) ]
+    edits = [ (index, id, fields) for index, id, fields in edits if resolve(index, 'edit', id) ]
+    removed = { id for _, id in deletes }
+
+    # the (title, author) every surviving add or renaming edit would end up with; MySQL looks the owners up
+    # under the column collation, and they are matched back with _key
+    wanted = {}
+
+    for index, id, fields in edits:
+        if 'title' in fields or 'author' in fields:
+            wanted[index] = (fields.get('title', current[id][0]).lower(), fields.get('author', current[id][1]).lower())
+
+    for index, book in adds:
+        wanted[index] = (book[0].lower(), book[1].lower())
+
+    keys = { index: _key(*value) for index, value in wanted.items() }
+    owners = {}
+
+    if len(wanted) > 0:
+        distinct = list(set(wanted.values()))
+        execute(cursor, 'books_by_keys', tuple(value for key in distinct for value in key), sql = 'SELECT id, title_lc, author_lc FROM books WHERE (title_lc, author_lc) IN ({});'.format(
+            _placeholders(len(distinct), '(%s, %s)')
+        ))
+        owners = { _key(title, author): id for id, title, author in cursor.fetchall() }
+
+    claimed = set()
+    edited = {}
+
+    for index, id, fields in edits:
+        key = keys.get(index)
+        owner = owners.get(key)
+
+        if key is not None and (key in claimed or (owner is not None and owner != id and owner not in removed)):
+            results[index] = _failure(index, 'edit', 'edit_conflict')
+            continue
+
+        claimed.add(key)
+        edited[id] = (index, fields)
+
+    added = []
+
+    for index, book in adds:
+        key = keys[index]
+        owner = owners.get(key)
+
+        if key in claimed or (owner is not None and owner not in removed):
+            results[index] = _failure(index, 'add', 'book_exists')
+            continue
+
+        claimed.add(key)
+        added.append((index, book))
+
+    if len(deletes) > 0:
+        ids = [ id for _, id in deletes ]
+        execute(cursor, 'delete_books', tuple(ids), sql = 'DELETE FROM books WHERE id IN ({});'.format(_placeholders(len(ids))))
+        bookstats.remove(cursor, ids)
+        summaries.invalidate_many(cursor, ids)
+        recommendations.invalidate_many(cursor, ids)
+
+        for index, id in deletes:
+            results[index] = { 'index': index, 'op': 'delete', 'status': 200, 'id': id }
+
+    if len(edited) > 0:
+        execute(cursor, 'bulk_savepoint', sql = 'SAVEPOINT bulk_write;')
+
+        try:
+            _update(cursor, edited)
+        except MySQLdb.IntegrityError:
+            # a key the collation still finds taken: back to before the statement, and each edit is applied
+            # on its own, so that only the conflicting ones fail
+            execute(cursor, 'bulk_rollback', sql = 'ROLLBACK TO SAVEPOINT bulk_write;')
+
+            for id, (index, fields) in list(edited.items()):
+                try:
+                    _update(cursor, { id: (index, fields) })
+                except MySQLdb.IntegrityError:
+                    results[index] = _failure(index, 'edit', 'edit_conflict')
+                    del edited[id]
+
+    if len(edited) > 0:
+        # same invalidation rules as a single edit
+        summaries.invalidate_many(cursor, [ id for id, (_, fields) in edited.items() if 'title' in fields or 'author' in fields ])
+        recommendations.invalidate_many(cursor, [ id for id, (_, fields) in edited.items() if 'title' in fields or 'author' in fields or 'genre' in fields ])
+
+        for id, (index, _) in edited.items():
+            results[index] = { 'index': index, 'op': 'edit', 'status': 200, 'id': id }
+
+    if len(added) > 0:
+        execute(cursor, 'bulk_savepoint', sql = 'SAVEPOINT bulk_write;')
+
+        try:
+            executemany(cursor, 'insert_book', [ book for _, book in added ])
+        except MySQLdb.IntegrityError:
+            # as for the edits, including a multi-row insert the driver split, the books are inserted one by one
+            execute(cursor, 'bulk_rollback', sql = 'ROLLBACK TO SAVEPOINT bulk_write;')
+            inserting = added
+            added = []
+
+            for index, book in inserting:
+                try:
+                    execute(cursor, 'insert_book', book)
+                    added.append((index, book))
+                except MySQLdb.IntegrityError:
+                    results[index] = _failure(index, 'add', 'book_exists')
+
+    if len(added) > 0:
+        # a multi-row insert may be split by the driver, so new ids are read back by key instead of from lastrowid
+        execute(cursor, 'books_by_keys', tuple(value for _, book in added for value in (book[0].lower(), book[1].lower())), sql = 'SELECT id, title_lc, author_lc FROM books WHERE (title_lc, author_lc) IN ({});'.format(
+            _placeholders(len(added), '(%s, %s)')
+        ))
+        inserted = { _key(title, author): id for id, title, author in cursor.fetchall() }
+        bookstats.create(cursor, list(inserted.values()))
+
+        for index, book in added:
+            results[index] = { 'index': index, 'op': 'add', 'status': 200, 'id': inserted.get(_key(book[0], book[1])) }
+
+    upserts = [ id for id in edited ] + [ result['id'] for result in results if result['op'] == 'add' and result['status'] == 200 and result['id'] is not None ]
+
+    return results, upserts, list(removed)
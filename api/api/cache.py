@@ -0,0 +1,86 @@
+import collections
+import threading
+import time
+
+MISSING = object()
+
+class LRUCache:
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None):
+        if maxsize < 1:
+            raise ValueError('Invalid cache size, it must be a positive integer')
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        # key -> (value, expiry time or None), least recently used first
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def get(self, key, default = None):
+        with self._lock:
+            entry = self._entries.get(key, MISSING)
+
+            if entry is not MISSING and entry[1] is not None and entry[1] <= time.monotonic():
+                del self._entries[key]
+                self._expirations += 1
+                entry = MISSING
+
+            if entry is MISSING:
+                self._misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+
+            return entry[0]
+
+    def put(self, key, value, ttl: float | None = None):
+        ttl = self.ttl if ttl is None else ttl
+
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl if ttl is not None else None)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last = False)
+                self._evictions += 1
+
+    def pop(self, key, default = None):
+        with self._lock:
+            entry = self._entries.pop(key, MISSING)
+
+            return default if entry is MISSING else entry[0]
+
+    def discard_where(self, predicate) -> int:
+        with self._lock:
+            keys = [ key for key in self._entries if predicate(key) ]
+
+            for key in keys:
+                del self._entries[key]
+
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups > 0 else 0.0,
+                'evictions': self._evictions,
+                'expirations': self._expirations
+            }
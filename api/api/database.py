@@ -0,0 +1,455 @@
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from .cache import LRUCache
+import collections
+import math
+import os
+import threading
+import time
+import weakref
+import MySQLdb
+
+class PoolTimeout(Exception):
+    pass
+
+_pools = weakref.WeakSet()
+
+def _after_fork():
+    for pool in list(_pools):
+        pool._forget()
+
+os.register_at_fork(after_in_child = _after_fork)
+
+class ConnectionPool:
+    def __init__(
+        self,
+        connect,
+        min_size: int = 1,
+        max_size: int = 10,
+        timeout: float = 5.0,
+        ping_interval: float = 0.0,
+        idle_timeout: float = 300.0
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError('Invalid pool size, expected 0 <= min_size <= max_size and max_size >= 1')
+
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.idle_timeout = idle_timeout
+
+        self._connect = connect
+        # idle connections as (connection, last release time), most recently used at the right
+        self._idle = collections.deque()
+        self._condition = threading.Condition()
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._warmed = False
+        # counters exposed through metrics()
+        self._acquired = 0
+        self._timeouts = 0
+        self._failed_checks = 0
+        self._wait_count = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+        _pools.add(self)
+
+    def _forget(self):
+        # in a forked child the inherited connections share the parent's sockets: they are kept referenced but
+        # never used again, closing them or letting them be collected would end the parent's sessions
+        self._inherited = [ connection for connection, _ in self._idle ]
+        self._condition = threading.Condition()
+        self._idle = collections.deque()
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._warmed = False
+
+    def _warm(self):
+        # opens the minimum number of connections the first time the pool is used; the slots are reserved
+        # under the lock, so that concurrent first requests never open more than min_size between them
+        with self._condition:
+            if self._warmed:
+                return
+
+            reserved = max(0, self.min_size - self._size)
+            self._size += reserved
+            self._warmed = True
+
+        connections = []
+
+        try:
+            for _ in range(reserved):
+                connections.append(self._connect())
+        finally:
+            with self._condition:
+                now = time.monotonic()
+                self._idle.extend((connection, now) for connection in connections)
+                self._size -= reserved - len(connections)
+                self._condition.notify_all()
+
+    def _check(self, connection, last_used: float):
+        if time.monotonic() - last_used < self.ping_interval:
+            return connection
+
+        try:
+            connection.ping()
+            return connection
+        except MySQLdb.Error:
+            self._failed_checks += 1
+            self._close(connection)
+
+        return self._connect()
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except MySQLdb.Error:
+            pass
+
+    def acquire(self, timeout: float | None = None):
+        if not self._warmed:
+            self._warm()
+
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+
+        with self._condition:
+            waited = False
+
+            while not self._idle and self._size >= self.max_size:
+                remaining = deadline - time.monotonic()
+
+                if remaining <= 0:
+                    if waited:
+                        self._waiting -= 1
+
+                    self._timeouts += 1
+                    raise PoolTimeout('No database connection available within {:.2f}s'.format(timeout))
+
+                if not waited:
+                    waited = True
+                    self._waiting += 1
+
+                self._condition.wait(remaining)
+
+            if waited:
+                self._waiting -= 1
+                elapsed = time.monotonic() - start
+                self._wait_count += 1
+                self._wait_total += elapsed
+                self._wait_max = max(self._wait_max, elapsed)
+
+            if self._idle:
+                connection, last_used = self._idle.pop()
+            else:
+                connection, last_used = None, None
+                self._size += 1
+
+            self._in_use += 1
+            self._acquired += 1
+
+        try:
+            if connection is None:
+                return self._connect()
+
+            return self._check(connection, last_used)
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+
+    def release(self, connection, discard: bool = False) -> bool:
+        # answers whether the connection went back to the pool, False when it was found broken or discarded
+        if not discard:
+            try:
+                # drops any uncommitted work so the next borrower starts from a clean state
+                connection.rollback()
+            except MySQLdb.Error:
+                discard = True
+
+        expired = []
+
+        with self._condition:
+            self._in_use -= 1
+            now = time.monotonic()
+
+            if discard:
+                self._size -= 1
+            else:
+                self._idle.append((connection, now))
+
+            # trims connections left idle for too long, keeping at least min_size open
+            while self._size > self.min_size and self._idle and now - self._idle[0][1] > self.idle_timeout:
+                expired.append(self._idle.popleft()[0])
+                self._size -= 1
+
+            self._condition.notify()
+
+        if discard:
+            expired.append(connection)
+
+        for item in expired:
+            self._close(item)
+
+        return not discard
+
+    @contextmanager
+    def connection(self, timeout: float | None = None):
+        connection = self.acquire(timeout)
+        discard = False
+
+        try:
+            yield connection
+        except MySQLdb.OperationalError:
+            discard = True
+            raise
+        finally:
+            self.release(connection, discard = discard)
+
+    def close(self):
+        with self._condition:
+            idle = [ connection for connection, _ in self._idle ]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._warmed = False
+
+        for connection in idle:
+            self._close(connection)
+
+    def metrics(self) -> dict:
+        with self._condition:
+            return {
+                'size': self._size,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'acquired': self._acquired,
+                'timeouts': self._timeouts,
+                'failed_health_checks': self._failed_checks,
+                'wait_count': self._wait_count,
+                'wait_time_total': self._wait_total,
+                'wait_time_avg': self._wait_total / self._wait_count if self._wait_count > 0 else 0.0,
+                'wait_time_max': self._wait_max
+            }
+
+class Replica:
+    def __init__(self, name: str, pool: ConnectionPool):
+        self.name = name
+        self.pool = pool
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self.reads = 0
+
+class ReplicaSet:
+    # read replicas taken in turn, a replica failing to connect or leaving a broken connection behind
+    # is skipped for eject_time seconds and then tried again by the next read
+    def __init__(self, replicas: list[Replica], eject_time: float = 30.0):
+        self.replicas = replicas
+        self.eject_time = eject_time
+
+        self._lock = threading.Lock()
+        self._next = 0
+
+    def __len__(self) -> int:
+        return len(self.replicas)
+
+    def acquire(self) -> tuple[Replica, object] | None:
+        now = time.monotonic()
+
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.replicas)
+
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+
+            if replica.ejected_until > now:
+                continue
+
+            try:
+                # a busy replica is not an unhealthy one, the read only moves on to the next
+                connection = replica.pool.acquire(timeout = 0)
+            except PoolTimeout:
+                continue
+            except MySQLdb.Error:
+                self.eject(replica)
+                continue
+
+            with self._lock:
+                replica.reads += 1
+
+            return replica, connection
+
+        return None
+
+    def eject(self, replica: Replica):
+        with self._lock:
+            replica.ejected_until = time.monotonic() + self.eject_time
+            replica.ejections += 1
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+
+        with self._lock:
+            return {
+                replica.name: {
+                    'healthy': replica.ejected_until <= now,
+                    'reads': replica.reads,
+                    'ejections': replica.ejections,
+                    'pool': replica.pool.metrics()
+                }
+                for replica in self.replicas
+            }
+
+class Database:
+    def __init__(self, app = None):
+        self.pool = None
+        self.replicas = None
+        self.recent_writers = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('MYSQL_HOST', 'localhost')
+        app.config.setdefault('MYSQL_PORT', 3306)
+        app.config.setdefault('MYSQL_USER', 'root')
+        app.config.setdefault('MYSQL_PASSWORD', '')
+        app.config.setdefault('MYSQL_DB', 'bookdb')
+        app.config.setdefault('MYSQL_CHARSET', 'utf8mb4')
+        app.config.setdefault('MYSQL_POOL_MIN_SIZE', 1)
+        app.config.setdefault('MYSQL_POOL_MAX_SIZE', 10)
+        app.config.setdefault('MYSQL_POOL_TIMEOUT', 5.0)
+        app.config.setdefault('MYSQL_POOL_PING_INTERVAL', 0.0)
+        app.config.setdefault('MYSQL_POOL_IDLE_TIMEOUT', 300.0)
+        # host or host:port of each read replica, they share the user, password and database of the primary
+        app.config.setdefault('MYSQL_REPLICAS', [])
+        app.config.setdefault('MYSQL_REPLICA_EJECT_TIME', 30.0)
+        # reads of a client stay on the primary this many seconds after its own writes
+        app.config.setdefault('MYSQL_STICKY_WINDOW', 5.0)
+        app.config.setdefault('MYSQL_STICKY_SIZE', 100000)
+
+        config = app.config
+
+        # whole seconds for the driver, an unreachable server fails within the time a borrower would wait anyway
+        connect_timeout = max(1, math.ceil(float(config['MYSQL_POOL_TIMEOUT'])))
+
+        def pool(host: str, port: int) -> ConnectionPool:
+            def connect():
+                return MySQLdb.connect(
+                    host = host,
+                    port = port,
+                    user = config['MYSQL_USER'],
+                    passwd = config['MYSQL_PASSWORD'],
+                    db = config['MYSQL_DB'],
+                    charset = config['MYSQL_CHARSET'],
+                    connect_timeout = connect_timeout
+                )
+
+            return ConnectionPool(
+                connect,
+                min_size = int(config['MYSQL_POOL_MIN_SIZE']),
+                max_size = int(config['MYSQL_POOL_MAX_SIZE']),
+                timeout = float(config['MYSQL_POOL_TIMEOUT']),
+                ping_interval = float(config['MYSQL_POOL_PING_INTERVAL']),
+                idle_timeout = float(config['MYSQL_POOL_IDLE_TIMEOUT'])
+            )
+
+        self.pool = pool(config['MYSQL_HOST'], int(config['MYSQL_PORT']))
+        replicas = []
+
+        for endpoint in config['MYSQL_REPLICAS']:
+            host, _, port = endpoint.partition(':')
+            replicas.append(Replica(endpoint, pool(host, int(port or config['MYSQL_PORT']))))
+
+        self.replicas = ReplicaSet(replicas, eject_time = float(config['MYSQL_REPLICA_EJECT_TIME']))
+        self.recent_writers = LRUCache(maxsize = int(config['MYSQL_STICKY_SIZE']), ttl = float(config['MYSQL_STICKY_WINDOW']))
+
+        app.teardown_appcontext(self.teardown)
+
+    @property
+    def connection(self):
+        # borrows one connection per application context, released in teardown
+        if 'db_connection' not in g:
+            g.db_connection = self.pool.acquire()
+
+        return g.db_connection
+
+    def _writers(self) -> list[str]:
+        # a client is known by the email of its session or of the request, and only without one by its
+        # address; behind a reverse proxy every client has the proxy's address unless the app is wrapped in
+        # werkzeug's ProxyFix, which reads the client's from X-Forwarded-For
+        if not has_request_context():
+            return []
+
+        email = g.session[0] if 'session' in g else request.args.get('email') or (request.view_args or {}).get('email')
+
+        if email:
+            return [ 'email:{}'.format(email.strip().lower()) ]
+
+        return [ 'address:{}'.format(request.remote_addr) ]
+
+    def _sticky(self) -> bool:
+        return any(self.recent_writers.get(writer, False) for writer in self._writers())
+
+    @property
+    def reader(self):
+        # connection for statements that only read: a replica, unless there is none available, this request
+        # already holds the primary, or its client wrote recently and must read its own writes
+        if 'db_read_connection' in g:
+            return g.db_read_connection
+
+        if 'db_connection' in g or len(self.replicas) < 1 or self._sticky():
+            return self.connection
+
+        acquired = self.replicas.acquire()
+
+        if acquired is None:
+            return self.connection
+
+        g.db_read_replica, g.db_read_connection = acquired
+
+        return g.db_read_connection
+
+    def commit(self):
+        self.connection.commit()
+
+        for writer in self._writers():
+            self.recent_writers.put(writer, True)
+
+    @contextmanager
+    def cursor(self, read: bool = False):
+        cursor = (self.reader if read else self.connection).cursor()
+
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+    def release(self, discard: bool = False):
+        # gives the connections of this context back to their pools before it ends, so that a request waiting
+        # on something else, like a completion, holds none; the next use checks out new ones
+        connection = g.pop('db_connection', None)
+
+        if connection is not None:
+            self.pool.release(connection, discard = discard)
+
+        connection = g.pop('db_read_connection', None)
+
+        if connection is not None:
+            replica = g.pop('db_read_replica')
+
+            if not replica.pool.release(connection, discard = discard):
+                self.replicas.eject(replica)
+
+    def teardown(self, exception):
+        self.release(discard = isinstance(exception, MySQLdb.OperationalError))
@@ -0,0 +1,211 @@
+import fcntl
+import os
+import re
+import shutil
+import threading
+import time
+import zlib
+import numpy
+
+DIMENSIONS = 256
+
+WORD = re.compile(r'\w+')
+
+def tokens(text: str) -> list[str]:
+    # whole words plus character trigrams, so that close spellings and word stems still share buckets
+    words = WORD.findall(text.lower())
+    grams = []
+
+    for word in words:
+        padded = '<{}>'.format(word)
+        grams.extend(padded[index:index + 3] for index in range(len(padded) - 2))
+
+    return words + grams
+
+def embed(texts: list[str], dimensions: int = DIMENSIONS) -> numpy.ndarray:
+    # signed feature hashing, deterministic across processes and needing no model weights
+    matrix = numpy.zeros((len(texts), dimensions), dtype = numpy.float32)
+
+    for row, text in enumerate(texts):
+        hashes = numpy.fromiter((zlib.crc32(token.encode('utf-8')) for token in tokens(text)), dtype = numpy.uint32)
+
+        if len(hashes) < 1:
+            continue
+
+        signs = numpy.where(hashes >> 31 == 1, -1.0, 1.0).astype(numpy.float32)
+        numpy.add.at(matrix[row], hashes % dimensions, signs)
+
+    norms = numpy.linalg.norm(matrix, axis = 1, keepdims = True)
+
+    return matrix / numpy.maximum(norms, 1e-12)
+
+def document(title: str | None, author: str | None, genre: str | None, description: str | None) -> str:
+    return ' '.join(part for part in [ title, author, genre, description ] if part)
+
+class VectorIndex:
+    # vectors live in a memory mapped matrix shared by every worker, rows are updated in place and free
+    # slots (id -1) are reused; only growing the capacity publishes a new version of the files
+    def __init__(self, directory: str, dimensions: int = DIMENSIONS):
+        self.directory = directory
+        self.dimensions = dimensions
+
+        self._lock = threading.Lock()
+        self._version = None
+        # (ids, vectors) of the mapped version, replaced as a whole so that a reader never pairs two versions
+        self._index = None
+
+        os.makedirs(directory, exist_ok = True)
+
+    def _current(self) -> str | None:
+        try:
+            with open(os.path.join(self.directory, 'CURRENT'), 'r') as file:
+                return file.read().strip() or None
+        except OSError:
+            return None
+
+    def _refresh(self) -> tuple[numpy.ndarray, numpy.ndarray] | None:
+        # answers the (ids, vectors) of the current version, callers keep this one snapshot for their whole read
+        version = self._current()
+
+        with self._lock:
+            if version is None:
+                # the index was removed, rebuilding it publishes a version this worker has not mapped yet
+                self._version, self._index = None, None
+            elif version != self._version:
+                self._index = (
+                    numpy.load(os.path.join(self.directory, version, 'ids.npy'), mmap_mode = 'r+'),
+                    numpy.load(os.path.join(self.directory, version, 'vectors.npy'), mmap_mode = 'r+')
+                )
+                self._version = version
+
+            return self._index
+
+    def _publish(self, ids: numpy.ndarray, vectors: numpy.ndarray):
+        version = '{:x}'.format(time.time_ns())
+        path = os.path.join(self.directory, version)
+
+        os.makedirs(path)
+        numpy.save(os.path.join(path, 'ids.npy'), ids)
+        numpy.save(os.path.join(path, 'vectors.npy'), vectors)
+
+        with open(os.path.join(self.directory, 'CURRENT.tmp'), 'w') as file:
+            file.write(version)
+
+        os.replace(os.path.join(self.directory, 'CURRENT.tmp'), os.path.join(self.directory, 'CURRENT'))
+
+        # workers still mapping an old version keep reading it until they notice the new one
+        for name in os.listdir(self.directory):
+            if name != version and os.path.isdir(os.path.join(self.directory, name)):
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors = True)
+
+        self._refresh()
+
+    def _exclusive(self):
+        # an import may have removed the whole directory to discard the index
+        os.makedirs(self.directory, exist_ok = True)
+        lock = open(os.path.join(self.directory, 'LOCK'), 'a')
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        return lock
+
+    def ready(self) -> bool:
+        return self._refresh() is not None
+
+    def build(self, rows: list[tuple[int, str]], chunk: int = 10000):
+        ids = numpy.array([ id for id, _ in rows ], dtype = numpy.int64)
+        vectors = numpy.zeros((len(rows), self.dimensions), dtype = numpy.float32)
+
+        for start in range(0, len(rows), chunk):
+            vectors[start:start + chunk] = embed([ text for _, text in rows[start:start + chunk] ], self.dimensions)
+
+        self.load(ids, vectors)
+
+    def load(self, ids: numpy.ndarray, vectors: numpy.ndarray):
+        with self._exclusive():
+            self._publish(ids.astype(numpy.int64), vectors.astype(numpy.float32))
+
+    def update(self, upserts: list[tuple[int, str]] = [], removals: list[int] = []):
+        if self._refresh() is None:
+            return
+
+        vectors = embed([ text for _, text in upserts ], self.dimensions) if len(upserts) > 0 else None
+
+        with self._exclusive():
+            index = self._refresh()
+
+            if index is None:
+                return
+
+            ids, matrix = index
+
+            for id in removals:
+                for position in numpy.flatnonzero(ids == id):
+                    ids[position] = -1
+                    matrix[position] = 0.0
+
+            pending = []
+
+            for (id, _), vector in zip(upserts, vectors if vectors is not None else []):
+                positions = numpy.flatnonzero(ids == id)
+
+                if len(positions) < 1:
+                    positions = numpy.flatnonzero(ids == -1)[:1]
+
+                if len(positions) < 1:
+                    pending.append((id, vector))
+                    continue
+
+                matrix[positions[0]] = vector
+                ids[positions[0]] = id
+
+            if len(pending) > 0:
+                # doubles the capacity so that appends stay amortized constant time
+                capacity = max(len(ids) * 2, len(ids) + len(pending), 1024)
+                grown_ids = numpy.full(capacity, -1, dtype = numpy.int64)
+                grown_vectors = numpy.zeros((capacity, self.dimensions), dtype = numpy.float32)
+                grown_ids[:len(ids)] = ids
+                grown_vectors[:len(ids)] = matrix
+
+                for offset, (id, vector) in enumerate(pending):
+                    grown_ids[len(ids) + offset] = id
+                    grown_vectors[len(ids) + offset] = vector
+
+                self._publish(grown_ids, grown_vectors)
+            else:
+                matrix.flush()
+                ids.flush()
+
+    def vector(self, id: int) -> numpy.ndarray | None:
+        index = self._refresh()
+
+        if index is None:
+            return None
+
+        ids, vectors = index
+        positions = numpy.flatnonzero(ids == id)
+
+        return numpy.array(vectors[positions[0]]) if len(positions) > 0 else None
+
+    def search(self, queries: numpy.ndarray, count: int, exclude: list[int] = []) -> list[list[tuple[int, float]]]:
+        index = self._refresh()
+
+        if index is None or len(index[0]) < 1:
+            return [ [] for _ in range(len(queries)) ]
+
+        ids, vectors = index
+        # one matrix product for the whole batch of queries, free slots and excluded ids can never win
+        scores = queries.astype(numpy.float32) @ vectors.T
+        scores[:, ids < 0] = -numpy.inf
+
+        for id in exclude:
+            scores[:, ids == id] = -numpy.inf
+
+        count = min(count, len(ids))
+        top = numpy.argpartition(scores, len(ids) - count, axis = 1)[:, len(ids) - count:]
+        results = []
+
+        for row, candidates in enumerate(top):
+            ordered = candidates[numpy.argsort(-scores[row, candidates])]
+            results.append([ (int(ids[position]), float(scores[row, position])) for position in ordered if numpy.isfinite(scores[row, position]) ])
+
+        return results
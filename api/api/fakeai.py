@@ -0,0 +1,127 @@
+from types import SimpleNamespace
+import asyncio
+import hashlib
+import json
+import re
+import time
+
+# local stand-in for the Groq client, it answers deterministically after a configurable latency
+# and can stream its answer in chunks on a fixed schedule
+
+# the "<id>: <book>" lines of a batch prompt
+BOOK = re.compile(r'^(\d+): ', re.MULTILINE)
+
+def fake_answer(messages: list, words: list[str]) -> str:
+    # prose, unless the prompt asks for a JSON object, which then has an entry per book of the prompt:
+    # a {score, rationale} object for the scoring prompts, a summary for the others
+    prompt = messages[-1]['content'] if len(messages) > 0 else ''
+
+    if 'JSON object' not in prompt:
+        return ' '.join(words)
+
+    seed = int(hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:8], 16)
+    ids = BOOK.findall(prompt)
+
+    if '"score"' in prompt:
+        return json.dumps({ id: { 'score': (seed + int(id)) % 101, 'rationale': ' '.join(words[:16]) } for id in ids })
+
+    return json.dumps({ id: ' '.join(words) for id in ids })
+
+class FakeStream:
+    def __init__(self, pieces: list[str], first_token_latency: float, chunk_interval: float):
+        self.pieces = pieces
+        self.first_token_latency = first_token_latency
+        self.chunk_interval = chunk_interval
+        self.closed = False
+        self.consumed = 0
+
+    def __iter__(self):
+        for index, piece in enumerate(self.pieces):
+            if self.closed:
+                return
+
+            time.sleep(self.first_token_latency if index == 0 else self.chunk_interval)
+            self.consumed += 1
+
+            yield SimpleNamespace(choices = [ SimpleNamespace(delta = SimpleNamespace(content = piece), finish_reason = None) ])
+
+        yield SimpleNamespace(choices = [ SimpleNamespace(delta = SimpleNamespace(content = None), finish_reason = 'stop') ])
+
+    def close(self):
+        self.closed = True
+
+class FakeCompletions:
+    def __init__(self, client):
+        self.client = client
+
+    def create(self, model: str, messages: list, max_tokens: int = 1024, stream: bool = False, **kwargs):
+        self.client.calls += 1
+        words = self.client.answer(model, messages, max_tokens).split(' ')
+        pieces = [ word if index == 0 else ' ' + word for index, word in enumerate(words) ]
+
+        if stream:
+            return FakeStream(pieces, self.client.first_token_latency, self.client.chunk_interval)
+
+        time.sleep(self.client.first_token_latency + self.client.chunk_interval * (len(pieces) - 1))
+
+        prompt_tokens = sum(len(message['content'].split()) for message in messages)
+
+        return SimpleNamespace(
+            model = model,
+            choices = [ SimpleNamespace(message = SimpleNamespace(role = 'assistant', content = ''.join(pieces)), finish_reason = 'stop') ],
+            usage = SimpleNamespace(prompt_tokens = prompt_tokens, completion_tokens = len(pieces), total_tokens = prompt_tokens + len(pieces))
+        )
+
+class FakeGroq:
+    def __init__(self, first_token_latency: float = 0.3, chunk_interval: float = 0.02, words: int = 64):
+        self.first_token_latency = first_token_latency
+        self.chunk_interval = chunk_interval
+        self.words = words
+        self.calls = 0
+        self.chat = SimpleNamespace(completions = FakeCompletions(self))
+
+    def answer(self, model: str, messages: list, max_tokens: int) -> str:
+        seed = hashlib.sha256(repr((model, messages)).encode('utf-8')).hexdigest()
+
+        return fake_answer(messages, [ 'lorem{}'.format(seed[index % len(seed)]) for index in range(min(self.words, max_tokens)) ])
+
+class FakeAsyncStream(FakeStream):
+    async def __aiter__(self):
+        for index, piece in enumerate(self.pieces):
+            if self.closed:
+                return
+
+            await asyncio.sleep(self.first_token_latency if index == 0 else self.chunk_interval)
+            self.consumed += 1
+
+            yield SimpleNamespace(choices = [ SimpleNamespace(delta = SimpleNamespace(content = piece), finish_reason = None) ])
+
+        yield SimpleNamespace(choices = [ SimpleNamespace(delta = SimpleNamespace(content = None), finish_reason = 'stop') ])
+
+    async def close(self):
+        self.closed = True
+
+class FakeAsyncCompletions(FakeCompletions):
+    async def create(self, model: str, messages: list, max_tokens: int = 1024, stream: bool = False, **kwargs):
+        # the same answers as the threaded client, waiting on the event loop instead of blocking a thread
+        self.client.calls += 1
+        words = self.client.answer(model, messages, max_tokens).split(' ')
+        pieces = [ word if index == 0 else ' ' + word for index, word in enumerate(words) ]
+
+        if stream:
+            return FakeAsyncStream(pieces, self.client.first_token_latency, self.client.chunk_interval)
+
+        await asyncio.sleep(self.client.first_token_latency + self.client.chunk_interval * (len(pieces) - 1))
+
+        prompt_tokens = sum(len(message['content'].split()) for message in messages)
+
+        return SimpleNamespace(
+            model = model,
+            choices = [ SimpleNamespace(message = SimpleNamespace(role = 'assistant', content = ''.join(pieces)), finish_reason = 'stop') ],
+            usage = SimpleNamespace(prompt_tokens = prompt_tokens, completion_tokens = len(pieces), total_tokens = prompt_tokens + len(pieces))
+        )
+
+class FakeAsyncGroq(FakeGroq):
+    def __init__(self, first_token_latency: float = 0.3, chunk_interval: float = 0.02, words: int = 64):
+        super().__init__(first_token_latency, chunk_interval, words)
+        self.chat = SimpleNamespace(completions = FakeAsyncCompletions(self))
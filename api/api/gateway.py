@@ -0,0 +1,248 @@
+from .singleflight import SingleFlight
+from .summaries import prompt_hash
+from . import telemetry
+import random
+import threading
+import time
+
+RETRY_STATUSES = frozenset([ 408, 409, 429, 500, 502, 503, 504 ])
+RETRY_ERRORS = frozenset([ 'APIConnectionError', 'APITimeoutError' ])
+
+class GatewayError(Exception):
+    pass
+
+class GatewayUnavailable(GatewayError):
+    pass
+
+class GatewayTimeout(GatewayError):
+    pass
+
+def retryable(error: Exception) -> bool:
+    status = getattr(error, 'status_code', None)
+
+    if status is not None:
+        return status in RETRY_STATUSES
+
+    return type(error).__name__ in RETRY_ERRORS or isinstance(error, (TimeoutError, ConnectionError))
+
+def retry_after(error: Exception) -> float | None:
+    response = getattr(error, 'response', None)
+
+    try:
+        return float(response.headers.get('retry-after'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+class CircuitBreaker:
+    def __init__(self, threshold: int = 5, reset_timeout: float = 30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self._state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = 'half-open'
+                self._probing = False
+
+            if self._state == 'closed':
+                return True
+
+            # half-open lets one probe through, everybody else keeps failing fast until it succeeds
+            if self._state == 'half-open' and not self._probing:
+                self._probing = True
+                return True
+
+            return False
+
+    def success(self):
+        with self._lock:
+            self._state = 'closed'
+            self._failures = 0
+            self._probing = False
+
+    def cancel(self):
+        with self._lock:
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+
+            if self._state == 'half-open' or self._failures >= self.threshold:
+                self._state = 'open'
+                self._opened_at = time.monotonic()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+class AIGateway:
+    def __init__(
+        self,
+        client,
+        max_concurrency: int = 8,
+        queue_timeout: float = 2.0,
+        deadline: float = 30.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.25,
+        backoff_cap: float = 4.0,
+        breaker: CircuitBreaker | None = None,
+        flights: SingleFlight | None = None
+    ):
+        self.client = client
+        self.queue_timeout = queue_timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.flights = flights if flights is not None else SingleFlight()
+
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._max_concurrency = max_concurrency
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._counters = { 'calls': 0, 'retries': 0, 'failures': 0, 'rejected': 0, 'busy': 0, 'timeouts': 0 }
+
+    def _count(self, name: str, delta: int = 1):
+        with self._lock:
+            self._counters[name] += delta
+
+    def _admit(self):
+        if not self.breaker.allow():
+            self._count('rejected')
+            raise GatewayUnavailable('The AI provider is unhealthy')
+
+        if not self._semaphore.acquire(timeout = self.queue_timeout):
+            # the probe slot of a half-open breaker must not be lost because we were too busy to use it
+            self.breaker.cancel()
+            self._count('busy')
+            raise GatewayUnavailable('Too many concurrent AI requests')
+
+        with self._lock:
+            self._in_flight += 1
+
+    def _leave(self):
+        with self._lock:
+            self._in_flight -= 1
+
+        self._semaphore.release()
+
+    def _create(self, deadline: float, **kwargs):
+        attempt = 0
+
+        while True:
+            remaining = deadline - time.monotonic()
+
+            if remaining <= 0:
+                self._count('timeouts')
+                raise GatewayTimeout('The AI provider did not answer in time')
+
+            try:
+                self._count('calls')
+                return self.client.chat.completions.create(timeout = remaining, **kwargs)
+            except Exception as error:
+                if not retryable(error):
+                    raise
+
+                if attempt >= self.max_retries:
+                    raise GatewayUnavailable('The AI provider keeps failing') from error
+
+                # full jitter, unless the provider told us how long to wait
+                delay = retry_after(error)
+                delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt)) if delay is None else delay
+
+                if time.monotonic() + delay >= deadline:
+                    self._count('timeouts')
+                    raise GatewayTimeout('The AI provider did not answer in time') from error
+
+                self._count('retries')
+                attempt += 1
+                time.sleep(delay)
+
+    def _guarded(self, function):
+        try:
+            result = function()
+        except (GatewayUnavailable, GatewayTimeout):
+            self._count('failures')
+            self.breaker.failure()
+            raise
+        except Exception:
+            # a request the provider rejected as invalid says nothing about its health
+            self.breaker.success()
+            raise
+
+        self.breaker.success()
+
+        return result
+
+    def complete(self, model: str, messages: list, max_tokens: int) -> str:
+        def create() -> str:
+            self._admit()
+            start = time.perf_counter()
+
+            try:
+                completion = self._guarded(lambda: self._create(
+                    time.monotonic() + self.deadline,
+                    model = model,
+                    messages = messages,
+                    max_tokens = max_tokens
+                ))
+            finally:
+                self._leave()
+
+            telemetry.record_completion(model, time.perf_counter() - start, getattr(completion, 'usage', None))
+
+            return completion.choices[0].message.content
+
+        # identical concurrent requests wait on a single upstream completion and share its content
+        return self.flights.do(prompt_hash(model, messages, max_tokens), create)
+
+    def stream(self, model: str, messages: list, max_tokens: int):
+        self._admit()
+        start = time.perf_counter()
+        usage = None
+
+        try:
+            deadline = time.monotonic() + self.deadline
+            upstream = self._guarded(lambda: self._create(
+                deadline,
+                model = model,
+                messages = messages,
+                max_tokens = max_tokens,
+                stream = True
+            ))
+
+            try:
+                for chunk in upstream:
+                    # Groq reports the usage of a stream on its last chunk
+                    usage = getattr(getattr(chunk, 'x_groq', None), 'usage', None) or getattr(chunk, 'usage', None) or usage
+
+                    yield chunk
+
+                    if time.monotonic() > deadline:
+                        self._count('timeouts')
+                        raise GatewayTimeout('The AI provider did not finish in time')
+            finally:
+                upstream.close()
+        finally:
+            self._leave()
+            telemetry.record_completion(model, time.perf_counter() - start, usage)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(
+                self._counters,
+                in_flight = self._in_flight,
+                max_concurrency = self._max_concurrency,
+                breaker = self.breaker.state,
+                flights = self.flights.stats()
+            )
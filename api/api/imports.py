@@ -0,0 +1,90 @@
+from .queries import execute, executemany
+from .validation import ERRORS, check_columns
+from . import bookstats
+import csv
+import time
+
+FIELDS = [ 'title', 'author', 'publication_year', 'price', 'currency', 'genre', 'description' ]
+
+def read_books(file) -> iter:
+    # one row at a time, the file is never fully loaded; empty cells count as missing values
+    for line, row in enumerate(csv.DictReader(file), start = 2):
+        yield line, { field: row.get(field) or None for field in FIELDS }
+
+def changed_genres(cursor, books: list[tuple]) -> list[int]:
+    # ids of the existing books whose genre the upsert of books changes, the only field of a recommendation
+    # prompt it rewrites since title and author are the key; a row matched by the collation but not by
+    # lowercase, whose new genre is unknown here, is counted as changed
+    keys = { (book[0].lower(), book[1].lower()): book[5] for book in books }
+
+    execute(cursor, 'books_genres_by_keys', tuple(value for key in keys for value in key), sql = (
+        'SELECT id, title_lc, author_lc, genre FROM books WHERE (title_lc, author_lc) IN ({}) FOR UPDATE;'.format(
+            ', '.join([ '(%s, %s)' ] * len(keys))
+        )
+    ))
+
+    return [ id for id, title, author, genre in cursor.fetchall() if (title, author) not in keys or keys[(title, author)] != genre ]
+
+def import_books(connection, rows, batch: int = 1000, rejected = None, recommendations = None) -> dict:
+    # books are upserted on (title, author), batch rows per multi-row statement and per transaction;
+    # rows are validated batch at a time, and rejected(line, row, code, error) hears about every invalid one;
+    # with a RecommendationStore, the recommendations of books changing genre are dropped in the same transaction
+    cursor = connection.cursor()
+    read = []
+    pending = []
+    statistics = { 'read': 0, 'written': 0, 'rejected': 0, 'batches': 0 }
+    start = time.perf_counter()
+
+    def flush():
+        if recommendations is not None:
+            recommendations.invalidate_many(cursor, changed_genres(cursor, pending))
+
+        executemany(cursor, 'upsert_book', pending)
+        bookstats.create_by_keys(cursor, list({ (book[0].lower(), book[1].lower()) for book in pending }))
+        # cached /books/show results are keyed on this version
+        execute(cursor, 'version_bump', ('books',))
+        connection.commit()
+
+        statistics['written'] += len(pending)
+        statistics['batches'] += 1
+        pending.clear()
+
+    def validate():
+        codes, books = check_columns({ field: [ row[field] for _, row in read ] for field in FIELDS })
+
+        for (line, row), code, book in zip(read, codes, books):
+            if code is not None:
+                statistics['rejected'] += 1
+
+                if rejected is not None:
+                    rejected(line, row, code, ERRORS[code])
+
+                continue
+
+            pending.append((*book, row['description']))
+
+            if len(pending) >= batch:
+                flush()
+
+        read.clear()
+
+    try:
+        for line, row in rows:
+            statistics['read'] += 1
+            read.append((line, row))
+
+            if len(read) >= batch:
+                validate()
+
+        if len(read) > 0:
+            validate()
+
+        if len(pending) > 0:
+            flush()
+    finally:
+        cursor.close()
+
+    statistics['seconds'] = time.perf_counter() - start
+    statistics['rows_per_second'] = statistics['read'] / statistics['seconds'] if statistics['seconds'] > 0 else 0.0
+
+    return statistics
@@ -0,0 +1,27 @@
+import os
+import threading
+
+class Lazy:
+    # stands for the object built by factory on first attribute access; a process forked after it was built
+    # builds its own, so that clients holding sockets or threads are never shared with the parent
+    def __init__(self, factory):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._value = None
+        self._pid = None
+
+    def get(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._value = self._factory()
+                    self._pid = os.getpid()
+
+        return self._value
+
+    @property
+    def built(self) -> bool:
+        return self._pid == os.getpid()
+
+    def __getattr__(self, name: str):
+        return getattr(self.get(), name)
@@ -0,0 +1,20 @@
+import base64
+import json
+
+# continuation tokens are opaque to clients, they carry the sort key of the last row served and the ordering it belongs to
+
+def encode_token(ordering: str, values: list) -> str:
+    payload = json.dumps({ 'o': ordering, 'v': values }, separators = (',', ':'), default = str)
+
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_token(token: str, ordering: str) -> list:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode('utf-8'))
+    except ValueError:
+        raise ValueError('Malformed page token')
+
+    if not isinstance(payload, dict) or payload.get('o') != ordering or not isinstance(payload.get('v'), list):
+        raise ValueError('Page token does not match the requested ordering')
+
+    return payload['v']
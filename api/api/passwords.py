@@ -0,0 +1,203 @@
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from .cache import LRUCache
+import hashlib
+import hmac
+import os
+import threading
+import time
+
+class HasherBusy(Exception):
+    pass
+
+def _derive(method: str, params: tuple, password: str, salt: bytes) -> bytes:
+    # runs inside the worker processes, it must stay a module level function so that it can be pickled
+    if method == 'scrypt':
+        n, r, p = params
+
+        return hashlib.scrypt(password.encode('utf-8'), salt = salt, n = n, r = r, p = p, maxmem = 256 * n * r * p, dklen = 32)
+
+    if method == 'pbkdf2_sha256':
+        return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, params[0], dklen = 32)
+
+    raise ValueError('Unknown password hashing method {}'.format(method))
+
+def _encode(method: str, params: tuple, salt: bytes, digest: bytes) -> str:
+    return '${}${}${}${}'.format(method, ','.join(str(value) for value in params), salt.hex(), digest.hex())
+
+def _decode(stored: str) -> tuple[str, tuple, bytes, bytes] | None:
+    parts = stored.split('$')
+
+    if len(parts) != 5 or parts[0] != '':
+        return None
+
+    try:
+        return parts[1], tuple(int(value) for value in parts[2].split(',')), bytes.fromhex(parts[3]), bytes.fromhex(parts[4])
+    except ValueError:
+        return None
+
+def legacy(stored: str) -> bool:
+    # accounts created before salted hashes store a bare hex sha256 of the password
+    return len(stored) == 64 and all(character in '0123456789abcdef' for character in stored)
+
+class PasswordHasher:
+    def __init__(
+        self,
+        method: str = 'scrypt',
+        scrypt_n: int = 2 ** 14,
+        scrypt_r: int = 8,
+        scrypt_p: int = 1,
+        pbkdf2_iterations: int = 600000,
+        workers: int | None = None,
+        queue_size: int | None = None,
+        timeout: float = 5.0
+    ):
+        if method not in [ 'scrypt', 'pbkdf2_sha256' ]:
+            raise ValueError('Invalid password hashing method, it must be scrypt or pbkdf2_sha256')
+
+        self.method = method
+        self.params = (scrypt_n, scrypt_r, scrypt_p) if method == 'scrypt' else (pbkdf2_iterations,)
+        # zero workers hashes on the calling thread, which is only meant for scripts and benchmarks
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.timeout = timeout
+
+        # hashes waiting for or running on a worker, beyond that a login is refused instead of queued
+        self._slots = threading.BoundedSemaphore(queue_size or max(self.workers, 1) * 4)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._hashed = 0
+        self._rejected = 0
+        self._rehashed = 0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        # created on first use and again after a fork, a pool inherited from the parent has no workers
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers = self.workers)
+                self._pid = os.getpid()
+
+            return self._executor
+
+    def _run(self, method: str, params: tuple, password: str, salt: bytes) -> bytes:
+        if self.workers < 1:
+            derived = _derive(method, params, password, salt)
+        else:
+            derived = self._submit(method, params, password, salt)
+
+        with self._lock:
+            self._hashed += 1
+
+        return derived
+
+    def _submit(self, method: str, params: tuple, password: str, salt: bytes) -> bytes:
+        if not self._slots.acquire(timeout = self.timeout):
+            with self._lock:
+                self._rejected += 1
+
+            raise HasherBusy()
+
+        try:
+            future = self._pool().submit(_derive, method, params, password, salt)
+        except BaseException:
+            self._slots.release()
+            raise
+
+        # the slot is held until the derivation really ends, a request that stopped waiting does not free a
+        # worker still busy with its hash
+        future.add_done_callback(lambda _: self._slots.release())
+
+        try:
+            return future.result(timeout = self.timeout)
+        except FutureTimeout:
+            # a derivation still queued never starts, one already running finishes and frees its slot then
+            future.cancel()
+
+            with self._lock:
+                self._rejected += 1
+
+            raise HasherBusy()
+
+    def hash(self, password: str) -> str:
+        salt = os.urandom(16)
+
+        return _encode(self.method, self.params, salt, self._run(self.method, self.params, password, salt))
+
+    def verify(self, password: str, stored: str) -> tuple[bool, bool]:
+        # returns whether the password matches and whether the stored hash should be replaced by a current one
+        if legacy(stored):
+            return hmac.compare_digest(hashlib.sha256(password.encode('utf-8')).hexdigest(), stored), True
+
+        decoded = _decode(stored)
+
+        if decoded is None:
+            return False, False
+
+        method, params, salt, digest = decoded
+
+        try:
+            derived = self._run(method, params, password, salt)
+        except ValueError:
+            return False, False
+
+        return hmac.compare_digest(derived, digest), method != self.method or params != self.params
+
+    def rehashed(self):
+        with self._lock:
+            self._rehashed += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'method': self.method,
+                'params': list(self.params),
+                'workers': self.workers,
+                'hashed': self._hashed,
+                'rejected': self._rejected,
+                'rehashed': self._rehashed
+            }
+
+class AttemptLimiter:
+    # token buckets per email and per client address, refilled continuously over the window
+    def __init__(self, attempts: int = 10, address_attempts: int = 100, window: float = 60.0, maxsize: int = 100000):
+        self.attempts = attempts
+        self.address_attempts = address_attempts
+        self.window = window
+
+        # an idle bucket is full again after one window, so it can simply expire
+        self._buckets = LRUCache(maxsize = maxsize, ttl = window)
+        self._lock = threading.Lock()
+        self._limited = 0
+
+    def _take(self, key: tuple, capacity: int, now: float) -> float | None:
+        tokens, updated = self._buckets.get(key, (float(capacity), now))
+        tokens = min(float(capacity), tokens + (now - updated) * capacity / self.window)
+
+        if tokens < 1.0:
+            return (1.0 - tokens) * self.window / capacity
+
+        self._buckets.put(key, (tokens - 1.0, now))
+
+        return None
+
+    def allow(self, email: str, address: str | None) -> float | None:
+        # returns None when the attempt may proceed, otherwise the number of seconds to wait
+        now = time.monotonic()
+
+        with self._lock:
+            wait = self._take(('email', email.lower()), self.attempts, now)
+
+            if wait is None and address is not None:
+                wait = self._take(('address', address), self.address_attempts, now)
+
+            if wait is not None:
+                self._limited += 1
+
+            return wait
+
+    def reset(self, email: str):
+        # a successful login gives the account its full allowance back, the address keeps its count
+        self._buckets.pop(('email', email.lower()))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._buckets.stats(), limited = self._limited)
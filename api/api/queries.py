@@ -0,0 +1,100 @@
+from . import telemetry
+import threading
+import time
+
+# named statements shared by every blueprint, parameters are always bound by the driver and never formatted into the text
+STATEMENTS = {
+    'book_by_id': 'SELECT id, title, author, publication_year, price, currency, genre FROM books WHERE id=%s;',
+    'book_by_title_author': 'SELECT id FROM books WHERE title_lc=%s AND author_lc=%s LIMIT 1;',
+    'insert_book': 'INSERT INTO books (title, author, publication_year, price, currency, genre, description) VALUES(%s, %s, %s, %s, %s, %s, %s);',
+    'upsert_book': 'INSERT INTO books (title, author, publication_year, price, currency, genre, description) VALUES(%s, %s, %s, %s, %s, %s, %s) ON DUPLICATE KEY UPDATE publication_year=VALUES(publication_year), price=VALUES(price), currency=VALUES(currency), genre=VALUES(genre), description=VALUES(description);',
+    'book_document': 'SELECT id, title, author, genre, description FROM books WHERE id=%s;',
+    'book_documents': 'SELECT id, title, author, genre, description FROM books;',
+    'delete_book': 'DELETE FROM books WHERE id=%s;',
+    'insert_review': 'INSERT INTO reviews (email, bookid, n_stars, content) VALUES(%s, %s, %s, %s);',
+    'reviews_by_book': 'SELECT email, n_stars, content, creation_timestamp FROM reviews WHERE bookid=%s ORDER BY creation_timestamp DESC, email DESC LIMIT %s;',
+    'reviews_by_book_after': 'SELECT email, n_stars, content, creation_timestamp FROM reviews WHERE bookid=%s AND (creation_timestamp < %s OR (creation_timestamp = %s AND email < %s)) ORDER BY creation_timestamp DESC, email DESC LIMIT %s;',
+    'reviewed_books_by_user': 'SELECT bookid FROM reviews WHERE email=%s;',
+    'user_by_email': 'SELECT email, password FROM users WHERE email=%s;',
+    'insert_user': 'INSERT INTO users (email, password) VALUES(%s, %s);',
+    'update_user_password': 'UPDATE users SET password=%s WHERE email=%s;',
+    'session_lookup': 'SELECT email, token, TIMESTAMPDIFF(SECOND, NOW(), creation_timestamp + INTERVAL %s SECOND) FROM sessions WHERE email=%s AND token=%s AND creation_timestamp > NOW() - INTERVAL %s SECOND;',
+    'insert_session': 'INSERT INTO sessions (email, token) VALUES(%s, %s);',
+    'delete_session': 'DELETE FROM sessions WHERE email=%s AND token=%s;',
+    'sessions_by_user': 'SELECT token FROM sessions WHERE email=%s ORDER BY creation_timestamp DESC, token DESC;',
+    'sessions_delete_expired': 'DELETE FROM sessions WHERE creation_timestamp < NOW() - INTERVAL %s SECOND ORDER BY creation_timestamp LIMIT %s;',
+    'summary_lookup': 'SELECT content FROM summaries WHERE bookid=%s AND prompt_hash=%s AND creation_timestamp > NOW() - INTERVAL %s SECOND;',
+    'summary_upsert': 'INSERT INTO summaries (bookid, prompt_hash, model, content) VALUES(%s, %s, %s, %s) ON DUPLICATE KEY UPDATE content=VALUES(content), creation_timestamp=CURRENT_TIMESTAMP;',
+    'summaries_delete_by_book': 'DELETE FROM summaries WHERE bookid=%s;',
+    'recommendation_upsert': 'INSERT INTO recommendations (profile_key, bookid, score, rationale) VALUES(%s, %s, %s, %s) ON DUPLICATE KEY UPDATE score=VALUES(score), rationale=VALUES(rationale), creation_timestamp=CURRENT_TIMESTAMP;',
+    'books_unscored': 'SELECT books.id, books.title, books.author, books.genre FROM books LEFT JOIN recommendations ON recommendations.profile_key=%s AND recommendations.bookid=books.id WHERE recommendations.bookid IS NULL ORDER BY books.id LIMIT %s;',
+    'recommendations_top': 'SELECT books.id, books.title, books.author, books.publication_year, books.price, books.currency, books.genre, recommendations.score, recommendations.rationale FROM recommendations JOIN books ON books.id=recommendations.bookid WHERE recommendations.profile_key=%s ORDER BY recommendations.score DESC, books.id ASC LIMIT %s;',
+    'recommendations_delete_by_book': 'DELETE FROM recommendations WHERE bookid=%s;',
+    'book_stats_review': 'INSERT INTO book_stats (bookid, review_count, stars_total, stars_0, stars_1, stars_2, stars_3, stars_4, stars_5, last_review) VALUES(%s, 1, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP) ON DUPLICATE KEY UPDATE review_count=review_count+1, stars_total=stars_total+VALUES(stars_total), stars_0=stars_0+VALUES(stars_0), stars_1=stars_1+VALUES(stars_1), stars_2=stars_2+VALUES(stars_2), stars_3=stars_3+VALUES(stars_3), stars_4=stars_4+VALUES(stars_4), stars_5=stars_5+VALUES(stars_5), last_review=CURRENT_TIMESTAMP;',
+    'book_stats_create': 'INSERT IGNORE INTO book_stats (bookid) VALUES(%s);',
+    'book_stats_by_book': 'SELECT review_count, stars_total, rating, last_review, stars_0, stars_1, stars_2, stars_3, stars_4, stars_5 FROM book_stats WHERE bookid=%s;',
+    'books_id_range': 'SELECT MIN(id), MAX(id) FROM books;',
+    'book_stats_rebuild': 'INSERT INTO book_stats (bookid, review_count, stars_total, stars_0, stars_1, stars_2, stars_3, stars_4, stars_5, last_review) SELECT books.id, COUNT(reviews.bookid), COALESCE(SUM(reviews.n_stars), 0), COALESCE(SUM(reviews.n_stars=0), 0), COALESCE(SUM(reviews.n_stars=1), 0), COALESCE(SUM(reviews.n_stars=2), 0), COALESCE(SUM(reviews.n_stars=3), 0), COALESCE(SUM(reviews.n_stars=4), 0), COALESCE(SUM(reviews.n_stars=5), 0), MAX(reviews.creation_timestamp) FROM books LEFT JOIN reviews ON reviews.bookid=books.id WHERE books.id >= %s AND books.id < %s GROUP BY books.id ON DUPLICATE KEY UPDATE review_count=VALUES(review_count), stars_total=VALUES(stars_total), stars_0=VALUES(stars_0), stars_1=VALUES(stars_1), stars_2=VALUES(stars_2), stars_3=VALUES(stars_3), stars_4=VALUES(stars_4), stars_5=VALUES(stars_5), last_review=VALUES(last_review);',
+    'book_stats_orphans': 'DELETE book_stats FROM book_stats LEFT JOIN books ON books.id=book_stats.bookid WHERE books.id IS NULL;',
+    'version_bump': 'INSERT INTO versions (name, version) VALUES(%s, 1) ON DUPLICATE KEY UPDATE version=version+1, modified=CURRENT_TIMESTAMP;'
+}
+
+_lock = threading.Lock()
+_statistics = {}
+
+def _record(name: str, elapsed: float, failed: bool):
+    with _lock:
+        entry = _statistics.get(name)
+
+        if entry is None:
+            entry = _statistics[name] = { 'count': 0, 'errors': 0, 'time_total': 0.0, 'time_max': 0.0 }
+
+        entry['count'] += 1
+        entry['errors'] += 1 if failed else 0
+        entry['time_total'] += elapsed
+        entry['time_max'] = max(entry['time_max'], elapsed)
+
+    telemetry.record_statement(name, elapsed, failed)
+
+def execute(cursor, name: str, params: tuple = (), sql: str | None = None):
+    # dynamic statements (filters, partial updates) pass their own text but are still measured under a stable name
+    statement = STATEMENTS[name] if sql is None else sql
+    start = time.perf_counter()
+    failed = True
+
+    try:
+        result = cursor.execute(statement, params)
+        failed = False
+        return result
+    finally:
+        _record(name, time.perf_counter() - start, failed)
+
+def executemany(cursor, name: str, rows: list, sql: str | None = None):
+    # multi-row INSERT statements are rewritten by the driver into a single round trip
+    statement = STATEMENTS[name] if sql is None else sql
+    start = time.perf_counter()
+    failed = True
+
+    try:
+        result = cursor.executemany(statement, rows)
+        failed = False
+        return result
+    finally:
+        _record(name, time.perf_counter() - start, failed)
+
+def books_by_ids(cursor, ids: list[int]) -> dict:
+    if len(ids) < 1:
+        return {}
+
+    execute(cursor, 'books_by_ids', tuple(ids), sql = 'SELECT id, title, author, publication_year, price, currency, genre FROM books WHERE id IN ({});'.format(
+        ', '.join([ '%s' ] * len(ids))
+    ))
+
+    return { entry[0]: entry for entry in cursor.fetchall() }
+
+def statistics() -> dict:
+    with _lock:
+        return {
+            name: dict(entry, time_avg = entry['time_total'] / entry['count'] if entry['count'] > 0 else 0.0)
+            for name, entry in _statistics.items()
+        }
@@ -0,0 +1,101 @@
+from .queries import execute, executemany
+import hashlib
+import json
+import re
+
+# ages are only meaningful to the model by decade, which also keeps the number of distinct profiles small
+AGE_BUCKET = 10
+
+def normalize_profile(features: dict) -> dict:
+    profile = {}
+
+    for name in [ 'description', 'mood', 'goal' ]:
+        value = features.get(name)
+
+        if isinstance(value, str) and len(value.strip()) > 0:
+            profile[name] = re.sub(r'\s+', ' ', value.strip().lower())
+
+    if isinstance(features.get('age'), int):
+        bucket = features['age'] // AGE_BUCKET * AGE_BUCKET
+        profile['age'] = '{}-{}'.format(bucket, bucket + AGE_BUCKET - 1)
+
+    return profile
+
+def profile_key(profile: dict) -> str:
+    return hashlib.sha256(json.dumps(profile, sort_keys = True).encode('utf-8')).hexdigest()
+
+def scoring_messages(profile: dict, books: list[tuple]) -> list:
+    return [
+        {
+            'role': 'system',
+            'content': 'You rate how well books suit a reader with these features: {}. Answer only with a JSON object.'.format(
+                json.dumps(profile, sort_keys = True)
+            )
+        },
+        {
+            'role': 'user',
+            'content': 'For each of the following books give an integer score from 0 to 100 of how much it aligns with me and a one sentence rationale. Answer with a JSON object mapping each book number to {{"score": <integer>, "rationale": <string>}}.\n{}'.format(
+                '\n'.join(describe_book(book) for book in books)
+            )
+        }
+    ]
+
+def describe_book(book: tuple) -> str:
+    id, title, author, genre = book
+
+    return '{}: {} from {} of genre {}'.format(id, title, author, genre)
+
+def parse_score(value) -> tuple[int, str] | None:
+    if not isinstance(value, dict):
+        return None
+
+    score = value.get('score')
+    rationale = value.get('rationale')
+
+    if isinstance(score, float) and score.is_integer():
+        score = int(score)
+
+    if not isinstance(score, int) or isinstance(score, bool) or score < 0 or score > 100 or not isinstance(rationale, str):
+        return None
+
+    return score, rationale.strip()[:512]
+
+class RecommendationStore:
+    def get_many(self, cursor, key: str, ids: list[int]) -> dict:
+        if len(ids) < 1:
+            return {}
+
+        execute(cursor, 'recommendations_by_books', (key, *ids), sql = 'SELECT bookid, score, rationale FROM recommendations WHERE profile_key=%s AND bookid IN ({});'.format(
+            ', '.join([ '%s' ] * len(ids))
+        ))
+
+        return { bookid: (score, rationale) for bookid, score, rationale in cursor.fetchall() }
+
+    def put_many(self, cursor, key: str, scores: dict):
+        if len(scores) < 1:
+            return
+
+        executemany(cursor, 'recommendation_upsert', [ (key, bookid, score, rationale) for bookid, (score, rationale) in scores.items() ])
+        cursor.connection.commit()
+
+    def unscored(self, cursor, key: str, limit: int) -> list[tuple]:
+        execute(cursor, 'books_unscored', (key, limit))
+
+        return list(cursor.fetchall())
+
+    def top(self, cursor, key: str, count: int) -> list[tuple]:
+        execute(cursor, 'recommendations_top', (key, count))
+
+        return list(cursor.fetchall())
+
+    def invalidate(self, cursor, bookid: int):
+        # runs inside the caller's transaction, which is committed together with the book change
+        execute(cursor, 'recommendations_delete_by_book', (bookid,))
+
+    def invalidate_many(self, cursor, bookids: list[int]):
+        if len(bookids) < 1:
+            return
+
+        execute(cursor, 'recommendations_delete_by_books', tuple(bookids), sql = 'DELETE FROM recommendations WHERE bookid IN ({});'.format(
+            ', '.join([ '%s' ] * len(bookids))
+        ))
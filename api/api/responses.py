@@ -0,0 +1,142 @@
+from flask import current_app, request
+from werkzeug.http import http_date
+from . import telemetry
+import datetime
+import decimal
+import gzip
+import json
+import time
+import zlib
+
+# both are optional, without them responses fall back to the standard library encoder and to gzip only
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ENCODINGS = [ 'br', 'gzip' ] if brotli is not None else [ 'gzip' ]
+
+def _default(value):
+    # the same representation as the default Flask provider, so switching encoders does not change any payload
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return http_date(value)
+
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(value).__name__))
+
+def encode(value) -> bytes:
+    start = time.perf_counter()
+
+    if orjson is not None:
+        data = orjson.dumps(value, default = _default, option = orjson.OPT_PASSTHROUGH_DATETIME)
+    else:
+        data = json.dumps(value, default = _default, separators = (',', ':')).encode('utf-8')
+
+    telemetry.record_encoding(time.perf_counter() - start)
+
+    return data
+
+def _rows(columns: list[str], rows, columnar: bool):
+    # columnar rows are encoded straight from the tuples returned by the driver, without a dict per row
+    if columnar:
+        return rows
+
+    return [ dict(zip(columns, row)) for row in rows ]
+
+def _chunks(columns: list[str], rows, columnar: bool, size: int = 1000):
+    yield b'['
+
+    for start in range(0, len(rows), size):
+        # each chunk is a complete JSON array, its brackets are replaced by the separators of the whole one
+        chunk = encode(_rows(columns, rows[start:start + size], columnar))
+
+        yield (b',' if start > 0 else b'') + chunk[1:-1]
+
+    yield b']'
+
+def json_response(payload, status: int = 200):
+    return current_app.response_class(encode(payload), status = status, mimetype = 'application/json')
+
+def rows_response(columns: list[str], rows, envelope: dict | None = None, key: str | None = None, status: int = 200):
+    # format=columnar answers {"columns": [...], "rows": [[...]]} in place of a list of objects
+    columnar = request.args.get('format') == 'columnar'
+
+    if len(rows) > 0 and len(rows[0]) != len(columns):
+        rows = [ row[:len(columns)] for row in rows ]
+
+    if len(rows) <= current_app.config.get('RESPONSE_STREAM_ROWS', 5000):
+        body = { 'columns': columns, 'rows': rows } if columnar else _rows(columns, rows, False)
+
+        return json_response(body if envelope is None else dict(envelope, **{ key: body }), status)
+
+    # very large pages are encoded while they are sent instead of being built as one buffer first
+    head = [ b'{"columns":', encode(columns), b',"rows":' ] if columnar else []
+    tail = [ b'}' ] if columnar else []
+
+    if envelope is not None:
+        head = [ encode(envelope)[:-1], b',' if len(envelope) > 0 else b'', encode(key), b':' ] + head
+        tail = tail + [ b'}' ]
+
+    def generate():
+        yield from head
+        yield from _chunks(columns, rows, columnar)
+        yield from tail
+
+    return current_app.response_class(generate(), status = status, mimetype = 'application/json')
+
+def _compressor(encoding: str, level: int):
+    if encoding == 'br':
+        return brotli.Compressor(quality = min(level, 11))
+
+    # wbits 31 writes the gzip header and trailer around the deflate stream
+    return zlib.compressobj(level, zlib.DEFLATED, 31)
+
+def _stream(iterable, encoding: str, level: int):
+    compressor = _compressor(encoding, level)
+
+    for chunk in iterable:
+        data = compressor.process(chunk) if encoding == 'br' else compressor.compress(chunk)
+
+        if data:
+            yield data
+
+    yield compressor.finish() if encoding == 'br' else compressor.flush()
+
+def compress(response):
+    # after_request hook, JSON bodies only: event streams must reach the client as soon as each event is written
+    if response.status_code < 200 or response.status_code in [ 204, 304 ] or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(ENCODINGS)
+    level = current_app.config.get('RESPONSE_COMPRESS_LEVEL', 6)
+
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _stream(response.response, encoding, level)
+    else:
+        data = response.get_data()
+
+        if len(data) < current_app.config.get('RESPONSE_COMPRESS_MIN_SIZE', 1024):
+            return response
+
+        response.set_data(brotli.compress(data, quality = min(level, 11)) if encoding == 'br' else gzip.compress(data, compresslevel = level))
+
+    response.headers['Content-Encoding'] = encoding
+
+    # the compressed bytes differ from the identity ones, so the validator can only be a weak one
+    etag, weak = response.get_etag()
+
+    if etag is not None and not weak:
+        response.set_etag(etag, weak = True)
+
+    return response
@@ -0,0 +1,92 @@
+from flask import request
+from werkzeug.http import http_date
+from .cache import LRUCache, MISSING
+from .queries import execute
+import hashlib
+import threading
+
+class ResultCache:
+    # query results keyed by their statement, parameters and the versions of the data they read; a write bumps
+    # the version in the versions table inside its own transaction, so stale entries are simply never looked up again
+    def __init__(self, maxsize: int = 1024, max_rows: int = 1000, version_ttl: float = 1.0):
+        self.max_rows = max_rows
+        self.local = LRUCache(maxsize = maxsize)
+
+        # versions read by this process, a write committed by another worker is seen after at most version_ttl seconds
+        self._versions = LRUCache(maxsize = 4096, ttl = version_ttl) if version_ttl > 0 else None
+        self._lock = threading.Lock()
+        self._not_modified = 0
+
+    def versions(self, cursor, names: list[str]) -> tuple[tuple, float]:
+        found = {}
+
+        if self._versions is not None:
+            for name in names:
+                value = self._versions.get(name, MISSING)
+
+                if value is not MISSING:
+                    found[name] = value
+
+        missing = [ name for name in names if name not in found ]
+
+        if len(missing) > 0:
+            execute(cursor, 'versions_lookup', tuple(missing), sql = 'SELECT name, version, UNIX_TIMESTAMP(modified) FROM versions WHERE name IN ({});'.format(
+                ', '.join([ '%s' ] * len(missing))
+            ))
+            rows = { name: (int(version), float(modified)) for name, version, modified in cursor.fetchall() }
+
+            for name in missing:
+                # data that was never written since the table was created is at version 0
+                found[name] = rows.get(name, (0, 0.0))
+
+                if self._versions is not None:
+                    self._versions.put(name, found[name])
+
+        return tuple(found[name][0] for name in names), max(found[name][1] for name in names)
+
+    def bump(self, cursor, *names: str):
+        # runs inside the caller's transaction, the new version becomes visible together with the write
+        for name in names:
+            execute(cursor, 'version_bump', (name,))
+
+            if self._versions is not None:
+                self._versions.pop(name)
+
+    def etag(self, *key) -> str:
+        return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:20]
+
+    def not_modified(self, etag: str, modified: float) -> bool:
+        # If-None-Match takes precedence over If-Modified-Since and uses the weak comparison, as in RFC 9110,
+        # so that the validator of a compressed response matches too
+        if request.if_none_match:
+            fresh = request.if_none_match.contains_weak(etag)
+        else:
+            fresh = request.if_modified_since is not None and modified > 0 and int(modified) <= request.if_modified_since.timestamp()
+
+        if fresh:
+            with self._lock:
+                self._not_modified += 1
+
+        return fresh
+
+    def tag(self, response, etag: str, modified: float):
+        response.set_etag(etag)
+        # clients may keep the body but must revalidate it, which costs a version lookup instead of the query
+        response.headers['Cache-Control'] = 'no-cache'
+
+        if modified > 0:
+            response.headers['Last-Modified'] = http_date(int(modified))
+
+        return response
+
+    def get(self, key):
+        return self.local.get(key, MISSING)
+
+    def put(self, key, rows):
+        # very large pages would push out many small ones for little gain
+        if len(rows) <= self.max_rows:
+            self.local.put(key, rows)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.local.stats(), not_modified = self._not_modified)
@@ -1,30 +1,231 @@
-from flask import Flask
+from flask import Flask, jsonify
 from flask_cors import CORS
-from flask_mysqldb import MySQL
-from groq import Groq
+from .ai import api_ai
+from .auth import api_auth
+from .books import api_books
+from .database import Database, PoolTimeout
+from .gateway import AIGateway, CircuitBreaker, GatewayTimeout, GatewayUnavailable
+from .lazy import Lazy
+from .passwords import AttemptLimiter, HasherBusy, PasswordHasher
+from .recommendations import RecommendationStore
+from .responses import compress
+from .resultcache import ResultCache
+from .sessions import SessionStore, SessionSweeper
+from .singleflight import SingleFlight
+from .summaries import SummaryCache
+from . import queries, telemetry
 import os
 
-ai = Groq(api_key = os.getenv('GROQ_API_KEY'))
-api = Flask(__name__)
+def ai_client():
+    # imported on first use, the Groq SDK and its dependencies cost more to import than the rest of the application
+    if os.getenv('AI_BACKEND', 'groq') == 'fake':
+        from .fakeai import FakeGroq
 
-CORS(api)
+        return FakeGroq(
+            first_token_latency = float(os.getenv('FAKE_AI_FIRST_TOKEN_LATENCY', 0.3)),
+            chunk_interval = float(os.getenv('FAKE_AI_CHUNK_INTERVAL', 0.02))
+        )
 
-api.config['MYSQL_HOST'] = 'localhost'
-api.config['MYSQL_USER'] = 'root'
-api.config['MYSQL_PASSWORD'] = ''
-api.config['MYSQL_DB'] = 'bookdb'
-api.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
+    from groq import Groq
 
-db = MySQL(api)
+    # retries and timeouts are owned by the gateway, the client must not add its own
+    return Groq(api_key = os.getenv('GROQ_API_KEY'), base_url = os.getenv('GROQ_BASE_URL'), max_retries = 0)
 
-api.config['db'] = db
-api.config['ai'] = ai
+def vector_index(directory: str):
+    # numpy is only imported by the first request needing the semantic search
+    from .embeddings import VectorIndex
+
+    return VectorIndex(directory)
+
+def create_app() -> Flask:
+    api = Flask(__name__)
+
+    CORS(api, expose_headers = [ 'X-Next-Page-Token', 'ETag', 'Last-Modified' ])
+
+    api.config['MYSQL_HOST'] = os.getenv('MYSQL_HOST', 'localhost')
+    api.config['MYSQL_PORT'] = int(os.getenv('MYSQL_PORT', 3306))
+    api.config['MYSQL_USER'] = os.getenv('MYSQL_USER', 'root')
+    api.config['MYSQL_PASSWORD'] = os.getenv('MYSQL_PASSWORD', '')
+    api.config['MYSQL_DB'] = os.getenv('MYSQL_DB', 'bookdb')
+    api.config['MYSQL_REPLICAS'] = [ endpoint.strip() for endpoint in os.getenv('MYSQL_REPLICAS', '').split(',') if endpoint.strip() ]
+    api.config['MYSQL_REPLICA_EJECT_TIME'] = float(os.getenv('MYSQL_REPLICA_EJECT_TIME', 30.0))
+    api.config['MYSQL_STICKY_WINDOW'] = float(os.getenv('MYSQL_STICKY_WINDOW', 5.0))
+    api.config['MYSQL_POOL_MIN_SIZE'] = int(os.getenv('MYSQL_POOL_MIN_SIZE', 1))
+    api.config['MYSQL_POOL_MAX_SIZE'] = int(os.getenv('MYSQL_POOL_MAX_SIZE', 10))
+    api.config['MYSQL_POOL_TIMEOUT'] = float(os.getenv('MYSQL_POOL_TIMEOUT', 5.0))
+    api.config['MYSQL_POOL_PING_INTERVAL'] = float(os.getenv('MYSQL_POOL_PING_INTERVAL', 0.0))
+    api.config['SUMMARY_CACHE_SIZE'] = int(os.getenv('SUMMARY_CACHE_SIZE', 1024))
+    api.config['SUMMARY_CACHE_TTL'] = float(os.getenv('SUMMARY_CACHE_TTL', 7 * 24 * 3600))
+    api.config['AI_SINGLEFLIGHT_LOCK_DIR'] = os.getenv('AI_SINGLEFLIGHT_LOCK_DIR')
+    api.config['AI_SINGLEFLIGHT_RESULT_TTL'] = float(os.getenv('AI_SINGLEFLIGHT_RESULT_TTL', 5.0))
+    api.config['AI_MAX_CONCURRENCY'] = int(os.getenv('AI_MAX_CONCURRENCY', 8))
+    api.config['AI_ASYNC_MAX_CONCURRENCY'] = int(os.getenv('AI_ASYNC_MAX_CONCURRENCY', 256))
+    api.config['AI_QUEUE_TIMEOUT'] = float(os.getenv('AI_QUEUE_TIMEOUT', 2.0))
+    api.config['AI_DEADLINE'] = float(os.getenv('AI_DEADLINE', 30.0))
+    api.config['AI_MAX_RETRIES'] = int(os.getenv('AI_MAX_RETRIES', 3))
+    api.config['AI_BREAKER_THRESHOLD'] = int(os.getenv('AI_BREAKER_THRESHOLD', 5))
+    api.config['AI_BREAKER_RESET'] = float(os.getenv('AI_BREAKER_RESET', 30.0))
+    api.config['RESULT_CACHE_SIZE'] = int(os.getenv('RESULT_CACHE_SIZE', 1024))
+    api.config['RESULT_CACHE_MAX_ROWS'] = int(os.getenv('RESULT_CACHE_MAX_ROWS', 1000))
+    api.config['RESULT_CACHE_VERSION_TTL'] = float(os.getenv('RESULT_CACHE_VERSION_TTL', 1.0))
+    api.config['RESPONSE_STREAM_ROWS'] = int(os.getenv('RESPONSE_STREAM_ROWS', 5000))
+    api.config['RESPONSE_COMPRESS_MIN_SIZE'] = int(os.getenv('RESPONSE_COMPRESS_MIN_SIZE', 1024))
+    api.config['RESPONSE_COMPRESS_LEVEL'] = int(os.getenv('RESPONSE_COMPRESS_LEVEL', 6))
+    api.config['PROFILE_SLOW_REQUESTS'] = float(os.getenv('PROFILE_SLOW_REQUESTS', 0.0))
+    api.config['PROFILE_INTERVAL'] = float(os.getenv('PROFILE_INTERVAL', 0.005))
+    api.config['PROFILE_DIR'] = os.getenv('PROFILE_DIR', os.path.join(os.path.dirname(__file__), '..', 'data', 'profiles'))
+    api.config['EMBEDDINGS_DIR'] = os.getenv('EMBEDDINGS_DIR', os.path.join(os.path.dirname(__file__), '..', 'data', 'embeddings'))
+    api.config['SESSION_CACHE_SIZE'] = int(os.getenv('SESSION_CACHE_SIZE', 10000))
+    api.config['SESSION_CACHE_TTL'] = float(os.getenv('SESSION_CACHE_TTL', 60.0))
+    api.config['SESSION_LIFETIME'] = float(os.getenv('SESSION_LIFETIME', 7 * 24 * 3600))
+    api.config['SESSION_MAX_PER_USER'] = int(os.getenv('SESSION_MAX_PER_USER', 10))
+    api.config['SESSION_SWEEP_INTERVAL'] = float(os.getenv('SESSION_SWEEP_INTERVAL', 300.0))
+    api.config['SESSION_SWEEP_BATCH'] = int(os.getenv('SESSION_SWEEP_BATCH', 1000))
+    api.config['PASSWORD_HASH'] = os.getenv('PASSWORD_HASH', 'scrypt')
+    api.config['PASSWORD_SCRYPT_N'] = int(os.getenv('PASSWORD_SCRYPT_N', 2 ** 14))
+    api.config['PASSWORD_SCRYPT_R'] = int(os.getenv('PASSWORD_SCRYPT_R', 8))
+    api.config['PASSWORD_SCRYPT_P'] = int(os.getenv('PASSWORD_SCRYPT_P', 1))
+    api.config['PASSWORD_PBKDF2_ITERATIONS'] = int(os.getenv('PASSWORD_PBKDF2_ITERATIONS', 600000))
+    api.config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+    api.config['PASSWORD_HASH_TIMEOUT'] = float(os.getenv('PASSWORD_HASH_TIMEOUT', 5.0))
+    api.config['LOGIN_ATTEMPTS'] = int(os.getenv('LOGIN_ATTEMPTS', 10))
+    api.config['LOGIN_ADDRESS_ATTEMPTS'] = int(os.getenv('LOGIN_ADDRESS_ATTEMPTS', 100))
+    api.config['LOGIN_WINDOW'] = float(os.getenv('LOGIN_WINDOW', 60.0))
+    api.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
+
+    db = Database(api)
+
+    api.config['db'] = db
+    api.config['ai'] = AIGateway(
+        Lazy(ai_client),
+        max_concurrency = api.config['AI_MAX_CONCURRENCY'],
+        queue_timeout = api.config['AI_QUEUE_TIMEOUT'],
+        deadline = api.config['AI_DEADLINE'],
+        max_retries = api.config['AI_MAX_RETRIES'],
+        breaker = CircuitBreaker(threshold = api.config['AI_BREAKER_THRESHOLD'], reset_timeout = api.config['AI_BREAKER_RESET']),
+        flights = SingleFlight(lock_dir = api.config['AI_SINGLEFLIGHT_LOCK_DIR'], result_ttl = api.config['AI_SINGLEFLIGHT_RESULT_TTL'])
+    )
+    api.config['summaries'] = SummaryCache(maxsize = api.config['SUMMARY_CACHE_SIZE'], ttl = api.config['SUMMARY_CACHE_TTL'])
+    api.config['recommendations'] = RecommendationStore()
+    api.config['results'] = ResultCache(
+        maxsize = api.config['RESULT_CACHE_SIZE'],
+        max_rows = api.config['RESULT_CACHE_MAX_ROWS'],
+        version_ttl = api.config['RESULT_CACHE_VERSION_TTL']
+    )
+    api.config['sessions'] = SessionStore(
+        maxsize = api.config['SESSION_CACHE_SIZE'],
+        cache_ttl = api.config['SESSION_CACHE_TTL'],
+        lifetime = api.config['SESSION_LIFETIME'],
+        max_per_user = api.config['SESSION_MAX_PER_USER']
+    )
+    api.config['sweeper'] = SessionSweeper(
+        db.pool,
+        lifetime = api.config['SESSION_LIFETIME'],
+        interval = api.config['SESSION_SWEEP_INTERVAL'],
+        batch = api.config['SESSION_SWEEP_BATCH']
+    )
+    api.config['passwords'] = PasswordHasher(
+        method = api.config['PASSWORD_HASH'],
+        scrypt_n = api.config['PASSWORD_SCRYPT_N'],
+        scrypt_r = api.config['PASSWORD_SCRYPT_R'],
+        scrypt_p = api.config['PASSWORD_SCRYPT_P'],
+        pbkdf2_iterations = api.config['PASSWORD_PBKDF2_ITERATIONS'],
+        workers = api.config['PASSWORD_HASH_WORKERS'],
+        timeout = api.config['PASSWORD_HASH_TIMEOUT']
+    )
+    api.config['attempts'] = AttemptLimiter(
+        attempts = api.config['LOGIN_ATTEMPTS'],
+        address_attempts = api.config['LOGIN_ADDRESS_ATTEMPTS'],
+        window = api.config['LOGIN_WINDOW']
+    )
+    api.config['embeddings'] = Lazy(lambda: vector_index(api.config['EMBEDDINGS_DIR']))
+
+    # a zero interval leaves expired sessions to scripts/sweepsessions.py, e.g. from cron; started by the first
+    # request of each process, so that an application preloaded before a fork still sweeps in every worker
+    if api.config['SESSION_SWEEP_INTERVAL'] > 0:
+        api.before_request(api.config['sweeper'].start)
 
-with api.app_context():
-    from .ai import api_ai
-    from .books import api_books
-    from .auth import api_auth
-    
     api.register_blueprint(api_books, url_prefix = '/books')
     api.register_blueprint(api_ai, url_prefix = '/ai')
-    api.register_blueprint(api_auth, url_prefix = '/auth')
\ No newline at end of file
+    api.register_blueprint(api_auth, url_prefix = '/auth')
+
+    # a threshold of zero disables the sampling profiler, which costs a stack walk per request thread and interval
+    profiler = None
+
+    if api.config['PROFILE_SLOW_REQUESTS'] > 0:
+        profiler = telemetry.Profiler(api.config['PROFILE_DIR'], api.config['PROFILE_SLOW_REQUESTS'], api.config['PROFILE_INTERVAL'])
+
+    # installed first so that its hooks see the compressed body
+    telemetry.install(api, profiler)
+    api.after_request(compress)
+
+    @api.errorhandler(PoolTimeout)
+    def pool_timeout(error):
+        return jsonify({ 'error': 'The database is too busy, please try again later' }), 503
+
+    @api.errorhandler(GatewayUnavailable)
+    def ai_unavailable(error):
+        return jsonify({ 'error': 'The assistant is temporarily unavailable, please try again later' }), 503
+
+    @api.errorhandler(GatewayTimeout)
+    def ai_timeout(error):
+        return jsonify({ 'error': 'The assistant took too long to answer, please try again later' }), 504
+
+    @api.errorhandler(HasherBusy)
+    def hasher_busy(error):
+        return jsonify({ 'error': 'Too many sign in requests, please try again later' }), 503
+
+    @api.route('/metrics', methods = [ 'GET' ])
+    def metrics():
+        pool = db.pool.metrics()
+        ai = api.config['ai'].stats()
+
+        return api.response_class(telemetry.REGISTRY.render([
+            ('db_pool_connections', 'Connections of the pool by state', [
+                ({ 'state': 'in_use' }, pool['in_use']),
+                ({ 'state': 'idle' }, pool['idle'])
+            ]),
+            ('db_pool_waiting', 'Requests waiting for a connection', [ ({}, pool['waiting']) ]),
+            ('ai_in_flight', 'AI completions in progress', [ ({}, ai['in_flight']) ]),
+            ('result_cache_entries', 'Query results held by the result cache', [ ({}, api.config['results'].stats()['size']) ])
+        ]), mimetype = 'text/plain; version=0.0.4')
+
+    @api.route('/metrics/pool', methods = [ 'GET' ])
+    def pool_metrics():
+        return jsonify(db.pool.metrics())
+
+    @api.route('/metrics/replicas', methods = [ 'GET' ])
+    def replica_metrics():
+        return jsonify(db.replicas.stats())
+
+    @api.route('/metrics/queries', methods = [ 'GET' ])
+    def query_metrics():
+        return jsonify(queries.statistics())
+
+    @api.route('/metrics/summaries', methods = [ 'GET' ])
+    def summary_metrics():
+        return jsonify(api.config['summaries'].stats())
+
+    @api.route('/metrics/results', methods = [ 'GET' ])
+    def result_metrics():
+        return jsonify(api.config['results'].stats())
+
+    @api.route('/metrics/ai', methods = [ 'GET' ])
+    def ai_metrics():
+        stats = api.config['ai'].stats()
+
+        # served under ASGI, the AI routes go through the coroutine gateway of asgi.py instead
+        if 'ai_async' in api.config:
+            stats['async'] = api.config['ai_async'].stats()
+
+        return jsonify(stats)
+
+    @api.route('/metrics/sessions', methods = [ 'GET' ])
+    def session_metrics():
+        return jsonify(dict(api.config['sessions'].stats(), sweeper = api.config['sweeper'].stats()))
+
+    @api.route('/metrics/passwords', methods = [ 'GET' ])
+    def password_metrics():
+        return jsonify(dict(api.config['passwords'].stats(), attempts = api.config['attempts'].stats()))
+
+    return api
@@ -0,0 +1,131 @@
+import re
+
+SEARCH_MODES = [ 'substring', 'prefix', 'fulltext' ]
+
+SORTABLE_COLUMNS = [ 'id', 'title', 'author', 'publication_year', 'price', 'currency', 'genre', 'rating' ]
+
+# text columns are compared and sorted through their generated lowercase twins, which carry the B-tree indexes;
+# the optional genre and currency are stored there as '' rather than NULL, which no keyset comparison matches
+INDEXED_COLUMNS = {
+    'title': 'title_lc',
+    'author': 'author_lc',
+    'genre': 'genre_lc',
+    'currency': 'currency_lc',
+    'rating': 'book_stats.rating'
+}
+
+# InnoDB default full-text stopwords and the minimum token size, such words cannot be required in boolean mode
+FULLTEXT_STOPWORDS = frozenset([
+    'a', 'about', 'an', 'are', 'as', 'at', 'be', 'by', 'com', 'de', 'en', 'for', 'from', 'how', 'i', 'in', 'is',
+    'it', 'la', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'was', 'what', 'when', 'where', 'who', 'will',
+    'with', 'und', 'www'
+])
+FULLTEXT_MIN_TOKEN_SIZE = 3
+
+def escape_like(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def fulltext_terms(value: str) -> list[str]:
+    words = re.findall(r'\w+', value.lower())
+
+    return [
+        '+{}*'.format(word) for word in words
+        if len(word) >= FULLTEXT_MIN_TOKEN_SIZE and word not in FULLTEXT_STOPWORDS
+    ]
+
+def build_books_query(
+    title: str | None = None,
+    author: str | None = None,
+    publication_year: int | None = None,
+    price: float | None = None,
+    currency: str | None = None,
+    genre: str | None = None,
+    sortby: str | None = None,
+    reverse: bool = False,
+    limit: int | None = None,
+    mode: str = 'substring',
+    after: list | None = None,
+    min_rating: float | None = None
+) -> tuple[str, tuple]:
+    # rows are always ordered by (sort key, id) so that a page can resume right after its last row
+    order_column = INDEXED_COLUMNS.get(sortby, sortby) if sortby is not None else 'id'
+    # ratings come from book_stats; sorting or filtering on them joins it the other way around, so that its
+    # (rating, bookid) index drives the query, which is why the ties are then broken on bookid
+    rated = sortby == 'rating' or min_rating is not None
+    tie_column = 'book_stats.bookid' if rated else 'id'
+    command = [ 'SELECT id, title, author, publication_year, price, currency, genre, IF(book_stats.review_count > 0, book_stats.rating, NULL), COALESCE(book_stats.review_count, 0), {} FROM books {} book_stats ON book_stats.bookid=books.id'.format(
+        order_column,
+        'JOIN' if rated else 'LEFT JOIN'
+    ) ]
+
+    filters = []
+    params = []
+    terms = []
+
+    for column, value in [ ('title', title), ('author', author), ('genre', genre) ]:
+        if value is None:
+            continue
+
+        value = value.strip().lower()
+
+        if mode == 'prefix':
+            # anchored pattern, resolved as a range scan over the lowercase index
+            filters.append('{} LIKE %s'.format(INDEXED_COLUMNS[column]))
+            params.append('{}%'.format(escape_like(value)))
+        elif mode == 'fulltext' and len(fulltext_terms(value)) > 0:
+            # the full-text index narrows the candidates, the substring check keeps the match on the right column
+            terms.extend(fulltext_terms(value))
+            filters.append('{} LIKE %s'.format(INDEXED_COLUMNS[column]))
+            params.append('%{}%'.format(escape_like(value)))
+        elif mode == 'fulltext':
+            # only short or stopword terms were typed, which the full-text index cannot serve
+            filters.append('{} LIKE %s'.format(INDEXED_COLUMNS[column]))
+            params.append('{}%'.format(escape_like(value)))
+        else:
+            filters.append('{} LIKE %s'.format(INDEXED_COLUMNS[column]))
+            params.append('%{}%'.format(escape_like(value)))
+
+    if len(terms) > 0:
+        filters.insert(0, 'MATCH(title, author, genre) AGAINST (%s IN BOOLEAN MODE)')
+        params.insert(0, ' '.join(terms))
+
+    if publication_year is not None:
+        filters.append('publication_year=%s')
+        params.append(publication_year)
+
+    if price is not None:
+        # same rounding as CAST(price AS UNSIGNED) but expressed as a range over the price index
+        filters.append('price >= %s AND price < %s')
+        params.extend([ int(price) - 0.5, int(price) + 0.5 ])
+
+    if currency is not None:
+        filters.append('currency_lc=%s')
+        params.append(currency.strip().lower())
+
+    if min_rating is not None:
+        filters.append('book_stats.rating >= %s')
+        params.append(min_rating)
+
+    if after is not None:
+        operator = '<' if reverse else '>'
+
+        if order_column == 'id':
+            filters.append('id {} %s'.format(operator))
+            params.append(after[1])
+        else:
+            filters.append('({0} {1} %s OR ({0} = %s AND {2} {1} %s))'.format(order_column, operator, tie_column))
+            params.extend([ after[0], after[0], after[1] ])
+
+    if len(filters) > 0:
+        command.append('WHERE {}'.format(' AND '.join(filters)))
+
+    if order_column == 'id':
+        command.append('ORDER BY id {}'.format('ASC' if not reverse else 'DESC'))
+    else:
+        command.append('ORDER BY {0} {1}, {2} {1}'.format(order_column, 'ASC' if not reverse else 'DESC', tie_column))
+
+    if limit is not None:
+        command.append('LIMIT %s')
+        params.append(limit)
+
+    return ' '.join(command), tuple(params)
@@ -0,0 +1,211 @@
+from flask import current_app, g, jsonify, request
+from .cache import LRUCache
+from .queries import execute, executemany
+import functools
+import os
+import threading
+import time
+import uuid
+
+def token_bytes(token: str) -> bytes | None:
+    # the sessions table keeps the 16 raw bytes of the uuid instead of its 36 characters
+    try:
+        return uuid.UUID(token).bytes
+    except ValueError:
+        return None
+
+def cache_key(email: str, token: str) -> tuple | None:
+    # the table matches emails case-insensitively and tokens by their bytes, the cache must too or a
+    # revocation spelled differently would leave the cached session valid
+    try:
+        return email.lower(), str(uuid.UUID(token))
+    except ValueError:
+        return None
+
+def sweep(connection, lifetime: float, batch: int = 1000, pause: float = 0.05) -> int:
+    # many short transactions instead of one long DELETE, so that signins never wait long on its locks
+    cursor = connection.cursor()
+    removed = 0
+
+    try:
+        while True:
+            execute(cursor, 'sessions_delete_expired', (int(lifetime), batch))
+            deleted = cursor.rowcount
+            connection.commit()
+            removed += deleted
+
+            if deleted < batch:
+                return removed
+
+            time.sleep(pause)
+    finally:
+        cursor.close()
+
+class SessionStore:
+    def __init__(self, maxsize: int = 10000, cache_ttl: float = 60.0, lifetime: float = 7 * 24 * 3600, max_per_user: int = 0):
+        # a session revoked by another worker stays valid here for at most cache_ttl seconds
+        self.lifetime = lifetime
+        self.max_per_user = max_per_user
+        self.local = LRUCache(maxsize = maxsize, ttl = cache_ttl)
+
+    def validate(self, cursor, email: str, token: str) -> bool:
+        cached = cache_key(email, token)
+
+        if cached is None:
+            return False
+
+        expiry = self.local.get(cached)
+
+        if expiry is not None:
+            if expiry > time.time():
+                return True
+
+            self.local.pop(cached)
+
+            return False
+
+        execute(cursor, 'session_lookup', (int(self.lifetime), email, token_bytes(token), int(self.lifetime)))
+        entry = cursor.fetchone()
+
+        if entry is None:
+            return False
+
+        self.local.put(cached, time.time() + entry[2])
+
+        return True
+
+    def create(self, cursor, email: str, token: str):
+        # the caller commits the insert, then calls remember()
+        execute(cursor, 'insert_session', (email, token_bytes(token)))
+
+        if self.max_per_user > 0:
+            self._evict(cursor, email, token)
+
+    def remember(self, email: str, token: str):
+        # only once committed, a token whose insert failed must not stay valid in this worker
+        self.local.put(cache_key(email, token), time.time() + self.lifetime)
+
+    def _evict(self, cursor, email: str, token: str):
+        # newest sessions first; the one just inserted shares its timestamp with others of the same second,
+        # so it is set apart by its token and always kept
+        created = token_bytes(token)
+        execute(cursor, 'sessions_by_user', (email,))
+        others = [ bytes(entry[0]) for entry in cursor.fetchall() if bytes(entry[0]) != created ]
+        stale = others[self.max_per_user - 1:]
+
+        if len(stale) < 1:
+            return
+
+        for key in stale:
+            self.local.pop(cache_key(email, str(uuid.UUID(bytes = key))))
+
+        executemany(cursor, 'delete_session', [ (email, key) for key in stale ])
+
+    def revoke(self, cursor, email: str, token: str):
+        cached = cache_key(email, token)
+
+        if cached is not None:
+            self.local.pop(cached)
+
+        execute(cursor, 'delete_session', (email, token_bytes(token)))
+
+    def stats(self) -> dict:
+        return dict(self.local.stats(), lifetime = self.lifetime, max_per_user = self.max_per_user)
+
+class SessionSweeper:
+    # background thread deleting expired sessions every interval seconds on a pooled connection
+    def __init__(self, pool, lifetime: float, interval: float = 300.0, batch: int = 1000, pause: float = 0.05):
+        self.pool = pool
+        self.lifetime = lifetime
+        self.interval = interval
+        self.batch = batch
+        self.pause = pause
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._runs = 0
+        self._failures = 0
+        self._removed = 0
+        self._last_run = None
+
+    def start(self):
+        # cheap enough to call on every request, a thread started before a fork does not exist in the child
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid != os.getpid():
+                self._thread = threading.Thread(target = self._run, name = 'session-sweeper', daemon = True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def stop(self):
+        self._stop.set()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            self._pid = None
+
+    def run_once(self) -> int:
+        try:
+            with self.pool.connection() as connection:
+                removed = sweep(connection, self.lifetime, self.batch, self.pause)
+        except:
+            with self._lock:
+                self._failures += 1
+            raise
+
+        with self._lock:
+            self._runs += 1
+            self._removed += removed
+            self._last_run = time.time()
+
+        return removed
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except:
+                # counted in the statistics, the next interval simply tries again
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'runs': self._runs,
+                'failures': self._failures,
+                'removed': self._removed,
+                'last_run': self._last_run
+            }
+
+def authenticated(handler):
+    # the email comes from the route when it is part of the URL, otherwise from the query string
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        email = kwargs.get('email') or request.args.get('email')
+        token = request.args.get('token')
+
+        if not email or not token:
+            return jsonify({ 'error': 'You lack authorization to make this call' }), 401
+
+        email = email.strip()
+        token = token.strip()
+
+        try:
+            with current_app.config['db'].cursor() as cursor:
+                valid = current_app.config['sessions'].validate(cursor, email, token)
+        except:
+            return jsonify({ 'error': 'Unable to verify the session' }), 500
+
+        if not valid:
+            return jsonify({ 'error': 'Invalid request due to session expiration or invalid credentials' }), 400
+
+        g.session = (email, token)
+
+        return handler(*args, **kwargs)
+
+    return wrapper
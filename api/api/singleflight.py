@@ -0,0 +1,166 @@
+import fcntl
+import json
+import os
+import threading
+import time
+
+class Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    def __init__(self, lock_dir: str | None = None, result_ttl: float = 5.0):
+        # with a lock directory, leaders of different processes also serialize on a per key lock file
+        # and the first one leaves its result behind for the others during result_ttl seconds
+        self.lock_dir = lock_dir
+        self.result_ttl = result_ttl
+
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._executed = 0
+        self._coalesced = 0
+        self._coalesced_across_processes = 0
+        self._swept = time.time()
+
+        if lock_dir is not None:
+            os.makedirs(lock_dir, exist_ok = True)
+
+    def do(self, key: str, function):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+
+            if leader:
+                call = self._calls[key] = Call()
+            else:
+                self._coalesced += 1
+
+        if not leader:
+            call.done.wait()
+
+            if call.error is not None:
+                raise call.error
+
+            return call.result
+
+        try:
+            call.result = self._run(key, function) if self.lock_dir is not None else self._execute(function)
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+            call.done.set()
+
+        return call.result
+
+    def _execute(self, function):
+        with self._lock:
+            self._executed += 1
+
+        return function()
+
+    def _open(self, path: str, blocking: bool = True):
+        # the sweep unlinks lock files while holding them, a lock taken on such an unlinked file is retried
+        # on the one the path names now
+        while True:
+            lock = open(path, 'a')
+
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock.close()
+                return None
+
+            try:
+                if os.stat(path).st_ino == os.fstat(lock.fileno()).st_ino:
+                    return lock
+            except FileNotFoundError:
+                pass
+
+            lock.close()
+
+    def _sweep(self):
+        # a result left behind outlives its ttl only until the next sweep, keys nobody is computing lose their
+        # lock file as well; at most one sweep per result_ttl and per process
+        now = time.time()
+
+        with self._lock:
+            if now - self._swept < self.result_ttl:
+                return
+
+            self._swept = now
+
+        for name in os.listdir(self.lock_dir):
+            if not name.endswith('.lock'):
+                continue
+
+            path = os.path.join(self.lock_dir, name[:-len('.lock')])
+            lock = self._open(path + '.lock', blocking = False)
+
+            if lock is None:
+                continue
+
+            try:
+                try:
+                    with open(path + '.json', 'r') as file:
+                        fresh = now - json.load(file)['timestamp'] <= self.result_ttl
+                except (OSError, ValueError, KeyError):
+                    fresh = False
+
+                if not fresh:
+                    for suffix in [ '.json', '.tmp', '.lock' ]:
+                        try:
+                            os.unlink(path + suffix)
+                        except FileNotFoundError:
+                            pass
+            finally:
+                lock.close()
+
+    def _run(self, key: str, function):
+        try:
+            return self._share(key, function)
+        finally:
+            self._sweep()
+
+    def _share(self, key: str, function):
+        path = os.path.join(self.lock_dir, key)
+
+        with self._open(path + '.lock') as lock:
+            try:
+                try:
+                    with open(path + '.json', 'r') as file:
+                        shared = json.load(file)
+
+                    if time.time() - shared['timestamp'] <= self.result_ttl:
+                        with self._lock:
+                            self._coalesced_across_processes += 1
+
+                        return shared['result']
+                except (OSError, ValueError, KeyError):
+                    pass
+
+                result = self._execute(function)
+
+                # written aside and renamed so that readers never observe a partial file
+                with open(path + '.tmp', 'w') as file:
+                    json.dump({ 'timestamp': time.time(), 'result': result }, file)
+
+                os.replace(path + '.tmp', path + '.json')
+
+                return result
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'executed': self._executed,
+                'coalesced': self._coalesced,
+                'coalesced_across_processes': self._coalesced_across_processes
+            }
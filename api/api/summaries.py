@@ -0,0 +1,116 @@
+from .cache import LRUCache, MISSING
+from .queries import execute, executemany
+import hashlib
+import json
+import threading
+
+def prompt_hash(model: str, messages: list, max_tokens: int) -> str:
+    payload = json.dumps({ 'model': model, 'messages': messages, 'max_tokens': max_tokens }, sort_keys = True)
+
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class SummaryCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 7 * 24 * 3600):
+        self.ttl = ttl
+        # in-process tier keyed by (book id, prompt hash), the persistent tier is the summaries table
+        self.local = LRUCache(maxsize = maxsize, ttl = ttl)
+
+        self._lock = threading.Lock()
+        self._persistent_hits = 0
+        self._persistent_misses = 0
+
+    def get(self, cursor, bookid: int, key: str) -> str | None:
+        content = self.local.get((bookid, key), MISSING)
+
+        if content is not MISSING:
+            return content
+
+        execute(cursor, 'summary_lookup', (bookid, key, int(self.ttl)))
+        entry = cursor.fetchone()
+
+        with self._lock:
+            if entry is None:
+                self._persistent_misses += 1
+            else:
+                self._persistent_hits += 1
+
+        if entry is None:
+            return None
+
+        self.local.put((bookid, key), entry[0])
+
+        return entry[0]
+
+    def put(self, cursor, bookid: int, key: str, model: str, content: str):
+        self.local.put((bookid, key), content)
+
+        execute(cursor, 'summary_upsert', (bookid, key, model, content))
+        cursor.connection.commit()
+
+    def get_many(self, cursor, keys: list[tuple[int, str]]) -> dict:
+        # local hits first, then a single round trip for everything else
+        results = {}
+        missing = []
+
+        for bookid, key in keys:
+            content = self.local.get((bookid, key), MISSING)
+
+            if content is MISSING:
+                missing.append((bookid, key))
+            else:
+                results[bookid] = content
+
+        if len(missing) > 0:
+            execute(cursor, 'summaries_lookup_many', (*[ value for pair in missing for value in pair ], int(self.ttl)), sql = (
+                'SELECT bookid, prompt_hash, content FROM summaries WHERE (bookid, prompt_hash) IN ({}) AND creation_timestamp > NOW() - INTERVAL %s SECOND;'.format(
+                    ', '.join([ '(%s, %s)' ] * len(missing))
+                )
+            ))
+
+            for bookid, key, content in cursor.fetchall():
+                results[bookid] = content
+                self.local.put((bookid, key), content)
+
+            with self._lock:
+                found = sum(1 for bookid, _ in missing if bookid in results)
+                self._persistent_hits += found
+                self._persistent_misses += len(missing) - found
+
+        return results
+
+    def put_many(self, cursor, entries: list[tuple[int, str, str, str]]):
+        if len(entries) < 1:
+            return
+
+        for bookid, key, _, content in entries:
+            self.local.put((bookid, key), content)
+
+        executemany(cursor, 'summary_upsert', entries)
+        cursor.connection.commit()
+
+    def invalidate(self, cursor, bookid: int):
+        # runs inside the caller's transaction, which is committed together with the book change
+        self.local.discard_where(lambda key: key[0] == bookid)
+
+        execute(cursor, 'summaries_delete_by_book', (bookid,))
+
+    def invalidate_many(self, cursor, bookids: list[int]):
+        if len(bookids) < 1:
+            return
+
+        removed = set(bookids)
+        self.local.discard_where(lambda key: key[0] in removed)
+
+        execute(cursor, 'summaries_delete_by_books', tuple(bookids), sql = 'DELETE FROM summaries WHERE bookid IN ({});'.format(
+            ', '.join([ '%s' ] * len(bookids))
+        ))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'local': self.local.stats(),
+                'persistent': {
+                    'hits': self._persistent_hits,
+                    'misses': self._persistent_misses
+                }
+            }
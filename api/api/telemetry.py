@@ -0,0 +1,235 @@
+from flask import g, has_request_context, request
+import collections
+import os
+import re
+import sys
+import threading
+import time
+
+# seconds, from a primary key lookup to a long completion
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# the parts of a request duration accounted separately, see spend()
+PARTS = [ 'sql', 'ai', 'serialization' ]
+
+class Registry:
+    # histograms and counters of this process, rendered in the Prometheus text exposition format
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._descriptions = {}
+
+    def describe(self, name: str, kind: str, description: str):
+        self._descriptions[name] = (kind, description)
+
+    def observe(self, name: str, value: float, buckets: tuple = BUCKETS, **labels):
+        key = (name, tuple(sorted((label, str(setting)) for label, setting in labels.items())))
+
+        with self._lock:
+            entry = self._histograms.get(key)
+
+            if entry is None:
+                entry = self._histograms[key] = [ buckets, [ 0 ] * len(buckets), 0.0, 0 ]
+
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    entry[1][index] += 1
+                    break
+
+            entry[2] += value
+            entry[3] += 1
+
+    def increment(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted((label, str(setting)) for label, setting in labels.items())))
+
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def render(self, gauges: list = []) -> str:
+        # gauges are (name, description, [ (labels, value) ]) computed by the caller at scrape time
+        lines = []
+        described = set()
+
+        def header(name: str, kind: str, description: str):
+            if name not in described:
+                described.add(name)
+                lines.append('# HELP {} {}'.format(name, description))
+                lines.append('# TYPE {} {}'.format(name, kind))
+
+        with self._lock:
+            histograms = sorted((key, (buckets, list(counts), total, count)) for key, (buckets, counts, total, count) in self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        for (name, labels), (buckets, counts, total, count) in histograms:
+            header(name, 'histogram', self._descriptions.get(name, ('', name))[1])
+            cumulative = 0
+
+            for bound, value in zip(buckets, counts):
+                cumulative += value
+                lines.append('{}_bucket{} {}'.format(name, _labels(labels + (('le', _number(bound)),)), cumulative))
+
+            lines.append('{}_bucket{} {}'.format(name, _labels(labels + (('le', '+Inf'),)), count))
+            lines.append('{}_sum{} {}'.format(name, _labels(labels), _number(total)))
+            lines.append('{}_count{} {}'.format(name, _labels(labels), count))
+
+        for (name, labels), value in counters:
+            header(name, 'counter', self._descriptions.get(name, ('', name))[1])
+            lines.append('{}{} {}'.format(name, _labels(labels), _number(value)))
+
+        for name, description, samples in gauges:
+            header(name, 'gauge', description)
+
+            for labels, value in samples:
+                lines.append('{}{} {}'.format(name, _labels(tuple(sorted(labels.items()))), _number(value)))
+
+        return '\n'.join(lines) + '\n'
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _labels(labels: tuple) -> str:
+    if len(labels) < 1:
+        return ''
+
+    return '{{{}}}'.format(','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for name, value in labels))
+
+REGISTRY = Registry()
+REGISTRY.describe('http_request_duration_seconds', 'histogram', 'Time to produce a response, by endpoint, method and status')
+REGISTRY.describe('http_request_part_seconds', 'histogram', 'Time of a request spent in SQL, in the AI provider and in serialization, by endpoint')
+REGISTRY.describe('http_response_size_bytes', 'histogram', 'Size of the response bodies as sent, by endpoint')
+REGISTRY.describe('db_statement_duration_seconds', 'histogram', 'Execution time of the named SQL statements')
+REGISTRY.describe('db_statement_errors_total', 'counter', 'Named SQL statements which raised an error')
+REGISTRY.describe('ai_completion_duration_seconds', 'histogram', 'Time of the AI completions, retries included, by model')
+REGISTRY.describe('ai_tokens_total', 'counter', 'Tokens reported by the AI provider, by model and kind')
+REGISTRY.describe('response_encode_duration_seconds', 'histogram', 'Time spent encoding JSON bodies')
+
+def spend(part: str, elapsed: float):
+    # accounted to the current request, work done on other threads (batch completions, streamed bodies) is not
+    if has_request_context() and hasattr(g, 'telemetry'):
+        g.telemetry[part] += elapsed
+
+def record_statement(name: str, elapsed: float, failed: bool):
+    REGISTRY.observe('db_statement_duration_seconds', elapsed, statement = name)
+
+    if failed:
+        REGISTRY.increment('db_statement_errors_total', statement = name)
+
+    spend('sql', elapsed)
+
+def record_completion(model: str, elapsed: float, usage = None):
+    REGISTRY.observe('ai_completion_duration_seconds', elapsed, model = model)
+
+    if usage is not None:
+        REGISTRY.increment('ai_tokens_total', getattr(usage, 'prompt_tokens', 0) or 0, model = model, kind = 'prompt')
+        REGISTRY.increment('ai_tokens_total', getattr(usage, 'completion_tokens', 0) or 0, model = model, kind = 'completion')
+
+    spend('ai', elapsed)
+
+def record_encoding(elapsed: float):
+    REGISTRY.observe('response_encode_duration_seconds', elapsed)
+    spend('serialization', elapsed)
+
+class Profiler:
+    # samples the stacks of the threads serving a request and keeps them for requests slower than threshold,
+    # written in the folded format read by flamegraph.pl and speedscope
+    def __init__(self, directory: str, threshold: float, interval: float = 0.005):
+        self.directory = directory
+        self.threshold = threshold
+        self.interval = interval
+
+        self._lock = threading.Lock()
+        self._active = {}
+        self._thread = None
+        self._pid = None
+        self._written = 0
+
+    def start(self):
+        # from the first request of each process, so that every worker of a preloaded application samples its own threads
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid != os.getpid():
+                os.makedirs(self.directory, exist_ok = True)
+                self._thread = threading.Thread(target = self._run, name = 'profiler', daemon = True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def begin(self):
+        with self._lock:
+            self._active[threading.get_ident()] = collections.Counter()
+
+    def end(self, endpoint: str, elapsed: float):
+        with self._lock:
+            stacks = self._active.pop(threading.get_ident(), None)
+
+        if stacks is None or elapsed < self.threshold or len(stacks) < 1:
+            return
+
+        name = '{}-{}-{}ms.folded'.format(time.strftime('%Y%m%dT%H%M%S'), re.sub(r'[^\w.]+', '_', endpoint), int(elapsed * 1000))
+
+        with open(os.path.join(self.directory, name), 'w') as file:
+            for stack, count in stacks.most_common():
+                file.write('{} {}\n'.format(stack, count))
+
+        with self._lock:
+            self._written += 1
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+
+            with self._lock:
+                for ident, stacks in self._active.items():
+                    frame = frames.get(ident)
+
+                    if frame is not None:
+                        stacks[_collapse(frame)] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return { 'active': len(self._active), 'written': self._written, 'threshold': self.threshold }
+
+def _collapse(frame) -> str:
+    names = []
+
+    while frame is not None:
+        names.append('{} ({})'.format(frame.f_code.co_name, os.path.basename(frame.f_code.co_filename)))
+        frame = frame.f_back
+
+    return ';'.join(reversed(names))
+
+def install(app, profiler: Profiler | None = None):
+    # must be registered before any other after_request hook, those run in reverse order and the size
+    # must be measured on the final, possibly compressed, body
+    @app.before_request
+    def begin():
+        g.telemetry = dict.fromkeys(PARTS, 0.0)
+        g.telemetry_start = time.perf_counter()
+
+        if profiler is not None:
+            profiler.start()
+            profiler.begin()
+
+    @app.after_request
+    def record(response):
+        endpoint = request.endpoint or 'unmatched'
+        elapsed = time.perf_counter() - g.telemetry_start
+
+        REGISTRY.observe('http_request_duration_seconds', elapsed, endpoint = endpoint, method = request.method, status = response.status_code)
+
+        for part, spent in g.telemetry.items():
+            REGISTRY.observe('http_request_part_seconds', spent, endpoint = endpoint, part = part)
+
+        if response.content_length is not None:
+            REGISTRY.observe('http_response_size_bytes', response.content_length, buckets = SIZE_BUCKETS, endpoint = endpoint)
+
+        return response
+
+    @app.teardown_request
+    def end(exception):
+        if profiler is not None and hasattr(g, 'telemetry_start'):
+            profiler.end(request.endpoint or 'unmatched', time.perf_counter() - g.telemetry_start)
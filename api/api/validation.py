@@ -0,0 +1,182 @@
+import math
+import re
+
+CURRENCIES = [ 'USD', 'EUR' ]
+# spellings accepted for each currency, looked up trimmed and lowercased; books are stored with the code
+CURRENCY_TABLE = {
+    **{ currency.lower(): currency for currency in CURRENCIES },
+    '$': 'USD',
+    'us$': 'USD',
+    '€': 'EUR',
+    'euro': 'EUR'
+}
+FIELDS = [ 'title', 'author', 'publication_year', 'price', 'currency', 'genre' ]
+# the largest value of the INT column
+YEAR_MAX = 2 ** 31 - 1
+YEAR_DIGITS = len(str(YEAR_MAX))
+
+YEAR = re.compile(r'\d+')
+PRICE = re.compile(r'\d+(?:\.\d+)?')
+# one match per line of a column joined by newlines, the group is empty on the lines that are not a price
+PRICES = re.compile(r'^({})$|^.*$'.format(PRICE.pattern), re.MULTILINE)
+
+ERRORS = {
+    'missing_fields': 'Missing fields, you need to fill (title, author, publication_year, price)',
+    'invalid_publication_year': 'Invalid publication_year field, it must be a positive integer',
+    'publication_year_out_of_range': 'Invalid publication_year field, it must be at most {}'.format(YEAR_MAX),
+    'invalid_price': 'Invalid price field, it must be a positive floating point number',
+    'price_out_of_range': 'Invalid price field, it must be a finite number',
+    'invalid_currency': 'Invalid currency field, it must be one of {}'.format(', '.join(CURRENCIES))
+}
+
+# each rule answers (code of the rule broken, None) or (None, normalized value), a missing value is (None, None)
+def _year(value: str | None) -> tuple:
+    if value is None:
+        return None, None
+
+    value = value.strip()
+
+    if YEAR.fullmatch(value) is None:
+        return 'invalid_publication_year', None
+
+    # the length is checked first, int() refuses digit strings longer than a few thousand characters
+    if len(value) > YEAR_DIGITS or int(value) > YEAR_MAX:
+        return 'publication_year_out_of_range', None
+
+    return None, int(value)
+
+def _price(value: str | None) -> tuple:
+    if value is None:
+        return None, None
+
+    value = value.strip()
+
+    if PRICE.fullmatch(value) is None:
+        return 'invalid_price', None
+
+    value = float(value)
+
+    # only an overflow, digits never spell nan
+    if value == math.inf:
+        return 'price_out_of_range', None
+
+    return None, value
+
+def _currency(value: str | None) -> tuple:
+    if value is None:
+        return None, None
+
+    value = CURRENCY_TABLE.get(value.strip().lower())
+
+    if value is None:
+        return 'invalid_currency', None
+
+    return None, value
+
+def _distinct(values: list, rule) -> tuple[list, list]:
+    # a catalog repeats a small set of years and currencies: each distinct value is checked once
+    checked = { value: rule(value) for value in set(values) }
+    codes = [ checked[value][0] for value in values ]
+
+    return codes, [ checked[value][1] for value in values ]
+
+def _prices(values: list) -> tuple[list, list]:
+    # prices seldom repeat, instead of one match per value PRICES runs once over the whole column; only the
+    # values it rejects or that overflow go through _price, and a value spanning lines, which would shift
+    # the others, sends the whole column there
+    text = [ value.strip() if value is not None else '' for value in values ]
+    joined = '\n'.join(text)
+    matches = PRICES.findall(joined) if joined.count('\n') == len(text) - 1 else []
+
+    if len(matches) != len(values):
+        return _distinct(values, _price)
+
+    prices = [ float(match) if match else None for match in matches ]
+    codes = [ None ] * len(values)
+
+    for index in [ index for index, price in enumerate(prices) if price is None or price == math.inf ]:
+        codes[index], prices[index] = _price(values[index])
+
+    return codes, prices
+
+def check(
+    title: str | None,
+    author: str | None,
+    publication_year: str | None,
+    price: str | None,
+    currency: str | None,
+    genre: str | None,
+    allow_empty_field: bool = False
+) -> tuple[str | None, tuple | None]:
+    # answers the code of the first rule broken, from ERRORS, or the normalized book
+    if not allow_empty_field and (title is None or author is None or publication_year is None or price is None):
+        return 'missing_fields', None
+
+    # the rules of _year, _price and _currency inline, this path runs once per request or per row
+    if publication_year is not None:
+        publication_year = publication_year.strip()
+
+        if YEAR.fullmatch(publication_year) is None:
+            return 'invalid_publication_year', None
+
+        if len(publication_year) > YEAR_DIGITS or int(publication_year) > YEAR_MAX:
+            return 'publication_year_out_of_range', None
+
+        publication_year = int(publication_year)
+
+    if price is not None:
+        price = price.strip()
+
+        if PRICE.fullmatch(price) is None:
+            return 'invalid_price', None
+
+        price = float(price)
+
+        if price == math.inf:
+            return 'price_out_of_range', None
+
+    if currency is not None:
+        currency = CURRENCY_TABLE.get(currency.strip().lower())
+
+        if currency is None:
+            return 'invalid_currency', None
+
+    return None, (
+        title.strip() if title is not None else None,
+        author.strip() if author is not None else None,
+        publication_year,
+        price,
+        currency,
+        genre.strip() if genre is not None else None
+    )
+
+def check_columns(columns, allow_empty_field: bool = False) -> tuple[list, list]:
+    # the same rules as check() a column at a time, columns maps every name of FIELDS to a sequence of text
+    # or None (a dict of lists, a DataFrame without NaN); answers one code or None and one book or None per row
+    titles = [ value.strip() if value is not None else None for value in columns['title'] ]
+    authors = [ value.strip() if value is not None else None for value in columns['author'] ]
+    genres = [ value.strip() if value is not None else None for value in columns['genre'] ]
+    publication_years = list(columns['publication_year'])
+    listed_prices = list(columns['price'])
+
+    codes, currencies = _distinct(list(columns['currency']), _currency)
+    price_codes, prices = _prices(listed_prices)
+    year_codes, years = _distinct(publication_years, _year)
+
+    # from the last rule to the first, so that each row keeps the code check() would answer
+    for earlier in (price_codes, year_codes):
+        if any(earlier):
+            codes = [ code or later for code, later in zip(earlier, codes) ]
+
+    if not allow_empty_field and (None in titles or None in authors or None in publication_years or None in listed_prices):
+        codes = [
+            'missing_fields' if title is None or author is None or year is None or price is None else code
+            for title, author, year, price, code in zip(titles, authors, publication_years, listed_prices, codes)
+        ]
+
+    books = list(zip(titles, authors, years, prices, currencies, genres))
+
+    if any(codes):
+        books = [ book if code is None else None for code, book in zip(codes, books) ]
+
+    return codes, books
@@ -2,7 +2,15 @@ from dotenv import load_dotenv
 
 load_dotenv('./settings/.env')
 
-from api.routes import api
+import os
 
 if __name__ == '__main__':
-    api.run(host = 'localhost', port = 8000)
\ No newline at end of file
+    # SERVER_MODE=asgi serves the AI routes from coroutines, one event loop per worker process
+    if os.getenv('SERVER_MODE', 'wsgi') == 'asgi':
+        import uvicorn
+
+        uvicorn.run('api.asgi:application', host = 'localhost', port = 8000, workers = int(os.getenv('SERVER_WORKERS', os.cpu_count() or 1)))
+    else:
+        from api.routes import create_app
+
+        create_app().run(host = 'localhost', port = 8000)
@@ -0,0 +1,140 @@
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+import numpy
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+parser = argparse.ArgumentParser(
+    prog = 'benchasync',
+    usage = 'compare how many pending AI requests the threaded and the ASGI servers hold',
+    description = 'start run.py in each server mode against the fake AI backend, send bursts of concurrent uncached recommendations '
+        'and report completed requests, latencies, peak memory and threads of the server process'
+)
+parser.add_argument('--url', type = str, default = 'http://localhost:8000', help = 'base URL run.py listens on')
+parser.add_argument('--levels', type = int, nargs = '+', default = [ 50, 100, 200, 400 ], help = 'concurrent requests per burst')
+parser.add_argument('--ai-latency', type = float, default = 2.0, help = 'seconds taken by every fake completion')
+parser.add_argument('--books', type = int, default = 100, help = 'book ids the requests are spread over, they must exist')
+parser.add_argument('--modes', type = str, nargs = '+', default = [ 'wsgi', 'asgi' ], choices = [ 'wsgi', 'asgi' ], help = 'server modes to measure')
+
+arguments = parser.parse_args()
+
+def status(pid: int) -> dict:
+    with open('/proc/{}/status'.format(pid)) as file:
+        fields = dict(line.split(':', 1) for line in file if ':' in line)
+
+    return { 'rss': int(fields['VmRSS'].split()[0]) // 1024, 'threads': int(fields['Threads']) }
+
+def request(path: str, query: dict) -> int:
+    try:
+        with urllib.request.urlopen('{}{}?{}'.format(arguments.url, path, urllib.parse.urlencode(query)), timeout = 120) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as error:
+        return error.code
+    except OSError:
+        return 0
+
+def start(mode: str) -> subprocess.Popen:
+    # the limits of both gateways are raised to the largest burst, what is measured is the server and not the admission control
+    environment = dict(
+        os.environ,
+        SERVER_MODE = mode,
+        SERVER_WORKERS = '1',
+        AI_BACKEND = 'fake',
+        FAKE_AI_FIRST_TOKEN_LATENCY = str(arguments.ai_latency),
+        FAKE_AI_CHUNK_INTERVAL = '0',
+        AI_MAX_CONCURRENCY = str(max(arguments.levels)),
+        AI_ASYNC_MAX_CONCURRENCY = str(max(arguments.levels)),
+        AI_QUEUE_TIMEOUT = str(arguments.ai_latency * 10)
+    )
+    process = subprocess.Popen([ sys.executable, 'run.py' ], cwd = ROOT, env = environment, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+
+    while request('/metrics/pool', {}) != 200:
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.kill()
+            raise SystemExit('run.py did not start in {} mode'.format(mode))
+
+        time.sleep(0.5)
+
+    return process
+
+def burst(pid: int, level: int) -> dict:
+    samples = []
+    statuses = []
+    peak = status(pid)
+    lock = threading.Lock()
+    barrier = threading.Barrier(level)
+    done = threading.Event()
+
+    def client(index: int):
+        # a profile of its own per request, so that no score is cached or coalesced
+        query = { 'description': 'benchmark {}'.format(uuid.uuid4().hex) }
+        barrier.wait()
+        began = time.perf_counter()
+        code = request('/ai/recommendation/{}'.format(1 + index % arguments.books), query)
+
+        with lock:
+            samples.append(time.perf_counter() - began)
+            statuses.append(code)
+
+    def sample():
+        nonlocal peak
+
+        while not done.wait(0.05):
+            current = status(pid)
+            peak = { 'rss': max(peak['rss'], current['rss']), 'threads': max(peak['threads'], current['threads']) }
+
+    sampler = threading.Thread(target = sample)
+    sampler.start()
+    threads = [ threading.Thread(target = client, args = (index,)) for index in range(level) ]
+    began = time.perf_counter()
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    elapsed = time.perf_counter() - began
+    done.set()
+    sampler.join()
+
+    latencies = numpy.array(samples) * 1000
+
+    return {
+        'ok': sum(1 for code in statuses if code == 200),
+        'elapsed': elapsed,
+        'p50': numpy.percentile(latencies, 50),
+        'p99': numpy.percentile(latencies, 99),
+        'rss': peak['rss'],
+        'threads': peak['threads']
+    }
+
+print('{:<5} {:>6} {:>6} {:>8} {:>9} {:>9} {:>8} {:>8}'.format('mode', 'level', 'ok', 'wall s', 'p50 ms', 'p99 ms', 'rss MB', 'threads'))
+
+for mode in arguments.modes:
+    process = start(mode)
+
+    try:
+        for level in arguments.levels:
+            result = burst(process.pid, level)
+
+            # latencies and capacity of failed requests would only measure the error path
+            if result['ok'] != level:
+                raise SystemExit('{} mode answered {} of {} requests at level {}, the comparison is not valid'.format(mode, result['ok'], level, level))
+
+            print('{:<5} {:>6} {:>6} {:>8.2f} {:>9.0f} {:>9.0f} {:>8} {:>8}'.format(
+                mode, level, result['ok'], result['elapsed'], result['p50'], result['p99'], result['rss'], result['threads']
+            ))
+    finally:
+        process.terminate()
+        process.wait()
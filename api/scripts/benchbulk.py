@@ -0,0 +1,52 @@
+import argparse
+import json
+import time
+import urllib.parse
+import urllib.request
+import uuid
+
+parser = argparse.ArgumentParser(
+    prog = 'benchbulk',
+    usage = 'measure catalog mutation throughput',
+    description = 'add, edit and delete the same number of synthetic books through the per-item endpoints and through /books/bulk, and report operations per second for each'
+)
+parser.add_argument('--url', type = str, default = 'http://localhost:8000', help = 'base URL of the running API')
+parser.add_argument('--books', type = int, default = 500, help = 'books added, edited and deleted per mode')
+
+arguments = parser.parse_args()
+
+def call(method: str, path: str, query: dict | None = None, body = None):
+    url = '{}{}{}'.format(arguments.url, path, '?' + urllib.parse.urlencode(query) if query else '')
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    request = urllib.request.Request(url, data = data, method = method, headers = { 'Content-Type': 'application/json' } if data else {})
+
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+def book(tag: str, index: int) -> dict:
+    return { 'title': '{} {}'.format(tag, index), 'author': 'Benchmark', 'publication_year': 2024, 'price': 10, 'currency': 'USD', 'genre': 'Benchmark' }
+
+def timed(name: str, mode: str, count: int, action):
+    start = time.perf_counter()
+    result = action()
+    elapsed = time.perf_counter() - start
+
+    print('{:<9} {:<7} {:>6} books in {:>7.2f}s  {:>8.0f} ops/s'.format(mode, name, count, elapsed, count / elapsed))
+
+    return result
+
+def single(tag: str):
+    timed('add', 'per-item', arguments.books, lambda: [ call('POST', '/books/add', book(tag, index)) for index in range(arguments.books) ])
+    # the per-item endpoints do not return ids, they are looked up once outside of the measurement
+    ids = [ entry['id'] for entry in call('GET', '/books/show', { 'title': tag, 'mode': 'prefix', 'count': arguments.books }) ]
+    timed('edit', 'per-item', len(ids), lambda: [ call('POST', '/books/edit/{}'.format(id), { 'price': 12 }) for id in ids ])
+    timed('delete', 'per-item', len(ids), lambda: [ call('DELETE', '/books/delete/{}'.format(id)) for id in ids ])
+
+def batched(tag: str):
+    results = timed('add', 'bulk', arguments.books, lambda: call('POST', '/books/bulk', body = [ dict(book(tag, index), op = 'add') for index in range(arguments.books) ]))
+    ids = [ result['id'] for result in results if result['status'] == 200 ]
+    timed('edit', 'bulk', len(ids), lambda: call('POST', '/books/bulk', body = [ { 'op': 'edit', 'id': id, 'price': 12 } for id in ids ]))
+    timed('delete', 'bulk', len(ids), lambda: call('POST', '/books/bulk', body = [ { 'op': 'delete', 'id': id } for id in ids ]))
+
+single('benchmark-{}'.format(uuid.uuid4().hex[:8]))
+batched('benchmark-{}'.format(uuid.uuid4().hex[:8]))
@@ -0,0 +1,76 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from api.embeddings import DIMENSIONS, VectorIndex, embed
+
+parser = argparse.ArgumentParser(
+    prog = 'benchembeddings',
+    usage = 'measure the latency of the semantic book search',
+    description = 'build synthetic memory mapped indexes and report p50/p99 latency of single and batched top-K queries'
+)
+parser.add_argument('--sizes', type = int, nargs = '+', default = [ 10000, 100000, 1000000 ], help = 'number of synthetic books per index')
+parser.add_argument('--queries', type = int, default = 200, help = 'queries per measurement')
+parser.add_argument('--batch', type = int, default = 32, help = 'queries per batched call')
+parser.add_argument('--count', type = int, default = 10, help = 'top-K results per query')
+
+arguments = parser.parse_args()
+random = numpy.random.default_rng(42)
+
+def percentiles(samples: list[float]) -> str:
+    samples = numpy.array(samples) * 1000
+
+    return 'p50={:.2f}ms p99={:.2f}ms'.format(numpy.percentile(samples, 50), numpy.percentile(samples, 99))
+
+# embedding throughput only depends on the text, not on the index size
+texts = [ 'synthetic book {} by author {} of genre {}'.format(index, index % 997, index % 31) for index in range(10000) ]
+start = time.perf_counter()
+embed(texts)
+print('embedding: {:.0f} documents/s'.format(len(texts) / (time.perf_counter() - start)))
+
+for size in arguments.sizes:
+    with tempfile.TemporaryDirectory() as directory:
+        # random unit vectors stand in for embedded books, search cost does not depend on their content
+        vectors = random.standard_normal((size, DIMENSIONS), dtype = numpy.float32)
+        vectors /= numpy.linalg.norm(vectors, axis = 1, keepdims = True)
+
+        start = time.perf_counter()
+        VectorIndex(directory).load(numpy.arange(1, size + 1), vectors)
+        published = time.perf_counter() - start
+
+        del vectors
+
+        # a fresh instance only maps the files, as a newly forked worker would
+        start = time.perf_counter()
+        index = VectorIndex(directory)
+        index.ready()
+        opened = time.perf_counter() - start
+
+        queries = embed([ 'query {}'.format(index) for index in range(arguments.queries) ])
+        single = []
+
+        for query in queries:
+            start = time.perf_counter()
+            index.search(query[None, :], arguments.count)
+            single.append(time.perf_counter() - start)
+
+        batched = []
+
+        for offset in range(0, len(queries), arguments.batch):
+            chunk = queries[offset:offset + arguments.batch]
+            start = time.perf_counter()
+            index.search(chunk, arguments.count)
+            batched.append((time.perf_counter() - start) / len(chunk))
+
+        print('{:>8} books: publish {:.2f}s, open {:.1f}ms, single {}, batched per query {}'.format(
+            size,
+            published,
+            opened * 1000,
+            percentiles(single),
+            percentiles(batched)
+        ))
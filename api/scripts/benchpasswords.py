@@ -0,0 +1,47 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from api.passwords import PasswordHasher
+
+# (name, PasswordHasher arguments) from cheapest to most expensive
+SETTINGS = [
+    ('scrypt n=2^13', dict(method = 'scrypt', scrypt_n = 2 ** 13)),
+    ('scrypt n=2^14', dict(method = 'scrypt', scrypt_n = 2 ** 14)),
+    ('scrypt n=2^15', dict(method = 'scrypt', scrypt_n = 2 ** 15)),
+    ('pbkdf2 210k', dict(method = 'pbkdf2_sha256', pbkdf2_iterations = 210000)),
+    ('pbkdf2 600k', dict(method = 'pbkdf2_sha256', pbkdf2_iterations = 600000))
+]
+
+parser = argparse.ArgumentParser(
+    prog = 'benchpasswords',
+    usage = 'measure the cost of verifying a password',
+    description = 'report logins per second, overall and per core, for each password hashing cost setting'
+)
+parser.add_argument('--workers', type = int, default = os.cpu_count() or 1, help = 'hashing processes')
+parser.add_argument('--logins', type = int, default = 200, help = 'verifications per setting')
+
+arguments = parser.parse_args()
+
+for name, settings in SETTINGS:
+    hasher = PasswordHasher(workers = arguments.workers, queue_size = arguments.logins, timeout = 600.0, **settings)
+    stored = hasher.hash('correct horse battery staple')
+
+    # request threads only wait on the pool, as they would in the application
+    with ThreadPoolExecutor(max_workers = arguments.workers * 2) as executor:
+        start = time.perf_counter()
+        results = list(executor.map(lambda _: hasher.verify('correct horse battery staple', stored)[0], range(arguments.logins)))
+        elapsed = time.perf_counter() - start
+
+    assert all(results)
+
+    print('{:<16} {:>8.1f} logins/s {:>8.1f} logins/s per core {:>8.1f}ms per login'.format(
+        name,
+        arguments.logins / elapsed,
+        arguments.logins / elapsed / arguments.workers,
+        elapsed / arguments.logins * arguments.workers * 1000
+    ))
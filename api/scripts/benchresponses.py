@@ -0,0 +1,56 @@
+import argparse
+import os
+import sys
+import time
+from flask import Flask, jsonify
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from api import responses
+from api.responses import compress, rows_response
+
+COLUMNS = [ 'id', 'title', 'author', 'publication_year', 'price', 'currency', 'genre' ]
+
+parser = argparse.ArgumentParser(
+    prog = 'benchresponses',
+    usage = 'measure the cost of encoding list responses',
+    description = 'compare bytes and CPU time per response of the default jsonify path with the fast and columnar encoders, with and without compression'
+)
+parser.add_argument('--rows', type = int, nargs = '+', default = [ 100, 1000, 10000 ], help = 'rows per response')
+parser.add_argument('--requests', type = int, default = 50, help = 'responses per measurement')
+
+arguments = parser.parse_args()
+app = Flask(__name__)
+app.config['RESPONSE_STREAM_ROWS'] = 5000
+
+def baseline(rows):
+    return jsonify([ dict(zip(COLUMNS, row)) for row in rows ])
+
+def measure(rows, query: str, encoding: str | None, build) -> tuple[float, int]:
+    headers = { 'Accept-Encoding': encoding } if encoding is not None else {}
+    start = time.process_time()
+
+    for _ in range(arguments.requests):
+        with app.test_request_context('/books/show{}'.format(query), headers = headers):
+            response = compress(build(rows))
+            # a streamed body only costs CPU while it is consumed, as it would be by the server
+            size = sum(len(chunk) for chunk in response.response) if response.is_streamed else len(response.get_data())
+
+    return (time.process_time() - start) / arguments.requests * 1000, size
+
+for count in arguments.rows:
+    rows = [
+        (index, 'Synthetic book {}'.format(index), 'Author {}'.format(index % 997), 2000 + index % 25, 10.0 + index % 50, 'USD', 'Genre {}'.format(index % 31))
+        for index in range(count)
+    ]
+
+    cases = [
+        ('jsonify', '', baseline),
+        ('fast' if responses.orjson is not None else 'fast (stdlib)', '', lambda rows: rows_response(COLUMNS, rows)),
+        ('columnar', '?format=columnar', lambda rows: rows_response(COLUMNS, rows))
+    ]
+
+    for name, query, build in cases:
+        for encoding in [ None, 'gzip' ] + ([ 'br' ] if responses.brotli is not None else []):
+            cpu, size = measure(rows, query, encoding, build)
+            print('{:>6} rows {:<16} {:<9} {:>10} bytes {:>8.2f}ms CPU'.format(count, name, encoding or 'identity', size, cpu))
@@ -0,0 +1,58 @@
+import argparse
+import os
+import sys
+import time
+import uuid
+import MySQLdb
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from api.sessions import SessionStore
+
+parser = argparse.ArgumentParser(
+    prog = 'benchsessions',
+    usage = 'measure the cost of validating a session token',
+    description = 'compare session validation against the sessions table with and without the in-process cache, on a local MySQL database'
+)
+parser.add_argument('--host', type = str, default = os.getenv('MYSQL_HOST', 'localhost'), help = 'MySQL host of the primary')
+parser.add_argument('--port', type = int, default = int(os.getenv('MYSQL_PORT', 3306)), help = 'MySQL port of the primary')
+parser.add_argument('--user', type = str, default = os.getenv('MYSQL_USER', 'root'), help = 'MySQL user')
+parser.add_argument('--password', type = str, default = os.getenv('MYSQL_PASSWORD', ''), help = 'MySQL password')
+parser.add_argument('--database', type = str, default = os.getenv('MYSQL_DB', 'bookdb'), help = 'MySQL database')
+parser.add_argument('--requests', type = int, default = 5000, help = 'validations per mode')
+
+arguments = parser.parse_args()
+connection = MySQLdb.connect(host = arguments.host, port = arguments.port, user = arguments.user, passwd = arguments.password, db = arguments.database)
+cursor = connection.cursor()
+store = SessionStore()
+email = 'benchmark-{}@example.com'.format(uuid.uuid4().hex[:8])
+token = str(uuid.uuid4())
+
+store.create(cursor, email, token)
+connection.commit()
+store.remember(email, token)
+
+def measure(cached: bool) -> numpy.ndarray:
+    samples = []
+
+    for _ in range(arguments.requests):
+        if not cached:
+            store.local.clear()
+
+        start = time.perf_counter()
+        assert store.validate(cursor, email, token)
+        samples.append(time.perf_counter() - start)
+
+    return numpy.array(samples) * 1000
+
+for name, cached in [ ('database', False), ('cached', True) ]:
+    samples = measure(cached)
+    print('{:<10} p50={:.3f}ms p99={:.3f}ms mean={:.3f}ms'.format(name, numpy.percentile(samples, 50), numpy.percentile(samples, 99), samples.mean()))
+
+print('cache statistics: {}'.format(store.stats()))
+
+store.revoke(cursor, email, token)
+connection.commit()
+cursor.close()
+connection.close()
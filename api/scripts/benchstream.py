@@ -0,0 +1,47 @@
+import argparse
+import statistics
+import time
+import urllib.parse
+import urllib.request
+
+parser = argparse.ArgumentParser(
+    prog = 'benchstream',
+    usage = 'measure time to first token of the AI endpoints',
+    description = 'compare time to first byte and total time of /ai/recommendation with and without stream=1, run the server with AI_BACKEND=fake for reproducible numbers'
+)
+parser.add_argument('--url', type = str, default = 'http://localhost:8000', help = 'base URL of the running API')
+parser.add_argument('--book', type = int, default = 1, help = 'book id to ask about')
+parser.add_argument('--requests', type = int, default = 20, help = 'number of requests per mode')
+
+arguments = parser.parse_args()
+
+def measure(stream: bool, index: int) -> tuple[float, float]:
+    # a distinct description per request keeps single-flight from sharing completions between iterations
+    query = urllib.parse.urlencode({ 'description': 'benchmark reader {}'.format(index), 'stream': 1 if stream else 0 })
+    start = time.perf_counter()
+    first = None
+
+    with urllib.request.urlopen('{}/ai/recommendation/{}?{}'.format(arguments.url, arguments.book, query)) as response:
+        while True:
+            line = response.readline()
+
+            if not line:
+                break
+
+            if first is None and (not stream or line.startswith(b'event: token')):
+                first = time.perf_counter() - start
+
+    return first, time.perf_counter() - start
+
+for stream in [ False, True ]:
+    samples = [ measure(stream, index) for index in range(arguments.requests) ]
+    first = sorted(sample[0] for sample in samples)
+    total = sorted(sample[1] for sample in samples)
+
+    print('{:<10} first byte p50={:.1f}ms p99={:.1f}ms  total p50={:.1f}ms p99={:.1f}ms'.format(
+        'stream' if stream else 'json',
+        statistics.median(first) * 1000,
+        first[min(len(first) - 1, int(len(first) * 0.99))] * 1000,
+        statistics.median(total) * 1000,
+        total[min(len(total) - 1, int(len(total) * 0.99))] * 1000
+    ))
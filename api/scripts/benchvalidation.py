@@ -0,0 +1,88 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from api.validation import FIELDS, check, check_columns
+
+parser = argparse.ArgumentParser(
+    prog = 'benchvalidation',
+    usage = 'measure book validation throughput',
+    description = 'validate the same synthetic rows, a share of them invalid, one row at a time with check and a column at a time with check_columns, '
+        'report rows per second for each and fail when both do not answer the same codes and books'
+)
+parser.add_argument('--rows', type = int, default = 1000000, help = 'rows validated')
+parser.add_argument('--batch', type = int, default = 10000, help = 'rows per check_columns call, the batch size of an import')
+parser.add_argument('--invalid', type = float, default = 0.05, help = 'share of rows breaking one of the rules')
+parser.add_argument('--seed', type = int, default = 0, help = 'random seed of the rows')
+
+arguments = parser.parse_args()
+
+# one broken field per invalid row, spread over every rule
+BROKEN = [
+    ('title', None),
+    ('publication_year', '19x4'),
+    ('publication_year', '99999999999'),
+    ('price', '12,50'),
+    ('price', '1' * 400),
+    ('currency', 'GBP')
+]
+
+def rows(count: int) -> list[dict]:
+    rng = random.Random(arguments.seed)
+    spellings = [ 'USD', 'EUR', ' usd ', 'eur', '$', '€' ]
+    generated = []
+
+    for index in range(count):
+        row = {
+            'title': ' Title {} '.format(index),
+            'author': 'Author {}'.format(rng.randrange(count // 10 + 1)),
+            'publication_year': str(rng.randint(1800, 2025)),
+            'price': '{:.2f}'.format(rng.uniform(1, 100)),
+            'currency': rng.choice(spellings),
+            'genre': rng.choice([ 'Fiction', 'History', 'Science', None ])
+        }
+
+        if rng.random() < arguments.invalid:
+            field, value = rng.choice(BROKEN)
+            row[field] = value
+
+        generated.append(row)
+
+    return generated
+
+def timed(name: str, action):
+    start = time.perf_counter()
+    result = action()
+    elapsed = time.perf_counter() - start
+
+    print('{:<7} {:>9} rows in {:>7.2f}s  {:>10.0f} rows/s'.format(name, arguments.rows, elapsed, arguments.rows / elapsed))
+
+    return result
+
+def single(data: list[dict]) -> list[tuple]:
+    return [ check(row['title'], row['author'], row['publication_year'], row['price'], row['currency'], row['genre']) for row in data ]
+
+def batched(data: list[dict]) -> list[tuple]:
+    results = []
+
+    for start in range(0, len(data), arguments.batch):
+        chunk = data[start:start + arguments.batch]
+        codes, books = check_columns({ field: [ row[field] for row in chunk ] for field in FIELDS })
+        results.extend(zip(codes, books))
+
+    return results
+
+data = rows(arguments.rows)
+expected = timed('single', lambda: single(data))
+answered = timed('batch', lambda: batched(data))
+rejected = sum(1 for code, _ in expected if code is not None)
+
+print('{} rows rejected'.format(rejected))
+
+if answered != expected:
+    print('check and check_columns disagree', file = sys.stderr)
+    sys.exit(1)
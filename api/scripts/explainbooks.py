@@ -0,0 +1,67 @@
+import argparse
+import os
+import sys
+import MySQLdb
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from api.search import build_books_query
+
+# common /books/show filters which must be answered from an index, never from a full scan of books
+CASES = [
+    ('title prefix', dict(title = 'harry', mode = 'prefix')),
+    ('author prefix', dict(author = 'stephen', mode = 'prefix')),
+    ('genre prefix', dict(genre = 'fantasy', mode = 'prefix')),
+    ('title full-text', dict(title = 'potter', mode = 'fulltext')),
+    ('author full-text', dict(author = 'king', mode = 'fulltext')),
+    ('publication year', dict(publication_year = 2023)),
+    ('price', dict(price = 18)),
+    ('currency', dict(currency = 'usd')),
+    ('sorted by title', dict(sortby = 'title', limit = 20)),
+    ('sorted by price', dict(sortby = 'price', reverse = True, limit = 20)),
+    ('title prefix sorted by title', dict(title = 'the', mode = 'prefix', sortby = 'title', limit = 20)),
+    ('sorted by rating', dict(sortby = 'rating', reverse = True, limit = 20)),
+    ('minimum rating', dict(min_rating = 4.5))
+]
+
+parser = argparse.ArgumentParser(
+    prog = 'explainbooks',
+    usage = 'check the query plans of /books/show',
+    description = 'run EXPLAIN on the common /books/show filters and fail if any of them needs a full scan of the books table'
+)
+parser.add_argument('--host', type = str, default = os.getenv('MYSQL_HOST', 'localhost'), help = 'MySQL host of the primary')
+parser.add_argument('--port', type = int, default = int(os.getenv('MYSQL_PORT', 3306)), help = 'MySQL port of the primary')
+parser.add_argument('--user', type = str, default = os.getenv('MYSQL_USER', 'root'), help = 'MySQL user')
+parser.add_argument('--password', type = str, default = os.getenv('MYSQL_PASSWORD', ''), help = 'MySQL password')
+parser.add_argument('--database', type = str, default = os.getenv('MYSQL_DB', 'bookdb'), help = 'MySQL database')
+
+arguments = parser.parse_args()
+connection = MySQLdb.connect(host = arguments.host, port = arguments.port, user = arguments.user, passwd = arguments.password, db = arguments.database)
+cursor = connection.cursor()
+
+# fresh statistics, on a tiny catalog the optimizer may still prefer a scan because it is cheaper
+cursor.execute('ANALYZE TABLE books, book_stats;')
+cursor.fetchall()
+
+failures = 0
+
+for name, filters in CASES:
+    command, params = build_books_query(**filters)
+    cursor.execute('EXPLAIN {}'.format(command), params)
+    columns = [ column[0] for column in cursor.description ]
+    plans = [ dict(zip(columns, row)) for row in cursor.fetchall() ]
+    scans = [ plan for plan in plans if plan['table'] in [ 'books', 'book_stats' ] and plan['type'] == 'ALL' ]
+
+    print('{:<32} {:<8} type={:<10} key={}'.format(
+        name,
+        'FAIL' if scans else 'ok',
+        ','.join(str(plan['type']) for plan in plans),
+        ','.join(str(plan['key']) for plan in plans)
+    ))
+
+    failures += 1 if scans else 0
+
+cursor.close()
+connection.close()
+
+sys.exit(1 if failures > 0 else 0)
@@ -0,0 +1,60 @@
+import argparse
+import csv
+import os
+import shutil
+import sys
+import MySQLdb
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from api.imports import FIELDS, import_books, read_books
+from api.recommendations import RecommendationStore
+
+parser = argparse.ArgumentParser(
+    prog = 'importbooks',
+    usage = 'import a catalog feed into an existing database',
+    description = 'stream a CSV file with (title, author, publication_year, price, currency, genre, description) columns into the books table, inserting new books and updating the ones with the same title and author'
+)
+parser.add_argument('datafile', type = str, help = 'CSV file with book entries to import')
+# the defaults are those of the API and of initdb
+parser.add_argument('--host', type = str, default = os.getenv('MYSQL_HOST', 'localhost'), help = 'MySQL host of the primary')
+parser.add_argument('--port', type = int, default = int(os.getenv('MYSQL_PORT', 3306)), help = 'MySQL port of the primary')
+parser.add_argument('--user', type = str, default = os.getenv('MYSQL_USER', 'root'), help = 'MySQL user')
+parser.add_argument('--password', type = str, default = os.getenv('MYSQL_PASSWORD', ''), help = 'MySQL password')
+parser.add_argument('--database', type = str, default = os.getenv('MYSQL_DB', 'bookdb'), help = 'MySQL database')
+parser.add_argument('--batch', type = int, default = 1000, help = 'rows per multi-row statement and per transaction')
+parser.add_argument('--rejects', type = str, default = None, help = 'CSV file receiving the rows that failed validation, with their line, error code and message')
+parser.add_argument('--embeddings', type = str, default = os.getenv('EMBEDDINGS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'embeddings')), help = 'semantic search index to discard, the API rebuilds it from the new catalog')
+
+arguments = parser.parse_args()
+connection = MySQLdb.connect(host = arguments.host, port = arguments.port, user = arguments.user, passwd = arguments.password, db = arguments.database, charset = 'utf8mb4')
+rejects = open(arguments.rejects, 'w', newline = '', encoding = 'utf-8') if arguments.rejects is not None else None
+writer = None
+
+if rejects is not None:
+    writer = csv.writer(rejects)
+    writer.writerow([ 'line', 'code', 'error', *FIELDS ])
+
+def rejected(line: int, row: dict, code: str, error: str):
+    if writer is not None:
+        writer.writerow([ line, code, error, *[ row[field] for field in FIELDS ] ])
+
+try:
+    with open(arguments.datafile, 'r', newline = '', encoding = 'utf-8') as file:
+        statistics = import_books(connection, read_books(file), batch = arguments.batch, rejected = rejected, recommendations = RecommendationStore())
+finally:
+    connection.close()
+
+    if rejects is not None:
+        rejects.close()
+
+shutil.rmtree(arguments.embeddings, ignore_errors = True)
+
+print('read {} rows, wrote {} in {} batches, rejected {} in {:.2f}s ({:.0f} rows/s)'.format(
+    statistics['read'],
+    statistics['written'],
+    statistics['batches'],
+    statistics['rejected'],
+    statistics['seconds'],
+    statistics['rows_per_second']
+))
@@ -1,7 +1,12 @@
 import argparse
-from flask import Flask
-from flask_mysqldb import MySQL
-import pandas
+import os
+import shutil
+import sys
+import MySQLdb
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from api.imports import import_books, read_books
 
 parser = argparse.ArgumentParser(
     prog = 'initdb', 
@@ -9,20 +14,27 @@ parser = argparse.ArgumentParser(
     description = 'use a CSV file with (title, author, publication_year, price, currency, genre) schema to create and populate the SQL database'
 )
 parser.add_argument('datafile', type = str, help = 'CSV file with book entries to populate the database')
+# the defaults are those of the API, so that both reach the same primary
+parser.add_argument('--host', type = str, default = os.getenv('MYSQL_HOST', 'localhost'), help = 'MySQL host of the primary')
+parser.add_argument('--port', type = int, default = int(os.getenv('MYSQL_PORT', 3306)), help = 'MySQL port of the primary')
+parser.add_argument('--user', type = str, default = os.getenv('MYSQL_USER', 'root'), help = 'MySQL user')
+parser.add_argument('--password', type = str, default = os.getenv('MYSQL_PASSWORD', ''), help = 'MySQL password')
+parser.add_argument('--database', type = str, default = os.getenv('MYSQL_DB', 'bookdb'), help = 'MySQL database')
+parser.add_argument('--embeddings', type = str, default = os.getenv('EMBEDDINGS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'embeddings')), help = 'semantic search index to discard, the API rebuilds it from the new catalog')
 
 arguments = parser.parse_args()
-dataset = pandas.read_csv(arguments.datafile)
-api = Flask(__name__)
-
-api.config['MYSQL_HOST'] = 'localhost'
-api.config['MYSQL_USER'] = 'root'
-api.config['MYSQL_PASSWORD'] = ''
-api.config['MYSQL_DB'] = 'bookdb'
-
-with api.app_context():
-    db = MySQL(api)
+# a plain connection, the Flask application and its extensions are not needed to load a file
+connection = MySQLdb.connect(
+    host = arguments.host,
+    port = arguments.port,
+    user = arguments.user,
+    passwd = arguments.password,
+    db = arguments.database,
+    charset = 'utf8mb4'
+)
 
-    cursor = db.connection.cursor()
+try:
+    cursor = connection.cursor()
 
     cursor.execute('DROP TABLE IF EXISTS books;')
 
@@ -32,6 +44,14 @@ with api.app_context():
 
     cursor.execute('DROP TABLE IF EXISTS reviews;')
 
+    cursor.execute('DROP TABLE IF EXISTS summaries;')
+
+    cursor.execute('DROP TABLE IF EXISTS recommendations;')
+
+    cursor.execute('DROP TABLE IF EXISTS versions;')
+
+    cursor.execute('DROP TABLE IF EXISTS book_stats;')
+
     cursor.execute('''CREATE TABLE books(
         id INT AUTO_INCREMENT, 
         title VARCHAR(255),
@@ -40,7 +60,20 @@ with api.app_context():
         price FLOAT,
         currency VARCHAR(16),
         genre VARCHAR(255),
-        PRIMARY KEY (id)
+        description TEXT,
+        title_lc VARCHAR(255) AS (LOWER(TRIM(title))) STORED,
+        author_lc VARCHAR(255) AS (LOWER(TRIM(author))) STORED,
+        genre_lc VARCHAR(255) AS (LOWER(TRIM(COALESCE(genre, '')))) STORED NOT NULL,
+        currency_lc VARCHAR(16) AS (LOWER(TRIM(COALESCE(currency, '')))) STORED NOT NULL,
+        PRIMARY KEY (id),
+        UNIQUE INDEX books_title_author (title_lc, author_lc),
+        INDEX books_title (title_lc),
+        INDEX books_author (author_lc),
+        INDEX books_genre (genre_lc),
+        INDEX books_currency (currency_lc),
+        INDEX books_publication_year (publication_year),
+        INDEX books_price (price),
+        FULLTEXT INDEX books_fulltext (title, author, genre)
     );''')
 
     cursor.execute('''CREATE TABLE users(
@@ -49,11 +82,14 @@ with api.app_context():
         PRIMARY KEY (email)
     );''')
 
+    # tokens are stored as the 16 raw bytes of the uuid, clients still see its textual form
     cursor.execute('''CREATE TABLE sessions(
         email VARCHAR(255),
-        token VARCHAR(255),
+        token BINARY(16),
         creation_timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-        PRIMARY KEY (email, token)
+        PRIMARY KEY (email, token),
+        INDEX sessions_user_creation (email, creation_timestamp),
+        INDEX sessions_creation (creation_timestamp)
     );''')
 
     cursor.execute('''CREATE TABLE reviews(
@@ -62,19 +98,59 @@ with api.app_context():
         n_stars INT,
         content VARCHAR(255),
         creation_timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-        PRIMARY KEY (email, bookid)
+        PRIMARY KEY (email, bookid),
+        INDEX reviews_book_timestamp (bookid, creation_timestamp)
+    );''')
+
+    cursor.execute('''CREATE TABLE summaries(
+        bookid INT,
+        prompt_hash CHAR(64),
+        model VARCHAR(64),
+        content TEXT,
+        creation_timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (bookid, prompt_hash)
+    );''')
+
+    cursor.execute('''CREATE TABLE recommendations(
+        profile_key CHAR(64),
+        bookid INT,
+        score TINYINT UNSIGNED,
+        rationale VARCHAR(512),
+        creation_timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (profile_key, bookid),
+        INDEX recommendations_book (bookid),
+        INDEX recommendations_profile_score (profile_key, score)
+    );''')
+
+    # review aggregates maintained with each review, the average is stored so that it can be indexed
+    cursor.execute('''CREATE TABLE book_stats(
+        bookid INT,
+        review_count INT UNSIGNED NOT NULL DEFAULT 0,
+        stars_total INT UNSIGNED NOT NULL DEFAULT 0,
+        stars_0 INT UNSIGNED NOT NULL DEFAULT 0,
+        stars_1 INT UNSIGNED NOT NULL DEFAULT 0,
+        stars_2 INT UNSIGNED NOT NULL DEFAULT 0,
+        stars_3 INT UNSIGNED NOT NULL DEFAULT 0,
+        stars_4 INT UNSIGNED NOT NULL DEFAULT 0,
+        stars_5 INT UNSIGNED NOT NULL DEFAULT 0,
+        last_review TIMESTAMP NULL DEFAULT NULL,
+        rating DOUBLE AS (IF(review_count > 0, stars_total / review_count, 0)) STORED,
+        PRIMARY KEY (bookid),
+        INDEX book_stats_rating (rating, bookid)
+    );''')
+
+    cursor.execute('''CREATE TABLE versions(
+        name VARCHAR(64),
+        version BIGINT UNSIGNED NOT NULL,
+        modified TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (name)
     );''')
 
-    for index, item in dataset.iterrows():
-        cursor.execute('INSERT INTO books (title, author, publication_year, price, currency, genre) VALUES(\"{}\", \"{}\", \"{}\", \"{}\", \"{}\", \"{}\");'.format(
-            item.title,
-            item.author,
-            item.publication_year,
-            item.price,
-            item.currency,
-            item.genre
-        ))
-
-    db.connection.commit()
-    
-    cursor.close()
\ No newline at end of file
+    cursor.close()
+
+    with open(arguments.datafile, 'r', newline = '', encoding = 'utf-8') as file:
+        import_books(connection, read_books(file))
+finally:
+    connection.close()
+
+shutil.rmtree(arguments.embeddings, ignore_errors = True)
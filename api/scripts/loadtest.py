@@ -0,0 +1,448 @@
+import argparse
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+import MySQLdb
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from api import bookstats
+from api.imports import FIELDS
+from api.passwords import PasswordHasher
+from api.queries import executemany
+from api.sessions import token_bytes
+from api.utilities import CURRENCIES
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+GENRES = [ 'Fantasy', 'Science Fiction', 'Mystery', 'Romance', 'Horror', 'History', 'Biography', 'Poetry', 'Thriller', 'Philosophy' ]
+WORDS = [ 'river', 'shadow', 'garden', 'empire', 'letter', 'winter', 'machine', 'island', 'silence', 'crown', 'harbor', 'mirror', 'forest', 'storm', 'ember', 'orbit' ]
+SORTABLE = [ 'title', 'author', 'publication_year', 'price', 'rating' ]
+PASSWORD = 'loadtest-password'
+
+parser = argparse.ArgumentParser(
+    prog = 'loadtest',
+    usage = 'seed a synthetic catalog and drive mixed workloads against the API',
+    description = 'seed recreates the schema with initdb and fills it with a deterministic catalog, reviews, users and sessions; '
+        'run drives a workload at fixed concurrency, reports throughput and p50/p95/p99 per route as JSON and fails on routes with errors or on regressions against a baseline'
+)
+parser.add_argument('--host', type = str, default = os.getenv('MYSQL_HOST', 'localhost'), help = 'MySQL host of the primary')
+parser.add_argument('--port', type = int, default = int(os.getenv('MYSQL_PORT', 3306)), help = 'MySQL port of the primary')
+parser.add_argument('--user', type = str, default = os.getenv('MYSQL_USER', 'root'), help = 'MySQL user')
+parser.add_argument('--password', type = str, default = os.getenv('MYSQL_PASSWORD', ''), help = 'MySQL password')
+parser.add_argument('--database', type = str, default = os.getenv('MYSQL_DB', 'bookdb'), help = 'MySQL database')
+parser.add_argument('--manifest', type = str, default = os.path.join(ROOT, 'data', 'loadtest.json'), help = 'users and sessions written by seed and read by run')
+commands = parser.add_subparsers(dest = 'command', required = True)
+
+seed_parser = commands.add_parser('seed', help = 'recreate the schema and generate the catalog')
+seed_parser.add_argument('--books', type = int, default = 10000, help = 'books in the catalog, from 1k to 1M')
+seed_parser.add_argument('--reviews', type = float, default = 3.0, help = 'average reviews per book')
+seed_parser.add_argument('--users', type = int, default = 1000, help = 'users with an open session, used by the workloads')
+seed_parser.add_argument('--batch', type = int, default = 5000, help = 'rows per multi-row insert and per transaction')
+seed_parser.add_argument('--seed', type = int, default = 42, help = 'random seed, the same seed always generates the same data')
+
+run_parser = commands.add_parser('run', help = 'drive a workload and report latencies')
+run_parser.add_argument('workload', type = str, choices = [ 'browse', 'review', 'ai' ], help = 'mix of routes to drive')
+run_parser.add_argument('--url', type = str, default = 'http://localhost:8000', help = 'base URL of the API')
+run_parser.add_argument('--serve', action = 'store_true', help = 'start run.py with the fake AI backend for the duration of the run')
+run_parser.add_argument('--ai-latency', type = float, default = 0.3, help = 'seconds before the first token of the fake AI backend, with --serve')
+run_parser.add_argument('--ai-chunk-interval', type = float, default = 0.02, help = 'seconds between streamed chunks of the fake AI backend, with --serve')
+run_parser.add_argument('--concurrency', type = int, default = 8, help = 'clients sending requests back to back')
+run_parser.add_argument('--duration', type = float, default = 30.0, help = 'measured seconds')
+run_parser.add_argument('--warmup', type = float, default = 5.0, help = 'seconds of unmeasured requests first, which also build the caches and the search index')
+run_parser.add_argument('--seed', type = int, default = 42, help = 'random seed of the request mix')
+run_parser.add_argument('--output', type = str, default = None, help = 'file to write the JSON report to, standard output otherwise')
+run_parser.add_argument('--baseline', type = str, default = None, help = 'report of a previous run to compare against')
+run_parser.add_argument('--save-baseline', action = 'store_true', help = 'write this report to --baseline instead of comparing')
+run_parser.add_argument('--tolerance', type = float, default = 0.2, help = 'relative slowdown of a p95 or of the throughput counted as a regression')
+run_parser.add_argument('--max-error-rate', type = float, default = 0.01, help = 'share of failed requests allowed on any route, with or without a baseline')
+run_parser.add_argument('--slack', type = float, default = 0.002, help = 'seconds added to every baseline p95, so that sub-millisecond noise is not a regression')
+
+arguments = parser.parse_args()
+
+def connect():
+    return MySQLdb.connect(host = arguments.host, port = arguments.port, user = arguments.user, passwd = arguments.password, db = arguments.database, charset = 'utf8mb4')
+
+def batches(rows, size: int):
+    iterator = iter(rows)
+
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+def generate_books(rng: random.Random, count: int):
+    authors = max(count // 10, 1)
+
+    for index in range(count):
+        words = rng.sample(WORDS, 2)
+
+        yield (
+            'Book {} {} {}'.format(index, *words).title(),
+            'Author {}'.format(rng.randrange(authors)),
+            rng.randint(1900, 2024),
+            round(rng.uniform(2, 80), 2),
+            rng.choice(CURRENCIES),
+            rng.choice(GENRES),
+            'A story of the {} and the {}.'.format(*words)
+        )
+
+def generate_reviews(rng: random.Random, books: int, average: float):
+    # reviewers are distinct from the workload users, so that the review workload never collides with seeded rows
+    reviewers = max(int(average * 4), 1)
+
+    for bookid in range(1, books + 1):
+        for reviewer in rng.sample(range(reviewers), min(reviewers, int(rng.expovariate(1 / average)) if average > 0 else 0)):
+            yield ('reviewer{}@loadtest.local'.format(reviewer), bookid, rng.randint(0, 5), 'Review of book {} by reviewer {}'.format(bookid, reviewer))
+
+def timed(name: str, action):
+    start = time.perf_counter()
+    count = action()
+
+    print('{:<9} {:>9} rows in {:>7.2f}s'.format(name, count, time.perf_counter() - start), file = sys.stderr)
+
+def insert(connection, name: str, rows) -> int:
+    cursor = connection.cursor()
+    count = 0
+
+    for chunk in batches(rows, arguments.batch):
+        executemany(cursor, name, chunk)
+        connection.commit()
+        count += len(chunk)
+
+    cursor.close()
+
+    return count
+
+def seed():
+    # the schema always comes from initdb, started on an empty catalog
+    with tempfile.NamedTemporaryFile('w', suffix = '.csv', delete = False) as file:
+        file.write(','.join(FIELDS) + '\n')
+
+    try:
+        subprocess.run([
+            sys.executable, os.path.join(ROOT, 'scripts', 'initdb.py'), file.name,
+            '--host', arguments.host, '--port', str(arguments.port), '--user', arguments.user, '--password', arguments.password, '--database', arguments.database
+        ], check = True)
+    finally:
+        os.remove(file.name)
+
+    rng = random.Random(arguments.seed)
+    connection = connect()
+    # every user shares one cheap hash, the signins of the workloads measure the API and not the key derivation
+    password = PasswordHasher(workers = 0).hash(PASSWORD)
+    users = [ ('user{}@loadtest.local'.format(index), str(uuid.UUID(int = rng.getrandbits(128), version = 4))) for index in range(arguments.users) ]
+
+    timed('books', lambda: insert(connection, 'insert_book', generate_books(rng, arguments.books)))
+    timed('reviews', lambda: insert(connection, 'insert_review', generate_reviews(rng, arguments.books, arguments.reviews)))
+    timed('users', lambda: insert(connection, 'insert_user', ((email, password) for email, _ in users)))
+    timed('sessions', lambda: insert(connection, 'insert_session', ((email, token_bytes(token)) for email, token in users)))
+    timed('stats', lambda: bookstats.rebuild(connection)['ids'])
+
+    connection.close()
+
+    os.makedirs(os.path.dirname(arguments.manifest), exist_ok = True)
+
+    with open(arguments.manifest, 'w') as file:
+        json.dump({ 'books': arguments.books, 'reviews': arguments.reviews, 'seed': arguments.seed, 'password': PASSWORD, 'sessions': users }, file)
+
+class Client:
+    # one per concurrent client, with its own random stream and pagination state
+    def __init__(self, manifest: dict, rng: random.Random, reviews):
+        self.manifest = manifest
+        self.rng = rng
+        self.reviews = reviews
+        self.page = None
+
+    def book(self) -> int:
+        return self.rng.randint(1, self.manifest['books'])
+
+    def session(self) -> tuple[str, str]:
+        return tuple(self.rng.choice(self.manifest['sessions']))
+
+    def show(self):
+        query = { 'count': 20, 'sortby': self.rng.choice(SORTABLE), 'reverse': self.rng.randint(0, 1) }
+
+        return 'GET /books/show', 'GET', '/books/show', query
+
+    def show_prefix(self):
+        return 'GET /books/show?title', 'GET', '/books/show', { 'title': 'Book {}'.format(self.rng.randrange(1000)), 'mode': 'prefix', 'count': 20 }
+
+    def show_next(self):
+        if self.page is None:
+            return self.show()
+
+        query, token = self.page
+
+        return 'GET /books/show?page_token', 'GET', '/books/show', dict(query, page_token = token)
+
+    def search(self):
+        return 'GET /books/search', 'GET', '/books/search', { 'q': ' '.join(self.rng.sample(WORDS, 2)), 'count': 10 }
+
+    def similar(self):
+        return 'GET /books/similar/<id>', 'GET', '/books/similar/{}'.format(self.book()), { 'count': 10 }
+
+    def getreviews(self):
+        return 'GET /books/getreviews/<id>', 'GET', '/books/getreviews/{}'.format(self.book()), { 'count': 20 }
+
+    def stats(self):
+        return 'GET /books/stats/<id>', 'GET', '/books/stats/{}'.format(self.book()), {}
+
+    def review(self):
+        # every (user, book) pair is used at most once per run, the previous run's reviews are removed beforehand
+        sequence = next(self.reviews)
+        sessions = self.manifest['sessions']
+        email, token = sessions[sequence % len(sessions)]
+        bookid = 1 + (sequence // len(sessions)) % self.manifest['books']
+        query = { 'email': email, 'token': token, 'n_stars': self.rng.randint(0, 5), 'content': 'Load test review {}'.format(sequence) }
+
+        return 'POST /books/review/<id>', 'POST', '/books/review/{}'.format(bookid), query
+
+    def getreviewedbooks(self):
+        email, token = self.session()
+
+        return 'POST /books/getreviewedbooks/<email>', 'POST', '/books/getreviewedbooks/{}'.format(urllib.parse.quote(email)), { 'token': token }
+
+    def signin(self):
+        email, _ = self.session()
+
+        return 'POST /auth/signin', 'POST', '/auth/signin', { 'email': email, 'password': self.manifest['password'] }
+
+    def summary(self):
+        return 'GET /ai/summary/<id>', 'GET', '/ai/summary/{}'.format(self.book()), {}
+
+    def features(self) -> dict:
+        return { 'description': 'I enjoy {} about {}'.format(self.rng.choice(GENRES).lower(), self.rng.choice(WORDS)), 'age': self.rng.randint(16, 80) }
+
+    def recommendation(self):
+        return 'GET /ai/recommendation/<id>', 'GET', '/ai/recommendation/{}'.format(self.book()), self.features()
+
+    def rank(self):
+        return 'GET /ai/recommendation/rank', 'GET', '/ai/recommendation/rank', dict(self.features(), count = 10)
+
+# relative weights of each request in the mixes
+WORKLOADS = {
+    'browse': [ (40, Client.show), (10, Client.show_prefix), (10, Client.show_next), (20, Client.getreviews), (10, Client.stats), (5, Client.search), (5, Client.similar) ],
+    'review': [ (35, Client.review), (25, Client.getreviews), (10, Client.stats), (10, Client.getreviewedbooks), (15, Client.show), (5, Client.signin) ],
+    'ai': [ (40, Client.summary), (25, Client.recommendation), (10, Client.rank), (15, Client.show), (10, Client.getreviews) ]
+}
+
+def send(method: str, path: str, query: dict) -> tuple[int, dict]:
+    url = '{}{}{}'.format(arguments.url, path, '?' + urllib.parse.urlencode(query) if query else '')
+    request = urllib.request.Request(url, data = b'' if method == 'POST' else None, method = method)
+
+    try:
+        with urllib.request.urlopen(request, timeout = 60) as response:
+            response.read()
+            return response.status, dict(response.headers)
+    except urllib.error.HTTPError as error:
+        error.read()
+        return error.code, dict(error.headers)
+
+def drive(client: Client, deadline: float, start: float, samples: dict, lock: threading.Lock):
+    actions, weights = zip(*[ (action, weight) for weight, action in WORKLOADS[arguments.workload] ])
+
+    while time.perf_counter() < deadline:
+        route, method, path, query = client.rng.choices(actions, weights)[0](client)
+        began = time.perf_counter()
+
+        try:
+            status, headers = send(method, path, query)
+        except Exception:
+            status, headers = 0, {}
+
+        elapsed = time.perf_counter() - began
+
+        if route.startswith('GET /books/show'):
+            # the next show_next of this client continues from the page it has just read
+            token = headers.get('X-Next-Page-Token')
+            client.page = ({ name: value for name, value in query.items() if name != 'page_token' }, token) if token else None
+
+        if began >= start:
+            with lock:
+                entry = samples.setdefault(route, { 'latencies': [], 'errors': 0 })
+                entry['latencies'].append(elapsed)
+                entry['errors'] += 1 if status < 200 or status >= 400 else 0
+
+def wait_ready(process: subprocess.Popen, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit('the API exited with status {}'.format(process.returncode))
+
+        try:
+            send('GET', '/metrics', {})
+            return
+        except OSError:
+            time.sleep(0.5)
+
+    raise SystemExit('the API did not answer within {:.0f}s'.format(timeout))
+
+def serve() -> subprocess.Popen:
+    environment = dict(
+        os.environ,
+        MYSQL_HOST = arguments.host,
+        MYSQL_PORT = str(arguments.port),
+        MYSQL_USER = arguments.user,
+        MYSQL_PASSWORD = arguments.password,
+        MYSQL_DB = arguments.database,
+        AI_BACKEND = 'fake',
+        FAKE_AI_FIRST_TOKEN_LATENCY = str(arguments.ai_latency),
+        FAKE_AI_CHUNK_INTERVAL = str(arguments.ai_chunk_interval),
+        # every client shares one address, the signin limits would otherwise answer 429
+        LOGIN_ATTEMPTS = os.environ.get('LOGIN_ATTEMPTS', '1000000'),
+        LOGIN_ADDRESS_ATTEMPTS = os.environ.get('LOGIN_ADDRESS_ATTEMPTS', '1000000')
+    )
+    process = subprocess.Popen([ sys.executable, 'run.py' ], cwd = ROOT, env = environment, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+
+    try:
+        wait_ready(process)
+    except BaseException:
+        process.terminate()
+        raise
+
+    return process
+
+def report(samples: dict, elapsed: float, manifest: dict) -> dict:
+    routes = {}
+
+    for route, entry in sorted(samples.items()):
+        latencies = numpy.array(entry['latencies'])
+        p50, p95, p99 = numpy.percentile(latencies, [ 50, 95, 99 ])
+
+        routes[route] = {
+            'requests': len(latencies),
+            'errors': entry['errors'],
+            'throughput': len(latencies) / elapsed,
+            'p50': p50,
+            'p95': p95,
+            'p99': p99
+        }
+
+    requests = sum(route['requests'] for route in routes.values())
+
+    return {
+        'workload': arguments.workload,
+        'concurrency': arguments.concurrency,
+        'duration': elapsed,
+        'books': manifest['books'],
+        'ai_latency': arguments.ai_latency if arguments.serve else None,
+        'requests': requests,
+        'errors': sum(route['errors'] for route in routes.values()),
+        'throughput': requests / elapsed,
+        'routes': routes
+    }
+
+def failures(current: dict) -> list[str]:
+    # a baseline recorded while a route was failing would hide it from regressions()
+    return [
+        '{} {} errors in {} requests'.format(route, entry['errors'], entry['requests'])
+        for route, entry in current['routes'].items()
+        if entry['errors'] > entry['requests'] * arguments.max_error_rate
+    ]
+
+def regressions(current: dict, baseline: dict) -> list[str]:
+    found = []
+
+    if baseline.get('workload') != current['workload'] or baseline.get('concurrency') != current['concurrency'] or baseline.get('books') != current['books']:
+        found.append('the baseline was recorded with another workload, concurrency or catalog size')
+
+    if current['throughput'] < baseline['throughput'] * (1 - arguments.tolerance):
+        found.append('throughput {:.1f} req/s, baseline {:.1f} req/s'.format(current['throughput'], baseline['throughput']))
+
+    for route, entry in current['routes'].items():
+        reference = baseline['routes'].get(route)
+
+        if reference is None:
+            continue
+
+        if entry['p95'] > (reference['p95'] + arguments.slack) * (1 + arguments.tolerance):
+            found.append('{} p95 {:.1f}ms, baseline {:.1f}ms'.format(route, entry['p95'] * 1000, reference['p95'] * 1000))
+
+        if entry['errors'] / entry['requests'] > reference['errors'] / reference['requests'] + 0.01:
+            found.append('{} {} errors in {} requests, baseline {} in {}'.format(route, entry['errors'], entry['requests'], reference['errors'], reference['requests']))
+
+    return found
+
+def run() -> int:
+    with open(arguments.manifest) as file:
+        manifest = json.load(file)
+
+    # reviews left by a previous run would make the review workload collide on (email, bookid)
+    connection = connect()
+    cursor = connection.cursor()
+    cursor.execute('DELETE FROM reviews WHERE email LIKE %s;', ('user%@loadtest.local',))
+    connection.commit()
+    connection.close()
+
+    process = serve() if arguments.serve else None
+    samples = {}
+    lock = threading.Lock()
+    reviews = itertools.count()
+    start = time.perf_counter() + arguments.warmup
+    deadline = start + arguments.duration
+
+    try:
+        threads = [
+            threading.Thread(target = drive, args = (Client(manifest, random.Random(arguments.seed * 1000 + index), reviews), deadline, start, samples, lock))
+            for index in range(arguments.concurrency)
+        ]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    current = report(samples, time.perf_counter() - start, manifest)
+    text = json.dumps(current, indent = 2)
+
+    if arguments.output is not None:
+        with open(arguments.output, 'w') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+
+    failed = failures(current)
+
+    for failure in failed:
+        print('failing: {}'.format(failure), file = sys.stderr)
+
+    if arguments.baseline is None:
+        return 1 if len(failed) > 0 else 0
+
+    if arguments.save_baseline:
+        if len(failed) > 0:
+            print('the baseline was not saved, a failing run cannot be a reference', file = sys.stderr)
+            return 1
+
+        with open(arguments.baseline, 'w') as file:
+            file.write(text + '\n')
+
+        return 0
+
+    with open(arguments.baseline) as file:
+        found = regressions(current, json.load(file))
+
+    for regression in found:
+        print('regression: {}'.format(regression), file = sys.stderr)
+
+    return 1 if len(found) > 0 or len(failed) > 0 else 0
+
+if arguments.command == 'seed':
+    seed()
+else:
+    sys.exit(run())
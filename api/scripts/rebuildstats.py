@@ -0,0 +1,36 @@
+import argparse
+import os
+import sys
+import MySQLdb
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from api.bookstats import rebuild
+
+parser = argparse.ArgumentParser(
+    prog = 'rebuildstats',
+    usage = 'recompute the review statistics of every book',
+    description = 'recompute book_stats (review count, sum of stars, histogram, last review) from the reviews table, one range of book ids per transaction, and remove the statistics of deleted books'
+)
+parser.add_argument('--host', type = str, default = os.getenv('MYSQL_HOST', 'localhost'), help = 'MySQL host of the primary')
+parser.add_argument('--port', type = int, default = int(os.getenv('MYSQL_PORT', 3306)), help = 'MySQL port of the primary')
+parser.add_argument('--user', type = str, default = os.getenv('MYSQL_USER', 'root'), help = 'MySQL user')
+parser.add_argument('--password', type = str, default = os.getenv('MYSQL_PASSWORD', ''), help = 'MySQL password')
+parser.add_argument('--database', type = str, default = os.getenv('MYSQL_DB', 'bookdb'), help = 'MySQL database')
+parser.add_argument('--batch', type = int, default = 10000, help = 'book ids recomputed per transaction')
+parser.add_argument('--pause', type = float, default = 0.0, help = 'seconds to wait between two batches')
+
+arguments = parser.parse_args()
+connection = MySQLdb.connect(host = arguments.host, port = arguments.port, user = arguments.user, passwd = arguments.password, db = arguments.database)
+
+try:
+    statistics = rebuild(connection, arguments.batch, arguments.pause)
+finally:
+    connection.close()
+
+print('recomputed {} book ids in {} batches, removed {} orphaned rows in {:.2f}s'.format(
+    statistics['ids'],
+    statistics['batches'],
+    statistics['orphans'],
+    statistics['seconds']
+))
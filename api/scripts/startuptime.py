@@ -0,0 +1,61 @@
+import argparse
+import collections
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+# what a worker runs before its first request, the database and the AI provider are only reached on first use
+STARTUP = 'from api.routes import create_app; create_app()'
+
+parser = argparse.ArgumentParser(
+    prog = 'startuptime',
+    usage = 'report the cold start time of an API worker',
+    description = 'time fresh interpreters building the application, break the import time down by top level package with -X importtime, '
+        'and fail when the median cold start exceeds the budget'
+)
+parser.add_argument('--runs', type = int, default = 10, help = 'fresh interpreters timed')
+parser.add_argument('--top', type = int, default = 15, help = 'packages listed in the breakdown')
+parser.add_argument('--budget', type = float, default = 0.2, help = 'seconds allowed for the median cold start, zero to only report')
+
+arguments = parser.parse_args()
+
+def cold_start() -> float:
+    start = time.perf_counter()
+    subprocess.run([ sys.executable, '-c', STARTUP ], cwd = ROOT, check = True)
+
+    return time.perf_counter() - start
+
+def breakdown() -> tuple[collections.Counter, float]:
+    # lines are "import time: self [us] | cumulative | imported package", nested imports are indented
+    result = subprocess.run([ sys.executable, '-X', 'importtime', '-c', STARTUP ], cwd = ROOT, check = True, capture_output = True, text = True)
+    packages = collections.Counter()
+    total = 0
+
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+
+        own, _, name = line[len('import time:'):].split('|')
+        package = name.strip().split('.')[0]
+        packages[package] += int(own)
+        total += int(own)
+
+    return packages, total
+
+# the first run also compiles the bytecode of the application, it is not counted
+cold_start()
+samples = sorted(cold_start() for _ in range(arguments.runs))
+median = samples[len(samples) // 2]
+packages, total = breakdown()
+
+print('cold start: median {:.0f}ms, min {:.0f}ms, max {:.0f}ms over {} runs'.format(median * 1000, samples[0] * 1000, samples[-1] * 1000, len(samples)))
+print('imports: {:.0f}ms'.format(total / 1000))
+
+for package, own in packages.most_common(arguments.top):
+    print('  {:<24} {:>7.1f}ms {:>5.1f}%'.format(package, own / 1000, own * 100 / total))
+
+if arguments.budget > 0 and median > arguments.budget:
+    print('over the budget of {:.0f}ms'.format(arguments.budget * 1000), file = sys.stderr)
+    sys.exit(1)
@@ -0,0 +1,111 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from api.fakeai import fake_answer
+
+parser = argparse.ArgumentParser(
+    prog = 'stubai',
+    usage = 'serve a fake Groq chat completion endpoint',
+    description = 'OpenAI compatible stub with injected latency and errors, point the API to it with GROQ_BASE_URL=http://localhost:<port>'
+)
+parser.add_argument('--port', type = int, default = 8100, help = 'port to listen on')
+parser.add_argument('--latency', type = float, default = 0.5, help = 'seconds before the first token')
+parser.add_argument('--jitter', type = float, default = 0.2, help = 'uniform random seconds added to the latency')
+parser.add_argument('--chunk-interval', type = float, default = 0.02, help = 'seconds between streamed chunks')
+parser.add_argument('--words', type = int, default = 64, help = 'words per completion')
+parser.add_argument('--error-rate', type = float, default = 0.0, help = 'probability of answering with an error')
+parser.add_argument('--error-status', type = int, nargs = '+', default = [ 429, 500, 503 ], help = 'statuses drawn for injected errors')
+parser.add_argument('--retry-after', type = float, default = None, help = 'Retry-After seconds sent with 429 answers')
+parser.add_argument('--hang-rate', type = float, default = 0.0, help = 'probability of stalling for 60s to exercise deadlines')
+
+arguments = parser.parse_args()
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def reply(self, status: int, payload: dict, headers: dict = {}):
+        body = json.dumps(payload).encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+
+        for name, value in headers.items():
+            self.send_header(name, value)
+
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+
+        if not self.path.endswith('/chat/completions'):
+            return self.reply(404, { 'error': { 'message': 'Unknown path {}'.format(self.path) } })
+
+        if random.random() < arguments.hang_rate:
+            time.sleep(60)
+
+        if random.random() < arguments.error_rate:
+            status = random.choice(arguments.error_status)
+            headers = { 'Retry-After': str(arguments.retry_after) } if status == 429 and arguments.retry_after is not None else {}
+
+            return self.reply(status, { 'error': { 'message': 'Injected failure', 'type': 'stub' } }, headers)
+
+        time.sleep(arguments.latency + random.uniform(0, arguments.jitter))
+
+        model = request.get('model', 'stub')
+        # the answer is split back into words, so that a JSON answer also streams as valid JSON once joined
+        words = fake_answer(request.get('messages', []), [ 'token{}'.format(index) for index in range(min(arguments.words, request.get('max_tokens', 1024))) ]).split(' ')
+        identifier = 'chatcmpl-{}'.format(uuid.uuid4().hex)
+
+        if not request.get('stream'):
+            return self.reply(200, {
+                'id': identifier,
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [ { 'index': 0, 'message': { 'role': 'assistant', 'content': ' '.join(words) }, 'finish_reason': 'stop' } ],
+                'usage': { 'prompt_tokens': 0, 'completion_tokens': len(words), 'total_tokens': len(words) }
+            })
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+
+        try:
+            for index, word in enumerate(words + [ None ]):
+                chunk = {
+                    'id': identifier,
+                    'object': 'chat.completion.chunk',
+                    'created': int(time.time()),
+                    'model': model,
+                    'choices': [ {
+                        'index': 0,
+                        'delta': { 'content': word if index == 0 or word is None else ' ' + word } if word is not None else {},
+                        'finish_reason': None if word is not None else 'stop'
+                    } ]
+                }
+
+                self.wfile.write('data: {}\n\n'.format(json.dumps(chunk)).encode('utf-8'))
+                self.wfile.flush()
+                time.sleep(arguments.chunk_interval)
+
+            self.wfile.write(b'data: [DONE]\n\n')
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            print('client disconnected after {} chunks'.format(index))
+
+        self.close_connection = True
+
+server = ThreadingHTTPServer(('localhost', arguments.port), Handler)
+print('stub AI provider listening on http://localhost:{}'.format(arguments.port))
+server.serve_forever()
@@ -0,0 +1,32 @@
+import argparse
+import os
+import sys
+import time
+import MySQLdb
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from api.sessions import sweep
+
+parser = argparse.ArgumentParser(
+    prog = 'sweepsessions',
+    usage = 'delete expired sessions',
+    description = 'delete the sessions older than their lifetime in small batches, each committed on its own so that signins are never blocked for long'
+)
+parser.add_argument('--host', type = str, default = os.getenv('MYSQL_HOST', 'localhost'), help = 'MySQL host of the primary')
+parser.add_argument('--port', type = int, default = int(os.getenv('MYSQL_PORT', 3306)), help = 'MySQL port of the primary')
+parser.add_argument('--user', type = str, default = os.getenv('MYSQL_USER', 'root'), help = 'MySQL user')
+parser.add_argument('--password', type = str, default = os.getenv('MYSQL_PASSWORD', ''), help = 'MySQL password')
+parser.add_argument('--database', type = str, default = os.getenv('MYSQL_DB', 'bookdb'), help = 'MySQL database')
+parser.add_argument('--lifetime', type = float, default = float(os.getenv('SESSION_LIFETIME', 7 * 24 * 3600)), help = 'session lifetime in seconds')
+parser.add_argument('--batch', type = int, default = 1000, help = 'sessions deleted per transaction')
+parser.add_argument('--pause', type = float, default = 0.05, help = 'seconds to wait between two batches')
+
+arguments = parser.parse_args()
+connection = MySQLdb.connect(host = arguments.host, port = arguments.port, user = arguments.user, passwd = arguments.password, db = arguments.database)
+start = time.perf_counter()
+removed = sweep(connection, arguments.lifetime, arguments.batch, arguments.pause)
+
+print('removed {} expired sessions in {:.2f}s'.format(removed, time.perf_counter() - start))
+
+connection.close()
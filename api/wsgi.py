@@ -0,0 +1,9 @@
+from dotenv import load_dotenv
+
+load_dotenv('./settings/.env')
+
+from api.routes import create_app
+
+# pre-fork entry point, e.g. gunicorn --preload --workers 4 --bind localhost:8000 wsgi:application: the application
+# is built once in the master, database connections, AI clients and background threads are created by each worker
+application = create_app()